@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Nhật ký cảnh báo dạng JSONL chỉ ghi nối (append-only) - thay cho việc đọc/ghi lại cả mảng JSON
+- Mỗi cảnh báo là 1 dòng JSON, ghi nối O(1), không đụng tới dữ liệu cũ
+- fsync theo nhóm: gom nhiều dòng rồi mới fsync 1 lần (commit) hoặc sau fsync_interval giây
+- Xoay vòng file theo kích thước hoặc theo thời gian (firewall_alerts.jsonl.1, .2, ...)
+- Tự chuyển file mảng JSON cũ (/var/log/firewall_alerts.json) sang định dạng mới
+"""
+
+import json
+import os
+import time
+
+JOURNAL_FILE = '/var/log/firewall_alerts.jsonl'
+LEGACY_FILE = '/var/log/firewall_alerts.json'
+
+TAIL_BLOCK = 64 * 1024
+
+
+class AlertJournal:
+    def __init__(self, path=JOURNAL_FILE, max_bytes=10 * 1024 * 1024, max_age=86400,
+                 backups=5, fsync_every=50, fsync_interval=1.0):
+        self.path = path
+        self.max_bytes = max_bytes          # 0 = không xoay theo kích thước
+        self.max_age = max_age              # giây, 0 = không xoay theo thời gian
+        self.backups = backups
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._f = None
+        self._opened_at = 0
+        self._pending = 0
+        self._last_sync = time.time()
+
+    def _open(self):
+        self._f = open(self.path, 'a', encoding='utf-8')
+        # Tuổi của file = timestamp của dòng đầu tiên (để xoay theo thời gian sau khi restart)
+        self._opened_at = time.time()
+        if self._f.tell():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    first = parse_lines([f.readline()])
+                if first:
+                    self._opened_at = float(first[0].get('timestamp', self._opened_at))
+            except (OSError, ValueError):
+                pass
+
+    def append(self, record):
+        """Ghi nối 1 cảnh báo; fsync khi đủ fsync_every dòng hoặc quá fsync_interval giây"""
+        if self._f is None:
+            self._open()
+        self._f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._f.flush()
+        self._pending += 1
+        if self._pending >= self.fsync_every or time.time() - self._last_sync >= self.fsync_interval:
+            self.commit()
+        self._maybe_rotate()
+
+    def commit(self):
+        """fsync các dòng đang chờ (gọi 1 lần sau mỗi lô chặn/gỡ chặn)"""
+        if self._f is not None and self._pending:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+        self._pending = 0
+        self._last_sync = time.time()
+
+    def _maybe_rotate(self):
+        size = self._f.tell()
+        too_big = self.max_bytes and size >= self.max_bytes
+        too_old = self.max_age and size and time.time() - self._opened_at >= self.max_age
+        if too_big or too_old:
+            self.rotate()
+
+    def rotate(self):
+        self.commit()
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if os.path.exists(self.path):
+            if self.backups > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+        self._open()
+
+    def close(self):
+        self.commit()
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def migrate_legacy(legacy=LEGACY_FILE, path=JOURNAL_FILE):
+    """Chuyển mảng JSON cũ sang JSONL (chỉ chạy 1 lần, file cũ đổi tên thành .migrated)"""
+    if not os.path.exists(legacy):
+        return 0
+    try:
+        with open(legacy, 'r') as f:
+            data = f.read().strip()
+        alerts = json.loads(data) if data else []
+    except ValueError:
+        return 0
+    if isinstance(alerts, dict):
+        alerts = [alerts]
+    if not isinstance(alerts, list):
+        return 0
+    alerts.sort(key=lambda a: a.get('timestamp', 0) if isinstance(a, dict) else 0)
+    # Cảnh báo cũ đặt trước các dòng đã có trong journal
+    existing = ''
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            existing = f.read()
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for a in alerts:
+            if isinstance(a, dict):
+                f.write(json.dumps(a, ensure_ascii=False) + '\n')
+        f.write(existing)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    os.replace(legacy, legacy + '.migrated')
+    return len(alerts)
+
+
+def parse_lines(lines):
+    alerts = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            a = json.loads(line)
+        except ValueError:
+            continue        # Dòng đang ghi dở
+        if isinstance(a, dict):
+            alerts.append(a)
+    return alerts
+
+
+def read_legacy(legacy=LEGACY_FILE):
+    try:
+        with open(legacy, 'r') as f:
+            data = f.read().strip()
+        alerts = json.loads(data) if data else []
+    except (OSError, ValueError):
+        return []
+    if isinstance(alerts, dict):
+        return [alerts]
+    return alerts if isinstance(alerts, list) else []
+
+
+def _read_tail(f, end, limit):
+    """`limit` cảnh báo cuối cùng trước vị trí end của file f (mở nhị phân), đọc ngược từng khối"""
+    pos = end
+    data = b''
+    while pos > 0 and data.count(b'\n') <= limit:
+        step = min(TAIL_BLOCK, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step) + data
+    lines = data.decode('utf-8', 'replace').splitlines()
+    if pos > 0:
+        lines = lines[1:]   # Dòng đầu có thể bị cắt giữa chừng
+    return parse_lines(lines)[-limit:]
+
+
+def read_alerts(limit=None, path=JOURNAL_FILE):
+    """Đọc `limit` cảnh báo mới nhất (cũ -> mới). Chỉ đọc ngược từ cuối file đủ số dòng cần."""
+    if not os.path.exists(path):
+        # Chưa migrate -> vẫn đọc được file mảng JSON cũ
+        alerts = read_legacy()
+        return alerts[-limit:] if limit else alerts
+    with open(path, 'rb') as f:
+        if not limit:
+            return parse_lines(f.read().decode('utf-8', 'replace').splitlines())
+        return _read_tail(f, f.seek(0, os.SEEK_END), limit)
+
+
+class AlertTail:
+    """Đọc tăng dần nhật ký (kiểu `tail -F`): nhớ file đang mở + offset, mỗi lần poll() chỉ parse
+    các dòng mới ghi thêm. Chi phí mỗi lần tỷ lệ với số cảnh báo mới, không phải cả lịch sử.
+    - Lần poll đầu trả về `backlog` cảnh báo cuối cùng rồi theo dõi từ cuối file
+    - Xoay vòng (inode đổi): đọc nốt phần còn lại của file cũ rồi chuyển sang file mới
+    - File bị cắt ngắn (clear()): đọc lại từ đầu và báo reset để người gọi xóa số liệu cộng dồn
+    - Dòng đang ghi dở (chưa có '\n') được giữ lại tới lần poll sau
+    - Chưa có journal thì lần poll đầu đọc file mảng JSON cũ; khi journal xuất hiện sau đó
+      (detector đã migrate) thì bỏ qua các dòng đầu là chính các cảnh báo cũ đó"""
+
+    def __init__(self, path=JOURNAL_FILE, backlog=0, legacy=LEGACY_FILE):
+        self.path = path
+        self.backlog = backlog
+        self.legacy = legacy
+        self._f = None
+        self._inode = None
+        self._offset = 0
+        self._started = False
+        self._legacy_count = 0      # Số cảnh báo trong file cũ lúc đọc tạm (0 = không dùng file cũ)
+
+    def _open(self):
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        self._f = f
+        self._inode = os.fstat(f.fileno()).st_ino
+        self._offset = 0
+        return True
+
+    def _read_new(self):
+        """Các dòng đầy đủ từ offset tới cuối file hiện đang mở"""
+        self._f.seek(self._offset)
+        data = self._f.read()
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        return parse_lines(data[:end].decode('utf-8', 'replace').splitlines())
+
+    def poll(self):
+        """(cảnh báo mới theo thứ tự cũ -> mới, reset)"""
+        if not self._started:
+            self._started = True
+            if not self._open():
+                # Chưa có journal (chưa migrate) -> lấy tạm file mảng JSON cũ
+                alerts = read_legacy(self.legacy)
+                self._legacy_count = sum(1 for a in alerts if isinstance(a, dict))
+                return (alerts[-self.backlog:] if self.backlog else []), False
+            # Theo dõi từ sau '\n' cuối cùng (dòng cuối có thể đang ghi dở)
+            end = os.fstat(self._f.fileno()).st_size
+            start = max(0, end - TAIL_BLOCK)
+            self._f.seek(start)
+            self._offset = start + self._f.read(end - start).rfind(b'\n') + 1
+            return (_read_tail(self._f, self._offset, self.backlog) if self.backlog else []), False
+        if self._f is None:
+            if not self._open():
+                return [], False
+            alerts = self._read_new()
+            if self._legacy_count and not os.path.exists(self.legacy):
+                # migrate_legacy ghi các cảnh báo cũ lên đầu journal -> đã trả về ở lần poll đầu
+                alerts = alerts[self._legacy_count:]
+            self._legacy_count = 0
+            return alerts, False
+        reset = False
+        alerts = []
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if st is not None and st.st_ino != self._inode:
+            alerts = self._read_new()       # Phần cuối của file vừa bị xoay vòng
+            self._f.close()
+            self._f = None
+            if not self._open():
+                return alerts, False
+        elif os.fstat(self._f.fileno()).st_size < self._offset:
+            self._offset = 0
+            reset = True
+        return alerts + self._read_new(), reset
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def clear(path=JOURNAL_FILE):
+    """Xóa toàn bộ lịch sử cảnh báo (kể cả các file đã xoay vòng)"""
+    if os.path.exists(path):
+        open(path, 'w').close()
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        os.remove(f"{path}.{i}")
+        i += 1
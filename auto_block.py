@@ -1,24 +1,48 @@
 #!/usr/bin/env python3
 import subprocess
+import struct
 import time
 import logging
-from collections import defaultdict, deque
-import json
+from collections import defaultdict, deque, OrderedDict
 import os
 import sys
 import math
-import statistics
+import asyncio
+import argparse
+import heapq
+from operator import itemgetter
+
+from netlink_diag import SockDiagCollector
+from conntrack_reader import ConntrackReader
+import ban_backend
+from baseline import BaselineStore, RollingWindow
+import numpy_engine
+import sketch
+import alert_journal
+import detector_config
+import metrics
+import subnet_agg
+import ip_key
+import state_snapshot
+from expiry import ExpiryScheduler
+import replay
+import detector_ipc
+from sample_bus import SampleBus, Sample
+import shm_ring
+import metric_store
 
 # --- CẤU HÌNH ---
-CONFIG_FILE = '/etc/firewall_auto_block.json'
+CONFIG_FILE = detector_config.CONFIG_FILE
 LOG_FILE = '/var/log/firewall_auto_block.log'
-ALERT_FILE = '/var/log/firewall_alerts.json'
+ALERT_FILE = alert_journal.JOURNAL_FILE
 
 # --- CẤU HÌNH THUẬT TOÁN ---
 HISTORY_LEN = 20        # 20 mẫu gần nhất
 MIN_SAMPLES = 5         # Cần ít nhất 5 mẫu để bắt đầu tính Z-Score
 Z_THRESHOLD = 3.0       # Độ lệch chuẩn ( >3 là bất thường)
 HARD_LIMIT_MULTIPLIER = 3 # Nếu vượt ngưỡng gấp 3 lần -> Chặn ngay không cần Z-Score
+OFFENDERS_MAX = 65536   # Số IP tối đa trong lịch sử vi phạm (bỏ IP lâu nhất không vi phạm)
+IPC_TOP_SOURCES = 100   # Số nguồn lớn nhất mỗi bảng đưa vào snapshot của API IPC
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,69 +53,302 @@ logging.basicConfig(
     ]
 )
 
+class AdaptiveInterval:
+    """Chu kỳ kiểm tra thích nghi có trễ (hysteresis):
+    - "áp lực" = số đếm lớn nhất / ngưỡng; vượt enter_ratio hoặc entropy UDP thấp -> chế độ nhanh
+    - chỉ rời chế độ nhanh sau quiet_cycles chu kỳ liên tiếp có áp lực < exit_ratio,
+      rồi tăng dần (x2 mỗi chu kỳ) về check_interval
+    - yên tĩnh quá idle_after_cycles chu kỳ -> giãn ra idle_interval"""
+
+    def __init__(self, settings, clock=time.time):
+        self.clock = clock
+        self.fast = False
+        self.quiet_streak = 0
+        self.interval = settings.check_interval
+        self.suspect_since = None       # Thời điểm bắt đầu nghi ngờ (để tính time-to-detect)
+        self.last_time_to_detect = None
+
+    def update(self, settings, pressure, low_entropy):
+        """Trả về chu kỳ (giây) cho lần kiểm tra tiếp theo"""
+        normal = settings.check_interval
+        if pressure >= settings.fast_enter_ratio or low_entropy:
+            if not self.fast:
+                self.suspect_since = self.clock()
+                logging.info(f"Nghi ngờ tấn công (áp lực {pressure:.2f}) -> kiểm tra mỗi {settings.fast_interval}s")
+            self.fast = True
+            self.quiet_streak = 0
+            self.interval = settings.fast_interval
+            return self.interval
+
+        if pressure < settings.fast_exit_ratio:
+            self.quiet_streak += 1
+        else:
+            self.quiet_streak = 0
+        if self.fast:
+            if self.quiet_streak < settings.quiet_cycles:
+                return self.interval
+            self.fast = False
+            self.suspect_since = None
+            logging.info("Lưu lượng đã yên -> giãn dần chu kỳ kiểm tra")
+        if self.quiet_streak >= settings.idle_after_cycles:
+            target = max(normal, settings.idle_interval)
+        else:
+            target = normal
+        old = self.interval
+        self.interval = min(target, self.interval * 2) if self.interval < target else target
+        if self.interval != old and self.interval in (normal, settings.idle_interval):
+            logging.info(f"Chu kỳ kiểm tra hiện tại: {self.interval}s")
+        return self.interval
+
+    def on_ban(self):
+        """Gọi khi có lệnh chặn: ghi nhận thời gian từ lúc nghi ngờ tới lúc chặn.
+        Trả về số giây đó, None nếu lệnh chặn không kết thúc 1 đợt nghi ngờ."""
+        if self.suspect_since is None:
+            return None
+        self.last_time_to_detect = self.clock() - self.suspect_since
+        logging.info(f"Time-to-detect: {self.last_time_to_detect:.2f}s (chu kỳ {self.interval}s)")
+        self.suspect_since = None
+        return self.last_time_to_detect
+
+
 class DosDetector:
-    def __init__(self):
-        self.banned_ips = {}
-        # Bộ nhớ lịch sử cho Z-Score
-        self.syn_history = defaultdict(lambda: deque(maxlen=HISTORY_LEN))
-        self.conn_history = defaultdict(lambda: deque(maxlen=HISTORY_LEN))
-        self.udp_history = defaultdict(lambda: deque(maxlen=HISTORY_LEN))
+    def __init__(self, settings=None, backend=None, alert_file=ALERT_FILE, clock=time.time):
+        """Mặc định đọc config/backend thật của hệ thống. Chế độ replay truyền vào
+        settings cố định, backend giả (RecordingBackend), file cảnh báo riêng và đồng hồ
+        theo thời gian của bản ghi."""
+        self.banned_ips = {}            # ip -> thời điểm chặn
+        self.expiry = ExpiryScheduler() # ip -> thời điểm hết hạn (min-heap)
+        self.expiry_wakeup = None       # asyncio.Event của run_async: có hạn mới sớm hơn
+        self.offenders = OrderedDict()  # ip -> (số lần bị chặn, lần chặn gần nhất)
+        self.banned_prefixes = set()    # Các khóa CIDR trong banned_ips (lệnh chặn cả dải)
+        self.collapsed = {}             # IP/dải con -> dải cha đã thay thế nó (để ghi log)
+        self.last_state_save = 0.0
+        self.clock = clock
+        self.recorder = None            # CaptureWriter khi chạy với --record
+        self.metrics = metrics.DetectorMetrics()
+        self.metrics_server = None
+        self.ipc = None                 # API Unix socket cho GUI/web dashboard
+        self.bus = SampleBus()          # Mẫu của mỗi chu kỳ -> snapshot IPC, ring, lịch sử, luồng mẫu
+        self.established_total = None   # Tổng kết nối ESTABLISHED của lần thu thập TCP gần nhất
+        self.ring = None                # Ring buffer chia sẻ với GUI (shm_ring)
+        self.history_store = None       # Lịch sử dài hạn trên đĩa (metric_store)
+        self.bans_total = 0
+        self.tcp_source = 'netlink'
+        self.parse_times = {}
+        if settings is None:
+            self.config_watcher = detector_config.ConfigWatcher(CONFIG_FILE)
+            self.config = self.load_config()
+        else:
+            self.config_watcher = None
+            self.config = settings
+
+        # Bộ nhớ lịch sử cho Z-Score: NumPy (vector hóa) nếu có, không thì cửa sổ trượt thuần Python
+        engine = self.config.analysis_engine
+        self.use_numpy = numpy_engine.is_available() and engine in ('auto', 'numpy')
+        if engine == 'numpy' and not self.use_numpy:
+            logging.warning("Không có numpy -> dùng bộ phân tích thuần Python")
+        store_cls = numpy_engine.VectorEngine if self.use_numpy else BaselineStore
+        self.syn_history = store_cls(HISTORY_LEN)
+        self.conn_history = store_cls(HISTORY_LEN)
+        self.udp_history = store_cls(HISTORY_LEN)
+
+        # Bộ thu thập TCP qua netlink (nếu kernel hỗ trợ), lỗi thì quay về `ss`
+        self.sock_diag = SockDiagCollector() if SockDiagCollector.is_supported() else None
         
-        self.config = self.load_config()
-        self.sync_blocked_ips_from_system()
+        self.configure_history()
+        self.conntrack = ConntrackReader()
+        self.conntrack_error = None     # Lỗi conntrack gần nhất (chỉ ghi log khi đổi)
+        self.backend = backend or ban_backend.get_backend(self.config.ban_backend)
+        self.pending = ban_backend.BanBatch()
+        self.last_batch_latency = 0.0
+        try:
+            self.backend.ensure()
+        except Exception as e:
+            logging.error(f"Lỗi khởi tạo backend chặn ({self.backend.name}): {e}")
+        snapshot = self.load_state()
+        self.sync_blocked_ips_from_system(snapshot)
+        self.restore_history(snapshot)
 
-    def load_config(self):
-        default_config = {
-            'check_interval': 5,
-            'syn_threshold': 50,
-            'conn_threshold': 100,
-            'udp_threshold': 100,
-            'ban_time': 300,
-            'whitelist': ['127.0.0.1', '::1']
-        }
-        if os.path.exists(CONFIG_FILE):
+        # Nhật ký cảnh báo JSONL (chuyển từ file mảng JSON cũ nếu có)
+        if alert_file == ALERT_FILE:
             try:
-                with open(CONFIG_FILE, 'r') as f:
-                    data = json.load(f)
-                    default_config.update(data)
-                    return default_config
+                n = alert_journal.migrate_legacy(alert_journal.LEGACY_FILE, ALERT_FILE)
+                if n: logging.info(f"Đã chuyển {n} cảnh báo cũ sang {ALERT_FILE}")
             except Exception as e:
-                logging.error(f"Lỗi đọc config: {e}")
-        return default_config
+                logging.error(f"Lỗi chuyển đổi file cảnh báo cũ: {e}")
+        self.journal = alert_journal.AlertJournal(alert_file)
+
+        # Thời gian từng bước của mỗi chu kỳ (giây)
+        self.last_timings = {}
+        self.timing_history = deque(maxlen=100)
+        self.overruns = 0
+
+        # Chu kỳ kiểm tra thích nghi
+        self.scheduler = AdaptiveInterval(self.config, clock)
+        self.pressure = 0.0
+        self.low_entropy = False
+        self.udp_entropy = 0.0
+
+        # Endpoint metrics kiểu Prometheus (mặc định chỉ nghe trên localhost)
+        if self.config.metrics_listen:
+            try:
+                self.metrics_server = self.metrics.serve(self.config.metrics_listen)
+                logging.info(f"Metrics: {self.config.metrics_listen}/metrics")
+            except (OSError, ValueError) as e:
+                logging.error(f"Không mở được endpoint metrics {self.config.metrics_listen}: {e}")
+
+        # API IPC: snapshot trạng thái + luồng sự kiện chặn/gỡ chặn
+        if self.config.ipc_socket:
+            try:
+                self.ipc = detector_ipc.DetectorIPC(self.ban_table, self.bus)
+                self.ipc.serve(self.config.ipc_socket)
+                logging.info(f"API IPC: {self.config.ipc_socket}")
+            except OSError as e:
+                logging.error(f"Không mở được socket IPC {self.config.ipc_socket}: {e}")
+                self.ipc = None
+
+        # Chuỗi thời gian mỗi chu kỳ trong bộ nhớ chia sẻ (GUI vẽ biểu đồ không cần parse)
+        if self.config.stats_ring:
+            try:
+                self.ring = shm_ring.RingWriter(self.config.stats_ring)
+            except OSError as e:
+                logging.error(f"Không tạo được ring buffer {self.config.stats_ring}: {e}")
+
+        # Lịch sử dài hạn (raw + gộp 1 phút/1 giờ/1 ngày) để xem lại sau sự cố
+        if self.config.history_file:
+            try:
+                self.history_store = metric_store.MetricStore(self.config.history_file)
+            except OSError as e:
+                logging.error(f"Không mở được file lịch sử {self.config.history_file}: {e}")
+
+    def load_config(self):
+        """Đọc config lần đầu (đã kiểm tra kiểu) và ghi nhớ chữ ký file để theo dõi thay đổi"""
+        return self.config_watcher.load(detector_config.DEFAULT_SETTINGS)
 
-    def sync_blocked_ips_from_system(self):
+    def reload_config_if_changed(self):
+        """Gọi giữa 2 chu kỳ: chỉ đọc lại khi file config đổi, áp dụng nguyên khối"""
+        if self.config_watcher is None:
+            return False
+        new = self.config_watcher.poll()
+        if new is None or new == self.config:
+            return False
+        changes = detector_config.diff(self.config, new)
+        logging.info("Đã nạp lại config: " + "; ".join(changes))
+        for name in ('ban_backend', 'run_mode', 'analysis_engine', 'metrics_listen'):
+            if getattr(new, name) != getattr(self.config, name):
+                logging.warning(f"Thay đổi {name} chỉ có hiệu lực sau khi khởi động lại")
+        self.config = new
+        self.configure_history()
+        return True
+
+    def configure_history(self):
+        """Áp giới hạn bộ nhớ/TTL cho các bảng lịch sử (chống phình RAM khi bị giả mạo IP nguồn)"""
+        budget = self.config.history_memory_mb * 1024 * 1024 / 3
+        ttl = self.config.history_ttl_cycles
+        for store in (self.syn_history, self.conn_history, self.udp_history):
+            store.ttl_cycles = ttl
+            store.set_memory_budget(budget)
+
+    def history_stats(self):
+        """Tổng số IP đang theo dõi và số lần loại bỏ của cả 3 bảng lịch sử"""
+        total = {'live_keys': 0, 'evictions': 0, 'expirations': 0}
+        for store in (self.syn_history, self.conn_history, self.udp_history):
+            for k, v in store.stats().items():
+                total[k] += v
+        return total
+
+    def load_state(self):
+        """Đọc snapshot lần chạy trước (None nếu tắt, chưa có hoặc hỏng)"""
+        path = self.config.state_file
+        if not path:
+            return None
         try:
-            result = subprocess.run(['iptables', '-L', 'INPUT', '-n'], capture_output=True, text=True)
-            for line in result.stdout.split('\n'):
-                parts = line.split()
-                if len(parts) >= 4 and parts[0] == 'DROP':
-                    src_ip = parts[3]
-                    if self.is_valid_ip(src_ip) and src_ip != '0.0.0.0/0':
-                        self.banned_ips[src_ip] = time.time()
+            t0 = time.perf_counter()
+            snapshot = state_snapshot.load(path)
+        except (OSError, ValueError, struct.error) as e:
+            logging.error(f"Bỏ qua snapshot trạng thái {path}: {e}")
+            return None
+        if snapshot is not None:
+            logging.info(f"Đã đọc snapshot ({len(snapshot.bans)} lệnh chặn, "
+                         f"{sum(map(len, snapshot.histories.values()))} baseline) "
+                         f"trong {(time.perf_counter() - t0) * 1000:.0f} ms")
+            for ip, offense in snapshot.offenders.items():
+                self.offenders[ip] = offense
+        return snapshot
+
+    def save_state(self):
+        """Ghi snapshot: lệnh chặn + hạn, lịch sử vi phạm, baseline của 3 bảng"""
+        path = self.config.state_file
+        if not path:
+            return
+        now = self.clock()
+        bans = {ip: (banned_at, self.expiry.deadline(ip)) for ip, banned_at in self.banned_ips.items()}
+        histories = {'syn': self.syn_history.export(), 'conn': self.conn_history.export(),
+                     'udp': self.udp_history.export()}
+        try:
+            t0 = time.perf_counter()
+            size = state_snapshot.save(path, now, HISTORY_LEN, bans, self.offenders, histories)
+            logging.debug(f"Đã ghi snapshot {size} byte trong {(time.perf_counter() - t0) * 1000:.0f} ms")
+        except OSError as e:
+            logging.error(f"Lỗi ghi snapshot trạng thái: {e}")
+            self.metrics.failures.labels('state_save').inc()
+        self.last_state_save = now
+        if self.history_store is not None:
+            self.history_store.flush()      # Đẩy file lịch sử xuống đĩa cùng nhịp với snapshot
+
+    def maybe_save_state(self):
+        if self.clock() - self.last_state_save >= self.config.state_save_interval:
+            self.save_state()
+
+    def restore_history(self, snapshot):
+        """Nạp lại baseline Z-Score; tuổi của mỗi IP cộng thêm số chu kỳ đã lỡ khi tắt"""
+        if snapshot is None or snapshot.window_size != HISTORY_LEN:
+            return
+        missed = int(max(0.0, self.clock() - snapshot.saved_at) / self.config.check_interval)
+        ttl = self.config.history_ttl_cycles
+        if ttl and missed >= ttl:
+            logging.info("Snapshot quá cũ so với history_ttl_cycles -> bỏ qua baseline")
+            return
+        stores = {'syn': self.syn_history, 'conn': self.conn_history, 'udp': self.udp_history}
+        for name, entries in snapshot.histories.items():
+            stores[name].load([(ip, values, age + missed) for ip, values, age in entries
+                               if not ttl or age + missed < ttl])
+
+    def sync_blocked_ips_from_system(self, snapshot=None):
+        """Đối chiếu firewall thật với snapshot: IP còn bị chặn giữ nguyên thời điểm chặn/hết hạn
+        đã lưu; IP có trong snapshot nhưng đã mất khỏi firewall thì bỏ."""
+        ban_time = self.config.ban_time
+        saved = snapshot.bans if snapshot else {}
+        try:
+            now = self.clock()
+            for src_ip, remaining in self.backend.list().items():
+                if self.is_valid_ip(src_ip):
+                    if subnet_agg.is_prefix(src_ip):
+                        self.banned_prefixes.add(src_ip)
+                    if src_ip in saved:
+                        banned_at, expires_at = saved[src_ip]
+                        self.banned_ips[src_ip] = banned_at
+                        if expires_at is not None:
+                            self.expiry.schedule(src_ip, expires_at)
+                    # Backend có timeout -> khôi phục đúng thời điểm chặn ban đầu
+                    elif remaining is not None and ban_time > 0:
+                        self.banned_ips[src_ip] = now - max(0, ban_time - remaining)
+                        self.expiry.schedule(src_ip, now + remaining)
+                    else:
+                        self.banned_ips[src_ip] = now
+                        if ban_time > 0:
+                            self.expiry.schedule(src_ip, now + ban_time)
         except Exception:
             pass
 
     def is_valid_ip(self, ip):
-        if not ip: return False
-        if ip.startswith('::ffff:'): ip = ip.replace('::ffff:', '')
-        parts = ip.split('.')
-        if len(parts) != 4: return False
-        try:
-            return all(0 <= int(part) <= 255 for part in parts)
-        except ValueError: return False
+        """IPv4/IPv6 hoặc khóa dải (nguồn IPv6 /64, dải bị chặn)"""
+        return ip_key.is_valid(ip)
 
     # === CÁC HÀM TOÁN HỌC (MỚI) ===
     def calculate_z_score(self, history, current_val):
-        """Tính độ lệch chuẩn Z-Score"""
-        if len(history) < MIN_SAMPLES:
-            return 0.0
-        try:
-            mean = statistics.mean(history)
-            stdev = statistics.stdev(history)
-            if stdev == 0: return 0.0
-            return (current_val - mean) / stdev
-        except:
-            return 0.0
+        """Tính độ lệch chuẩn Z-Score (O(1): dùng tổng trượt của RollingWindow)"""
+        return history.z_score(current_val, MIN_SAMPLES)
 
     def calculate_entropy(self, data_dict):
         """Tính Entropy để biết độ phân tán của cuộc tấn công"""
@@ -107,20 +364,59 @@ class DosDetector:
                 entropy -= p * math.log2(p)
         return entropy
 
+    def new_counter(self):
+        """Bộ đếm theo IP nguồn cho 1 chu kỳ: dict chính xác hoặc sketch Space-Saving"""
+        if self.config.counting_mode == 'sketch':
+            k = sketch.capacity_for(self.config.sketch_epsilon, self.config.sketch_max_kb * 1024)
+            return sketch.SpaceSaving(k)
+        return defaultdict(int)
+
     def get_tcp_stats(self):
-        syn_stats = defaultdict(int)
-        conn_stats = defaultdict(int)
-        whitelist = self.config.get('whitelist', [])
+        whitelist = self.config.whitelist
+        if self.sock_diag and self.config.tcp_collector == 'netlink':
+            try:
+                return self._get_tcp_stats_netlink(whitelist)
+            except OSError as e:
+                logging.error(f"Lỗi netlink sock_diag, chuyển sang dùng ss: {e}")
+                self.metrics.failures.labels('netlink').inc()
+                self.sock_diag = None
+        return self._get_tcp_stats_ss(whitelist)
+
+    def _get_tcp_stats_netlink(self, whitelist):
+        syn_raw, conn_raw = self.sock_diag.collect(whitelist, self.new_counter,
+                                                   self.config.ipv6_source_prefix)
+        # Giữ nguyên quy tắc lọc IP như đường ss
+        t0 = time.perf_counter()
+        syn_stats = defaultdict(int, {ip: c for ip, c in syn_raw.items() if self.is_valid_ip(ip)})
+        conn_stats = defaultdict(int, {ip: c for ip, c in conn_raw.items() if self.is_valid_ip(ip)})
+        self.tcp_source = 'netlink'
+        self.established_total = self.sock_diag.last_established
+        self.parse_times['netlink'] = self.sock_diag.last_parse_time + time.perf_counter() - t0
+        return syn_stats, conn_stats
+
+    def _get_tcp_stats_ss(self, whitelist):
+        syn_stats = self.new_counter()
+        conn_stats = self.new_counter()
+        self.tcp_source = 'ss'
+        parse_time = 0.0
         try:
             res_syn = subprocess.run(['ss', '-nt', 'state', 'syn-recv'], capture_output=True, text=True)
+            t0 = time.perf_counter()
             for line in res_syn.stdout.splitlines()[1:]:
                 self._parse_ss_line(line, syn_stats, whitelist)
+            parse_time += time.perf_counter() - t0
 
             res_est = subprocess.run(['ss', '-nt', 'state', 'established'], capture_output=True, text=True)
-            for line in res_est.stdout.splitlines()[1:]:
+            t0 = time.perf_counter()
+            est_lines = res_est.stdout.splitlines()[1:]
+            self.established_total = len(est_lines)
+            for line in est_lines:
                 self._parse_ss_line(line, conn_stats, whitelist)
+            parse_time += time.perf_counter() - t0
         except Exception as e:
             logging.error(f"Lỗi TCP Check: {e}")
+            self.metrics.failures.labels('ss').inc()
+        self.parse_times['ss'] = parse_time
         return syn_stats, conn_stats
 
     def _parse_ss_line(self, line, stats_dict, whitelist):
@@ -129,54 +425,87 @@ class DosDetector:
             peer_idx = 4 if len(parts) > 4 else 3 
             peer_str = parts[peer_idx]
             if ':' in peer_str:
-                if ']' in peer_str: ip = peer_str.split(']')[0].replace('[', '')
-                else: ip = peer_str.split(':')[0]
-                if self.is_valid_ip(ip) and ip not in whitelist:
-                    stats_dict[ip] += 1
+                # [2001:db8::1]:443, [::ffff:1.2.3.4]:80 -> khóa chuẩn (IPv6 gộp theo /64)
+                key = ip_key.source_key(ip_key.split_host_port(peer_str), self.config.ipv6_source_prefix)
+                if key and key not in whitelist:
+                    stats_dict[key] += 1
         except: pass
 
     def get_udp_stats(self):
-        udp_stats = defaultdict(int)
-        whitelist = self.config.get('whitelist', [])
+        whitelist = self.config.whitelist
+        self.conntrack.sample_max_flows = self.config.udp_sample_max_flows
         try:
-            cmd = "conntrack -L -p udp 2>/dev/null | head -n 5000"
-            output = subprocess.check_output(cmd, shell=True, text=True)
-            for line in output.splitlines():
-                if 'src=' in line:
-                    parts = line.split()
-                    for p in parts:
-                        if p.startswith('src='):
-                            ip = p.split('=')[1]
-                            if self.is_valid_ip(ip) and ip not in whitelist:
-                                udp_stats[ip] += 1
-                            break 
-        except: pass
-        return udp_stats
+            counts = self.conntrack.count_sources(whitelist, self.new_counter,
+                                                  self.config.ipv6_source_prefix)
+            if self.conntrack.last_sample_rate < 1.0:
+                logging.info(f"Bảng conntrack lớn: lấy mẫu {self.conntrack.last_sample_rate:.2%} "
+                             f"({self.conntrack.last_lines} dòng)")
+            self.conntrack_error = None
+            return defaultdict(int, {ip: c for ip, c in counts.items() if self.is_valid_ip(ip)})
+        except OSError as e:
+            # Không có conntrack -> bỏ qua UDP như trước (ghi log 1 lần, không lặp mỗi chu kỳ)
+            if str(e) != self.conntrack_error:
+                self.conntrack_error = str(e)
+                logging.warning(f"Không đọc được bảng conntrack, bỏ qua phát hiện UDP: {e}")
+            self.metrics.failures.labels('conntrack').inc()
+            return defaultdict(int)
+        except Exception:
+            logging.exception("Lỗi đếm luồng UDP từ conntrack")
+            self.metrics.failures.labels('conntrack').inc()
+            return defaultdict(int)
 
     # === LOGIC CHẶN THÔNG MINH (UPDATED) ===
     def check_for_attacks(self, syn_stats, conn_stats, udp_stats):
-        syn_thresh = int(self.config.get('syn_threshold', 50))
-        conn_thresh = int(self.config.get('conn_threshold', 100))
-        udp_thresh = int(self.config.get('udp_threshold', 100))
+        cfg = self.config
+        syn_thresh = cfg.syn_threshold
+        conn_thresh = cfg.conn_threshold
+        udp_thresh = cfg.udp_threshold
 
         # 1. Tính Entropy toàn cục (Để cảnh báo dạng tấn công)
         udp_entropy = self.calculate_entropy(udp_stats)
-        if sum(udp_stats.values()) > 50 and udp_entropy < 1.0:
+        self.low_entropy = sum(udp_stats.values()) > 50 and udp_entropy < 1.0
+        if self.low_entropy:
             logging.info(f"CẢNH BÁO: Entropy UDP thấp ({udp_entropy:.2f}) -> Dấu hiệu tấn công tập trung!")
+        self.udp_entropy = udp_entropy
+
+        # Áp lực = tỉ lệ lớn nhất giữa số đếm và ngưỡng (dùng cho chu kỳ thích nghi)
+        self.pressure = max(
+            max(syn_stats.values(), default=0) / syn_thresh,
+            max(conn_stats.values(), default=0) / conn_thresh,
+            max(udp_stats.values(), default=0) / udp_thresh,
+        )
 
         # 2. Kiểm tra từng loại tấn công với Z-Score
+        evictions_before = self.history_stats()['evictions']
+        if cfg.subnet_aggregation:
+            # Dải mạng trước, để các host bên trong dải vừa bị chặn không cần chặn lẻ nữa
+            self.analyze_subnets(syn_stats, self.syn_history, syn_thresh, "SYN Flood")
+            self.analyze_subnets(conn_stats, self.conn_history, conn_thresh, "Conn Flood")
+            self.analyze_subnets(udp_stats, self.udp_history, udp_thresh, "UDP Flood")
         self.analyze_and_block(syn_stats, self.syn_history, syn_thresh, "SYN Flood")
         self.analyze_and_block(conn_stats, self.conn_history, conn_thresh, "Conn Flood")
         self.analyze_and_block(udp_stats, self.udp_history, udp_thresh, "UDP Flood")
 
-    def analyze_and_block(self, current_stats, history_store, threshold, attack_name):
-        """Hàm xử lý chung cho cả TCP và UDP"""
+        # 3. Dọn các IP lâu không xuất hiện
+        for store in (self.syn_history, self.conn_history, self.udp_history):
+            store.tick()
+        hstats = self.history_stats()
+        if hstats['evictions'] > evictions_before:
+            logging.warning(f"Bảng lịch sử đầy: loại bỏ {hstats['evictions'] - evictions_before} IP "
+                            f"(đang theo dõi {hstats['live_keys']}) -> có thể bị giả mạo IP nguồn")
+
+    def analyze_and_block(self, current_stats, history_store, threshold, attack_name, eligible=None):
+        """Hàm xử lý chung cho cả TCP và UDP (và cho các dải mạng đã gộp).
+        eligible: nếu có, chỉ các khóa trong tập này mới được chặn (vẫn học lịch sử cho mọi khóa)"""
+        if self.use_numpy:
+            return self._analyze_and_block_numpy(current_stats, history_store, threshold, attack_name, eligible)
         for ip, count in current_stats.items():
             # Thêm vào lịch sử để học
-            history_store[ip].append(count)
+            window = history_store[ip]
+            window.push(count)
             
             # Tính toán
-            z_score = self.calculate_z_score(history_store[ip], count)
+            z_score = self.calculate_z_score(window, count)
             
             # --- LOGIC QUYẾT ĐỊNH CHẶN ---
             should_block = False
@@ -196,82 +525,484 @@ class DosDetector:
             if count > threshold:
                 print(f"[DEBUG] {ip}: Count={count}, Threshold={threshold}, Z={z_score:.2f} -> Block? {should_block}")
 
-            if should_block and ip not in self.banned_ips:
+            if should_block and (eligible is None or ip in eligible) and not self.is_banned(ip):
+                self.block_ip(ip, reason_detail)
+
+    def _analyze_and_block_numpy(self, current_stats, engine, threshold, attack_name, eligible=None):
+        """Cùng logic quyết định như trên nhưng tính cho mọi IP trong 1 lượt NumPy"""
+        for ip, count, z_score, should_block, is_hard in engine.evaluate(
+                current_stats, threshold, HARD_LIMIT_MULTIPLIER, Z_THRESHOLD, MIN_SAMPLES):
+            if is_hard:
+                reason_detail = f"{attack_name} (HARD LIMIT: {count} > {threshold*3})"
+            else:
+                reason_detail = f"{attack_name} (Z-Score: {count} > {threshold}, Z={z_score:.2f})"
+            print(f"[DEBUG] {ip}: Count={count}, Threshold={threshold}, Z={z_score:.2f} -> Block? {should_block}")
+            if should_block and (eligible is None or ip in eligible) and not self.is_banned(ip):
                 self.block_ip(ip, reason_detail)
 
-    def block_ip(self, ip, reason):
+    def analyze_subnets(self, current_stats, history_store, threshold, attack_name):
+        """Gộp số đếm lên các dải (/24, /16 | /48, /32) rồi áp ngưỡng + Z-Score cho từng mức.
+        Dải rộng xét trước để chặn /16 thì không cần chặn thêm các /24 bên trong."""
+        cfg = self.config
+        levels = subnet_agg.aggregate(current_stats, cfg.subnet_prefixes_v4, cfg.subnet_prefixes_v6)
+        for level in reversed(range(len(levels))):
+            counts, sources = levels[level]
+            # Dải chỉ có 1-2 host nặng thì để chặn từng host, không chặn cả dải;
+            # dải chứa IP trong whitelist thì không bao giờ chặn cả dải
+            eligible = {k for k, n in sources.items()
+                        if n >= cfg.subnet_min_sources and k not in cfg.whitelist}
+            level_threshold = threshold * cfg.subnet_threshold_multiplier ** (level + 1)
+            self.analyze_and_block(counts, history_store, level_threshold, f"{attack_name} (dải)", eligible)
+
+    def is_banned(self, key):
+        """IP/dải đã bị chặn trực tiếp hoặc nằm trong 1 dải đang bị chặn"""
+        if key in self.banned_ips:
+            return True
+        if not self.banned_prefixes:
+            return False
+        ip, _, plen = key.partition('/')
+        plen = int(plen) if plen else 129
+        cfg = self.config
+        covering = subnet_agg.covering_prefixes(ip, [n for n in cfg.subnet_prefixes_v4 if n < plen],
+                                                [n for n in cfg.subnet_prefixes_v6 if n < plen])
+        return any(p in self.banned_prefixes for p in covering)
+
+    def collapse_children(self, prefix):
+        """Chặn cả dải -> gỡ các lệnh chặn IP/dải con bên trong (gộp thành 1 lệnh)"""
+        for child in [k for k in self.banned_ips if k != prefix and subnet_agg.within(k, prefix)]:
+            banned_at = self.banned_ips.pop(child)
+            expires_at = self.expiry.deadline(child)
+            self.expiry.cancel(child)
+            self.banned_prefixes.discard(child)
+            if child in self.pending.adds:
+                self.pending.remove(child)      # Chưa áp dụng -> chỉ bỏ khỏi lô
+            else:
+                self.pending.remove(child, banned_at, expires_at)
+                self.collapsed[child] = prefix
+
+    def block_ip(self, ip, reason, duration=None):
+        """Đưa IP vào lô chặn của chu kỳ hiện tại, áp dụng thật trong commit_bans()
+        duration: thời gian chặn riêng cho IP này (mặc định ban_time, <= 0 = vĩnh viễn)"""
+        if duration is None:
+            duration = self.config.ban_time
+        duration = max(0, int(duration))
+        now = self.clock()
+        self.banned_ips[ip] = now
+        if subnet_agg.is_prefix(ip):
+            self.banned_prefixes.add(ip)
+            self.collapse_children(ip)
+        if duration > 0:
+            nxt = self.expiry.next_deadline()
+            self.expiry.schedule(ip, now + duration)
+            if self.expiry_wakeup is not None and (nxt is None or now + duration < nxt):
+                self.expiry_wakeup.set()
+        self.pending.add(ip, duration, reason)
+
+    def unban_old_ips(self):
+        """Chỉ lấy các IP đã tới hạn từ min-heap, không quét toàn bộ banned_ips"""
+        for ip in self.expiry.pop_due(self.clock()):
+            blocked_time = self.banned_ips.pop(ip, None)
+            if blocked_time is None:
+                continue
+            self.banned_prefixes.discard(ip)
+            # ipset/nft: kernel tự xóa phần tử khi hết timeout, chỉ cần ghi log
+            if self.backend.kernel_timeouts:
+                self._log_unban(ip)
+            else:
+                self.pending.remove(ip, blocked_time)
+
+    def expire_bans(self):
+        """Gỡ chặn đúng hạn giữa 2 chu kỳ phát hiện (không chờ tới chu kỳ kế tiếp)"""
+        self.unban_old_ips()
+        self.commit_bans()
+        self._commit_journal()
+
+    def sleep_until(self, deadline):
+        """Ngủ tới `deadline` (theo self.clock), thức dậy giữa chừng để gỡ các lệnh chặn tới hạn"""
+        while True:
+            now = self.clock()
+            if now >= deadline:
+                return
+            nxt = self.expiry.next_deadline()
+            if nxt is None or nxt >= deadline:
+                time.sleep(deadline - now)
+                return
+            time.sleep(max(0.0, nxt - now))
+            self.expire_bans()
+
+    async def _expiry_loop(self):
+        """Task riêng của run_async: gỡ chặn đúng hạn, độc lập với chu kỳ phát hiện"""
+        while True:
+            nxt = self.expiry.next_deadline()
+            timeout = None if nxt is None else max(0.0, nxt - self.clock())
+            self.expiry_wakeup.clear()
+            try:
+                await asyncio.wait_for(self.expiry_wakeup.wait(), timeout)
+                continue        # Có lệnh chặn với hạn sớm hơn -> tính lại thời gian chờ
+            except asyncio.TimeoutError:
+                pass
+            try:
+                self.expire_bans()
+            except Exception as e:
+                logging.error(f"Lỗi gỡ chặn theo lịch: {e}")
+
+    def commit_bans(self):
+        """Áp dụng toàn bộ quyết định chặn/gỡ của chu kỳ trong 1 giao dịch"""
+        if not self.pending:
+            return
+        adds = [(ip, timeout) for ip, (timeout, _) in self.pending.adds.items()]
+        removes = list(self.pending.removes)
+        # Thời gian chặn còn lại của IP bị gỡ, để backend thêm lại đúng hạn nếu phải hoàn tác
+        now = self.clock()
+        restore_timeouts = {ip: max(1, int(expires_at - now)) if expires_at else 0
+                            for ip, (_, expires_at) in self.pending.removes.items()}
+        t0 = time.perf_counter()
         try:
-            check = subprocess.run(['iptables', '-C', 'INPUT', '-s', ip, '-j', 'DROP'], capture_output=True)
-            if check.returncode != 0:
-                subprocess.run(['iptables', '-I', 'INPUT', '1', '-s', ip, '-j', 'DROP'], check=True)
-                
-                if "UDP" in reason:
-                    subprocess.run(f"conntrack -D -p udp -s {ip}", shell=True, stderr=subprocess.DEVNULL)
-
-                logging.warning(f"ĐÃ CHẶN IP: {ip} - Lý do: {reason}")
-                self.banned_ips[ip] = time.time()
-                self.write_alert({
-                    'timestamp': time.time(),
-                    'ip': ip,
-                    'reason': reason,
-                    'action': 'BLOCKED'
-                })
+            self.backend.apply_batch(adds, removes, restore_timeouts)
         except Exception as e:
-            logging.error(f"Lỗi khi chặn {ip}: {e}")
+            # BatchError: chỉ 1 phần lô lỗi (vd. ip6tables-restore), phần còn lại đã có hiệu lực
+            failed = e.failed if isinstance(e, ban_backend.BatchError) \
+                else set(self.pending.adds) | set(self.pending.removes)
+            logging.error(f"Lỗi áp dụng lô chặn ({len(failed)}/{len(adds) + len(removes)} IP chưa áp dụng, "
+                          f"đã hoàn tác): {e}")
+            self.metrics.failures.labels('ban_batch').inc()
+            self._rollback_pending(failed)
+            adds = [(ip, timeout) for ip, timeout in adds if ip not in failed]
+            removes = [ip for ip in removes if ip not in failed]
+            if not adds and not removes:
+                self.last_batch_latency = time.perf_counter() - t0
+                self.pending.clear()
+                return
+        self.last_batch_latency = time.perf_counter() - t0
+        if adds:
+            time_to_detect = self.scheduler.on_ban()
+            if time_to_detect is not None:
+                self.metrics.time_to_detect.observe(time_to_detect)
+            self.metrics.bans.inc(len(adds))
+            self.bans_total += len(adds)
+            self._record_offenders(ip for ip, _ in adds)
+        logging.info(f"Đã áp dụng lô chặn: +{len(adds)} / -{len(removes)} trong {self.last_batch_latency * 1000:.1f} ms")
 
-    def unban_old_ips(self):
-        ban_time = int(self.config.get('ban_time', 300))
-        if ban_time <= 0: return
-        current_time = time.time()
-        for ip, blocked_time in list(self.banned_ips.items()):
-            if current_time - blocked_time > ban_time:
+        for ip, (_, reason) in self.pending.adds.items():
+            if "UDP" in reason:
                 try:
-                    subprocess.run(['iptables', '-D', 'INPUT', '-s', ip, '-j', 'DROP'], check=True)
-                    logging.info(f"GỠ BỎ CHẶN {ip} (Hết hạn)")
-                    del self.banned_ips[ip]
-                    self.write_alert({'timestamp': time.time(), 'ip': ip, 'reason': 'Expired', 'action': 'UNBANNED'})
-                except Exception:
-                    del self.banned_ips[ip]
+                    subprocess.run(['conntrack', '-D', '-p', 'udp'] + ip_key.conntrack_source_args(ip),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                except OSError:
+                    self.metrics.failures.labels('conntrack_delete').inc()
+            logging.warning(f"ĐÃ CHẶN IP: {ip} - Lý do: {reason}")
+            self._emit('ban', ip, reason, expires_at=self.expiry.deadline(ip))
+            self.write_alert({
+                'timestamp': self.clock(),
+                'ip': ip,
+                'reason': reason,
+                'action': 'BLOCKED'
+            })
+        for ip in removes:
+            self._log_unban(ip, self.collapsed.pop(ip, None))
+        self.pending.clear()
+
+    def _rollback_pending(self, failed):
+        """Hoàn tác sổ sách của các IP trong lô chưa áp dụng được (bỏ chúng khỏi lô)"""
+        # IP chưa chặn được sẽ bị phát hiện lại ở chu kỳ sau
+        for ip in [ip for ip in self.pending.adds if ip in failed]:
+            del self.pending.adds[ip]
+            self.banned_ips.pop(ip, None)
+            self.expiry.cancel(ip)
+            self.banned_prefixes.discard(ip)
+        # IP con đã gộp chưa được gỡ -> vẫn đang bị chặn trên firewall
+        for ip in [ip for ip in self.pending.removes if ip in failed]:
+            banned_at, expires_at = self.pending.removes.pop(ip)
+            if ip in self.collapsed:
+                del self.collapsed[ip]
+                self.banned_ips[ip] = banned_at if banned_at is not None else self.clock()
+                if subnet_agg.is_prefix(ip):
+                    self.banned_prefixes.add(ip)
+                if expires_at is not None:
+                    self.expiry.schedule(ip, expires_at)
+
+    def _record_offenders(self, ips):
+        now = self.clock()
+        offenders = self.offenders
+        for ip in ips:
+            strikes = offenders.pop(ip, (0, 0.0))[0]
+            offenders[ip] = (strikes + 1, now)
+        while len(offenders) > OFFENDERS_MAX:
+            offenders.popitem(last=False)
+
+    def _commit_journal(self):
+        """fsync 1 lần cho tất cả cảnh báo của chu kỳ (group commit)"""
+        try:
+            self.journal.commit()
+        except Exception as e:
+            logging.error(f"Lỗi fsync nhật ký cảnh báo: {e}")
+            self.metrics.failures.labels('journal_fsync').inc()
+
+    def _log_unban(self, ip, merged_into=None):
+        if merged_into:
+            logging.info(f"GỠ BỎ CHẶN {ip} (Đã gộp vào lệnh chặn dải {merged_into})")
+            reason = f"Merged into {merged_into}"
+        else:
+            logging.info(f"GỠ BỎ CHẶN {ip} (Hết hạn)")
+            reason = 'Expired'
+        self.metrics.unbans.inc()
+        self._emit('unban', ip, reason)
+        self.write_alert({'timestamp': self.clock(), 'ip': ip, 'reason': reason, 'action': 'UNBANNED'})
+
+    def _emit(self, event, ip, reason, **extra):
+        """Đẩy sự kiện cho các client IPC đang subscribe (không có ai thì bỏ qua)"""
+        if self.ipc is not None and self.ipc.subscriber_count:
+            self.ipc.emit(dict(extra, event=event, ip=ip, reason=reason, timestamp=self.clock()))
+
+    def ban_table(self):
+        """{ip: (thời điểm chặn, thời điểm hết hạn | None)} - gọi từ thread của server IPC,
+        dict.copy() chạy trọn trong C dưới GIL nên không bị đổi giữa chừng"""
+        banned = self.banned_ips.copy()
+        deadlines = self.expiry.deadlines()
+        return {ip: (banned_at, deadlines.get(ip)) for ip, banned_at in banned.items()}
+
+    def source_z_score(self, store, ip, count):
+        """Z-Score hiện tại của 1 nguồn (chỉ đọc, không tạo cửa sổ mới)"""
+        if self.use_numpy:
+            values = store.window(ip)
+            window = RollingWindow(HISTORY_LEN)
+            for v in values:
+                window.push(v)
+        else:
+            window = store.get(ip)
+        return window.z_score(count, MIN_SAMPLES) if window else 0.0
+
+    def live_snapshot(self, timings):
+        """Trạng thái chu kỳ vừa xong cho API IPC (chỉ top IPC_TOP_SOURCES nguồn mỗi bảng)"""
+        sources = {}
+        totals = {}
+        sample = self.bus.latest
+        tables = (sample.syn, sample.conn, sample.udp) if sample else ({}, {}, {})
+        for name, stats, store in zip(('syn', 'conn', 'udp'), tables,
+                                      (self.syn_history, self.conn_history, self.udp_history)):
+            top = heapq.nlargest(IPC_TOP_SOURCES, stats.items(), key=itemgetter(1))
+            sources[name] = [{'ip': ip, 'count': count, 'z': round(self.source_z_score(store, ip, count), 2),
+                              'banned': self.is_banned(ip)} for ip, count in top]
+            totals[name] = sum(stats.values())
+        return {
+            'timestamp': self.clock(),
+            'timings': timings,
+            'interval': timings.get('interval'),
+            'pressure': round(self.pressure, 3),
+            'udp_entropy': round(self.udp_entropy, 4),
+            'low_entropy': self.low_entropy,
+            'tcp_source': self.tcp_source,
+            'tracked': self.history_stats()['live_keys'],
+            'banned': len(self.banned_ips),
+            'banned_prefixes': len(self.banned_prefixes),
+            'totals': totals,
+            'sources': sources,
+        }
 
     def write_alert(self, alert_data):
+        """Ghi nối 1 dòng vào nhật ký (fsync theo lô trong commit_bans)"""
         try:
-            alerts = []
-            if os.path.exists(ALERT_FILE):
-                with open(ALERT_FILE, 'r') as f:
-                    try: 
-                        data = f.read().strip()
-                        if data: alerts = json.loads(data)
-                    except: pass
-            
-            if not isinstance(alerts, list): alerts = []
-            alerts.append(alert_data)
-            alerts = alerts[-100:] 
-            
-            with open(ALERT_FILE, 'w') as f:
-                json.dump(alerts, f, indent=2)
-        except Exception: pass
+            self.journal.append(alert_data)
+        except Exception as e:
+            logging.error(f"Lỗi ghi cảnh báo: {e}")
+
+    def _timed(self, func):
+        """Chạy func và trả về (kết quả, số giây) - dùng trong thread của run_async"""
+        t0 = time.perf_counter()
+        result = func()
+        return result, time.perf_counter() - t0
+
+    def process_cycle(self, syn, conn, udp, timings):
+        """Các bước sau thu thập: phân tích, gỡ chặn, áp dụng lô, fsync nhật ký (có đo thời gian)"""
+        if self.recorder is not None:
+            try:
+                self.recorder.write(self.clock(), syn, conn, udp)
+            except OSError as e:
+                logging.error(f"Lỗi ghi bản ghi replay, dừng ghi: {e}")
+                self.recorder = None
+        # Phát mẫu của chu kỳ (TCP bị bỏ qua do trễ hạn -> không có tổng ESTABLISHED)
+        established = self.established_total if timings.get('tcp') is not None else None
+        self.bus.publish(Sample(self.clock(), syn, conn, udp, established, self.tcp_source))
+        t0 = time.perf_counter()
+        self.check_for_attacks(syn, conn, udp)
+        t1 = time.perf_counter()
+        self.unban_old_ips()
+        t2 = time.perf_counter()
+        self.commit_bans()
+        self._commit_journal()
+        t3 = time.perf_counter()
+        timings['analyze'] = t1 - t0
+        timings['unban'] = t2 - t1
+        timings['commit'] = t3 - t2
+
+    def next_interval(self):
+        """Chu kỳ cho lần kiểm tra kế tiếp: cố định hoặc thích nghi theo áp lực"""
+        if not self.config.adaptive_interval:
+            return self.config.check_interval
+        return self.scheduler.update(self.config, self.pressure, self.low_entropy)
+
+    def _record_timings(self, timings):
+        self.last_timings = timings
+        self.timing_history.append(timings)
+        m = self.metrics
+        sources = {'tcp': self.tcp_source, 'udp': 'conntrack'}
+        m.observe_cycle(timings, sources, self.parse_times)
+        self.parse_times = {}
+        for key, source in sources.items():
+            if key in timings and timings[key] is None:
+                m.shed.labels(source).inc()
+        interval = timings.get('interval') or self.config.check_interval
+        if timings.get('total', 0) > interval:
+            m.deadline_misses.inc()
+        m.tracked.set(self.history_stats()['live_keys'])
+        m.banned.set(len(self.banned_ips))
+        m.entropy.set(round(self.udp_entropy, 4))
+        m.interval.set(interval)
+        if self.ipc is not None:
+            self.ipc.publish(self.live_snapshot(timings))
+        if self.ring is not None:
+            self.append_ring(timings, interval)
+        if self.history_store is not None:
+            self.append_history(timings)
+
+    def append_ring(self, timings, interval):
+        sample = self.bus.latest
+        tables = (sample.syn, sample.conn, sample.udp) if sample else ({}, {}, {})
+        try:
+            self.ring.append(
+                self.clock(), sample.established if sample else None,
+                [sum(t.values()) for t in tables], self.history_stats()['live_keys'],
+                len(self.banned_ips), self.bans_total, self.udp_entropy, self.pressure, interval,
+                timings.get('total', 0.0),
+                [heapq.nlargest(shm_ring.TOP_K, t.items(), key=itemgetter(1)) for t in tables])
+        except (OSError, ValueError, struct.error) as e:
+            logging.error(f"Lỗi ghi ring buffer, tắt ring: {e}")
+            self.ring = None
+
+    def append_history(self, timings):
+        sample = self.bus.latest
+        tables = (sample.syn, sample.conn, sample.udp) if sample else ({}, {}, {})
+        syn, conn, udp = (sum(t.values()) for t in tables)
+        try:
+            self.history_store.append(self.clock(), (
+                sample.established if sample else None, syn, conn, udp,
+                self.history_stats()['live_keys'], len(self.banned_ips), self.udp_entropy,
+                self.pressure, timings.get('total', 0.0)))
+        except (OSError, ValueError, struct.error) as e:
+            logging.error(f"Lỗi ghi file lịch sử, tắt lịch sử: {e}")
+            self.history_store = None
+
+    def shutdown(self):
+        """Lưu trạng thái và đóng các file/socket khi dừng (cả 2 chế độ chạy)"""
+        self.save_state()
+        self.journal.close()
+        if self.ipc is not None:
+            self.ipc.close()
+        if self.history_store is not None:
+            self.history_store.close()
+        if self.recorder is not None:
+            # Đóng để file .gz có đủ phần kết thúc gzip
+            self.recorder.close()
+            self.recorder = None
 
     def run(self):
         logging.info("Firewall Monitor (Hybrid: Threshold + Z-Score) Started...")
         print("Đang chạy... Nhấn Ctrl+C để dừng.")
         while True:
             try:
-                self.config = self.load_config()
+                self.reload_config_if_changed()
+                timings = {}
+                t0 = time.perf_counter()
                 syn, conn = self.get_tcp_stats()
+                t1 = time.perf_counter()
                 udp = self.get_udp_stats()
+                timings['tcp'] = t1 - t0
+                timings['udp'] = time.perf_counter() - t1
                 
-                self.check_for_attacks(syn, conn, udp)
-                self.unban_old_ips()
-                
-                time.sleep(self.config.get('check_interval', 5))
+                self.process_cycle(syn, conn, udp, timings)
+                timings['total'] = time.perf_counter() - t0
+                timings['interval'] = self.next_interval()
+                self._record_timings(timings)
+                self.maybe_save_state()
+                self.sleep_until(self.clock() + timings['interval'])
             except KeyboardInterrupt:
                 print("\nDừng chương trình.")
+                self.shutdown()
                 break
             except Exception as e:
                 logging.error(f"Lỗi main loop: {e}")
                 time.sleep(5)
 
+    async def run_async(self):
+        """Chế độ asyncio: TCP và UDP thu thập song song, chu kỳ bám theo lịch cố định
+        (t0, t0+T, t0+2T, ...) thay vì ngủ T giây sau khi làm xong.
+        - Bộ thu thập nào chưa xong trước hạn chót của chu kỳ thì bỏ kết quả của nó (shed)
+          và không khởi chạy lại cho tới khi lần chạy cũ kết thúc
+        - Chu kỳ chạy quá hạn thì bỏ qua các mốc đã lỡ, không chạy bù dồn dập"""
+        logging.info("Firewall Monitor (asyncio, lịch cố định) Started...")
+        loop = asyncio.get_running_loop()
+        running = {}        # tên bộ thu thập -> future còn đang chạy
+        next_tick = loop.time()
+        self.expiry_wakeup = asyncio.Event()
+        expiry_task = asyncio.create_task(self._expiry_loop())
+        while True:
+            try:
+                self.reload_config_if_changed()
+                period = self.scheduler.interval if self.config.adaptive_interval else self.config.check_interval
+                deadline = next_tick + period
+                timings = {}
+                t0 = time.perf_counter()
+
+                for name, func in (('tcp', self.get_tcp_stats), ('udp', self.get_udp_stats)):
+                    if name not in running:
+                        running[name] = loop.run_in_executor(None, self._timed, func)
+                pending = list(running.values())
+                await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()))
+
+                results = {}
+                for name, fut in list(running.items()):
+                    if fut.done():
+                        del running[name]
+                        try:
+                            results[name], timings[name] = fut.result()
+                        except Exception as e:
+                            logging.error(f"Lỗi bộ thu thập {name}: {e}")
+                    else:
+                        timings[name] = None
+                        logging.warning(f"Bộ thu thập {name} trễ hạn chu kỳ -> bỏ qua kết quả chu kỳ này")
+                syn, conn = results.get('tcp', ({}, {}))
+                udp = results.get('udp', {})
+
+                self.process_cycle(syn, conn, udp, timings)
+                timings['total'] = time.perf_counter() - t0
+                period = timings['interval'] = self.next_interval()
+
+                now = loop.time()
+                next_tick += period
+                if now > next_tick:
+                    missed = int((now - next_tick) // period) + 1
+                    next_tick += missed * period
+                    self.overruns += missed
+                    timings['overrun'] = missed
+                    logging.warning(f"Chu kỳ quá hạn {timings['total']:.2f}s > {period}s -> bỏ qua {missed} mốc")
+                self._record_timings(timings)
+                self.maybe_save_state()
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            except asyncio.CancelledError:
+                expiry_task.cancel()
+                self.shutdown()
+                raise
+            except Exception as e:
+                logging.error(f"Lỗi main loop (async): {e}")
+                await asyncio.sleep(5)
+                next_tick = loop.time()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Firewall Auto Block (Threshold + Z-Score)")
+    parser.add_argument('--record', metavar='FILE',
+                        help="Ghi số đếm mỗi chu kỳ ra file capture để chạy lại bằng replay.py")
+    args = parser.parse_args()
+
     if os.geteuid() != 0:
         print("Cần chạy với quyền ROOT (sudo)!")
         sys.exit(1)
@@ -281,4 +1012,13 @@ if __name__ == "__main__":
         time.sleep(3)
 
     app = DosDetector()
-    app.run()
+    if args.record:
+        app.recorder = replay.CaptureWriter(args.record)
+        logging.info(f"Đang ghi capture vào {args.record}")
+    if app.config.run_mode == 'async':
+        try:
+            asyncio.run(app.run_async())
+        except KeyboardInterrupt:
+            print("\nDừng chương trình.")
+    else:
+        app.run()
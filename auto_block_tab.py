@@ -4,11 +4,14 @@ import subprocess
 import json
 import os
 
+import detector_config
+import ip_whitelist
+
 class AutoBlockTab:
     def __init__(self, parent):
         self.parent = parent
         # File config này phải khớp với file mà script chạy ngầm đọc
-        self.config_file = "/etc/firewall_auto_block.json" 
+        self.config_file = detector_config.CONFIG_FILE
         self.service_name = "firewall-auto-block"
         
         self.create_widgets()
@@ -69,7 +72,7 @@ class AutoBlockTab:
         
         self.new_ip_var = tk.StringVar()
         ttk.Entry(wl_ctrl, textvariable=self.new_ip_var, width=20).pack(side=tk.LEFT, padx=5)
-        ttk.Button(wl_ctrl, text="Thêm IP", command=self.add_whitelist_ip).pack(side=tk.LEFT, padx=5)
+        ttk.Button(wl_ctrl, text="Thêm IP/CIDR", command=self.add_whitelist_ip).pack(side=tk.LEFT, padx=5)
         ttk.Button(wl_ctrl, text="Xóa IP Đã Chọn", command=self.remove_whitelist_ip).pack(side=tk.RIGHT, padx=5)
         
         # Listbox
@@ -160,22 +163,24 @@ class AutoBlockTab:
                 'whitelist': list(self.whitelist_listbox.get(0, tk.END))
             }
             
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f, indent=4)
+            # Giữ nguyên các khóa khác trong file (backend, engine, ...)
+            detector_config.save_updates(config, self.config_file)
             
             messagebox.showinfo("Thành công", "Đã lưu cấu hình.\nNếu dịch vụ đang chạy, nó sẽ tự cập nhật ở chu kỳ tiếp theo.")
             
-        except ValueError:
-            messagebox.showerror("Lỗi nhập liệu", "Vui lòng nhập số nguyên hợp lệ cho các trường cấu hình.")
+        except ValueError as e:
+            messagebox.showerror("Lỗi nhập liệu", f"Vui lòng nhập số nguyên hợp lệ cho các trường cấu hình.\n{e}")
         except PermissionError:
              messagebox.showerror("Lỗi quyền", f"Không thể ghi file {self.config_file}.\nHãy chạy chương trình bằng sudo.")
 
     def add_whitelist_ip(self):
         ip = self.new_ip_var.get().strip()
         if not ip: return
-        # Validate sơ bộ
-        if ip.count('.') != 3:
-            messagebox.showwarning("Lỗi IP", "Định dạng IP không hợp lệ")
+        # Chấp nhận IP hoặc dải CIDR (IPv4/IPv6), lưu ở dạng chuẩn hóa
+        try:
+            ip = ip_whitelist.normalize(ip)
+        except ValueError as e:
+            messagebox.showwarning("Lỗi IP", f"Định dạng IP/CIDR không hợp lệ: {e}")
             return
         
         if ip not in self.whitelist_listbox.get(0, tk.END):
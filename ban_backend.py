@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Backend chặn IP dùng chung cho auto_block, web_dashboard và GUI
+- ipset: 1 set hash:net cho mỗi họ địa chỉ + 1 rule `-m set --match-set` (iptables/ip6tables),
+         timeout do kernel xử lý
+- nft  : 2 set (ipv4_addr, ipv6_addr; flags interval, timeout) trong bảng inet riêng
+- iptables: kiểu cũ, mỗi IP 1 rule DROP (chỉ dùng khi không có ipset/nft), IPv6 qua ip6tables
+IP/dải IPv6 (có dấu ':') tự được đưa vào set/bảng IPv6.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+
+CONFIG_FILE = '/etc/firewall_auto_block.json'
+
+SET_NAME = 'fw_blacklist'
+SET_NAME6 = 'fw_blacklist6'
+SET_MAXELEM = 1048576
+NFT_TABLE = 'firewall_auto'
+NFT_SET = 'blacklist4'
+NFT_SET6 = 'blacklist6'
+NFT_CHAIN = 'input'
+
+
+def _run(cmd, check=True):
+    return subprocess.run(cmd, capture_output=True, text=True, check=check)
+
+
+def _restore(cmd, script):
+    """Đẩy cả lô lệnh qua stdin của 1 tiến trình duy nhất"""
+    return subprocess.run(cmd, input=script, capture_output=True, text=True, check=True)
+
+
+def _is_v6(ip):
+    return ':' in ip
+
+
+class BatchError(Exception):
+    """Lô chỉ được áp dụng một phần. `failed`: các IP (thêm hoặc gỡ) chưa được áp dụng,
+    phần còn lại của lô đã có hiệu lực trên firewall."""
+
+    def __init__(self, message, failed):
+        super().__init__(message)
+        self.failed = set(failed)
+
+
+class BanBatch:
+    """Gom các quyết định chặn/gỡ chặn của 1 chu kỳ để áp dụng trong 1 giao dịch"""
+
+    def __init__(self):
+        self.adds = {}      # ip -> (timeout, reason)
+        self.removes = {}   # ip -> (thời điểm bị chặn, thời điểm hết hạn | None) để khôi phục nếu lỗi
+
+    def add(self, ip, timeout, reason=''):
+        self.removes.pop(ip, None)
+        self.adds[ip] = (int(timeout), reason)
+
+    def remove(self, ip, banned_at=None, expires_at=None):
+        if self.adds.pop(ip, None) is None:
+            self.removes[ip] = (banned_at, expires_at)
+
+    def clear(self):
+        self.adds.clear()
+        self.removes.clear()
+
+    def __len__(self):
+        return len(self.adds) + len(self.removes)
+
+
+class IpsetBackend:
+    name = 'ipset'
+    kernel_timeouts = True
+
+    def ensure(self):
+        _run(['ipset', 'create', SET_NAME, 'hash:net', 'timeout', '0',
+              'maxelem', str(SET_MAXELEM), '-exist'])
+        rule = ['INPUT', '-m', 'set', '--match-set', SET_NAME, 'src', '-j', 'DROP']
+        if _run(['iptables', '-C'] + rule, check=False).returncode != 0:
+            _run(['iptables', '-I', 'INPUT', '1'] + rule[1:])
+        # Máy tắt IPv6 / không có ip6tables -> vẫn chặn được IPv4
+        try:
+            _run(['ipset', 'create', SET_NAME6, 'hash:net', 'family', 'inet6', 'timeout', '0',
+                  'maxelem', str(SET_MAXELEM), '-exist'])
+            rule6 = ['INPUT', '-m', 'set', '--match-set', SET_NAME6, 'src', '-j', 'DROP']
+            if _run(['ip6tables', '-C'] + rule6, check=False).returncode != 0:
+                _run(['ip6tables', '-I', 'INPUT', '1'] + rule6[1:])
+        except (OSError, subprocess.CalledProcessError):
+            pass
+
+    @staticmethod
+    def _set(ip):
+        return SET_NAME6 if _is_v6(ip) else SET_NAME
+
+    def add(self, ip, timeout=0):
+        """timeout=0 -> chặn vĩnh viễn"""
+        _run(['ipset', 'add', self._set(ip), ip, 'timeout', str(int(timeout)), '-exist'])
+
+    def remove(self, ip):
+        _run(['ipset', 'del', self._set(ip), ip, '-exist'])
+
+    def test(self, ip):
+        return _run(['ipset', 'test', self._set(ip), ip], check=False).returncode == 0
+
+    def apply_batch(self, adds, removes, restore_timeouts=None):
+        """adds: [(ip, timeout)], removes: [ip]. ipset restore không nguyên tử
+        nên khi lỗi sẽ chạy lô ngược lại để hoàn tác; IP đã gỡ được thêm lại với
+        restore_timeouts[ip] giây còn lại (0 = vĩnh viễn) để lệnh chặn tạm không thành vĩnh viễn."""
+        restore_timeouts = restore_timeouts or {}
+        lines = [f"add {self._set(ip)} {ip} timeout {int(t)}" for ip, t in adds]
+        lines += [f"del {self._set(ip)} {ip}" for ip in removes]
+        try:
+            _restore(['ipset', 'restore', '-exist'], '\n'.join(lines) + '\n')
+        except subprocess.CalledProcessError as e:
+            undo = [f"del {self._set(ip)} {ip}" for ip, _ in adds]
+            undo += [f"add {self._set(ip)} {ip} timeout {int(restore_timeouts.get(ip, 0))}" for ip in removes]
+            res = subprocess.run(['ipset', 'restore', '-exist'], input='\n'.join(undo) + '\n',
+                                 capture_output=True, text=True)
+            if res.returncode != 0:
+                raise BatchError(f"ipset restore lỗi ({(e.stderr or '').strip()}), hoàn tác cũng lỗi "
+                                 f"({res.stderr.strip()}) -> set có thể lệch sổ sách",
+                                 [ip for ip, _ in adds] + list(removes)) from e
+            raise
+
+    def list(self):
+        """Trả về {ip: số giây còn lại (None = vĩnh viễn)}"""
+        entries = {}
+        res = _run(['ipset', 'save', SET_NAME], check=False)
+        res6 = _run(['ipset', 'save', SET_NAME6], check=False)
+        for line in (res.stdout + res6.stdout).splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and parts[0] == 'add':
+                remaining = None
+                if 'timeout' in parts:
+                    val = int(parts[parts.index('timeout') + 1])
+                    remaining = val if val > 0 else None
+                entries[parts[2]] = remaining
+        return entries
+
+    def count(self):
+        return len(self.list())
+
+
+class NftSetBackend:
+    name = 'nft'
+    kernel_timeouts = True
+
+    def ensure(self):
+        script = (
+            f"table inet {NFT_TABLE} {{\n"
+            f"  set {NFT_SET} {{ type ipv4_addr; flags interval, timeout; }}\n"
+            f"  set {NFT_SET6} {{ type ipv6_addr; flags interval, timeout; }}\n"
+            f"  chain {NFT_CHAIN} {{ type filter hook input priority -10; policy accept;\n"
+            f"    ip saddr @{NFT_SET} drop\n"
+            f"    ip6 saddr @{NFT_SET6} drop\n"
+            f"  }}\n"
+            f"}}\n"
+        )
+        if _run(['nft', 'list', 'table', 'inet', NFT_TABLE], check=False).returncode != 0:
+            subprocess.run(['nft', '-f', '-'], input=script, text=True, capture_output=True, check=True)
+        elif _run(['nft', 'list', 'set', 'inet', NFT_TABLE, NFT_SET6], check=False).returncode != 0:
+            # Bảng tạo từ bản cũ chỉ có set IPv4 -> bổ sung set + rule IPv6 trong 1 giao dịch
+            script = (
+                f"add set inet {NFT_TABLE} {NFT_SET6} {{ type ipv6_addr; flags interval, timeout; }}\n"
+                f"add rule inet {NFT_TABLE} {NFT_CHAIN} ip6 saddr @{NFT_SET6} drop\n"
+            )
+            subprocess.run(['nft', '-f', '-'], input=script, text=True, capture_output=True, check=True)
+
+    @staticmethod
+    def _set(ip):
+        return NFT_SET6 if _is_v6(ip) else NFT_SET
+
+    def add(self, ip, timeout=0):
+        elem = f"{ip} timeout {int(timeout)}s" if timeout else ip
+        _run(['nft', 'add', 'element', 'inet', NFT_TABLE, self._set(ip), '{ ' + elem + ' }'])
+
+    def remove(self, ip):
+        _run(['nft', 'delete', 'element', 'inet', NFT_TABLE, self._set(ip), '{ ' + ip + ' }'], check=False)
+
+    def test(self, ip):
+        return _run(['nft', 'get', 'element', 'inet', NFT_TABLE, self._set(ip), '{ ' + ip + ' }'],
+                    check=False).returncode == 0
+
+    def apply_batch(self, adds, removes, restore_timeouts=None):
+        """nft -f là 1 giao dịch nguyên tử (cả 2 set): lỗi thì kernel không áp dụng gì
+        (không cần restore_timeouts).
+        Xóa trước, thêm sau: set có flags interval nên thêm 1 dải khi các IP/dải con của nó
+        (đang được gộp lại) vẫn còn trong set sẽ bị nft từ chối vì chồng lấn."""
+        lines = [f"delete element inet {NFT_TABLE} {self._set(ip)} {{ {ip} }}" for ip in removes]
+        for ip, t in adds:
+            elem = f"{ip} timeout {int(t)}s" if t else ip
+            lines.append(f"add element inet {NFT_TABLE} {self._set(ip)} {{ {elem} }}")
+        _restore(['nft', '-f', '-'], '\n'.join(lines) + '\n')
+
+    def list(self):
+        entries = {}
+        items = []
+        for set_name in (NFT_SET, NFT_SET6):
+            res = _run(['nft', '-j', 'list', 'set', 'inet', NFT_TABLE, set_name], check=False)
+            try:
+                items += json.loads(res.stdout).get('nftables', [])
+            except ValueError:
+                continue
+        for item in items:
+            for elem in item.get('set', {}).get('elem', []):
+                remaining = None
+                if isinstance(elem, dict) and 'elem' in elem:
+                    remaining = elem['elem'].get('expires')
+                    elem = elem['elem']['val']
+                if isinstance(elem, dict) and 'prefix' in elem:
+                    elem = f"{elem['prefix']['addr']}/{elem['prefix']['len']}"
+                entries[str(elem)] = remaining
+        return entries
+
+    def count(self):
+        return len(self.list())
+
+
+class IptablesBackend:
+    """Kiểu cũ: mỗi IP 1 rule DROP ở đầu chain INPUT, hết hạn do detector tự gỡ"""
+    name = 'iptables'
+    kernel_timeouts = False
+
+    def ensure(self):
+        pass
+
+    @staticmethod
+    def _cmd(ip):
+        return 'ip6tables' if _is_v6(ip) else 'iptables'
+
+    def add(self, ip, timeout=0):
+        if not self.test(ip):
+            _run([self._cmd(ip), '-I', 'INPUT', '1', '-s', ip, '-j', 'DROP'])
+
+    def remove(self, ip):
+        _run([self._cmd(ip), '-D', 'INPUT', '-s', ip, '-j', 'DROP'])
+
+    def test(self, ip):
+        return _run([self._cmd(ip), '-C', 'INPUT', '-s', ip, '-j', 'DROP'], check=False).returncode == 0
+
+    @staticmethod
+    def _drop_rules(cmd):
+        """{nguồn: số rule DROP} đang có trong chain INPUT (1 lần `-S` cho cả lô, không test từng IP)"""
+        rules = {}
+        for line in _run([cmd, '-S', 'INPUT']).stdout.splitlines():
+            parts = line.split()
+            if parts[:2] != ['-A', 'INPUT'] or parts[2:3] != ['-s'] or parts[4:] != ['-j', 'DROP']:
+                continue
+            src = parts[3]
+            src = src.rsplit('/', 1)[0] if src.endswith(('/32', '/128')) else src
+            rules[src] = rules.get(src, 0) + 1
+        return rules
+
+    def apply_batch(self, adds, removes, restore_timeouts=None):
+        """Mỗi họ địa chỉ 1 lần iptables-restore/ip6tables-restore --noflush (COMMIT nguyên tử
+        trong từng họ, không nguyên tử giữa 2 họ). Bỏ qua IP đã có rule (không tạo rule trùng)
+        và IP đã bị gỡ rule bằng tay (-D của rule không tồn tại làm hỏng cả COMMIT).
+        Họ nào lỗi thì ném BatchError chỉ với các IP của họ đó."""
+        failed, errors = set(), []
+        for tool, v6 in (('iptables', False), ('ip6tables', True)):
+            family_adds = [ip for ip, _ in adds if _is_v6(ip) == v6]
+            family_removes = [ip for ip in removes if _is_v6(ip) == v6]
+            if not family_adds and not family_removes:
+                continue
+            try:
+                existing = self._drop_rules(tool)
+                lines = ['*filter']
+                lines += [f"-I INPUT -s {ip} -j DROP" for ip in family_adds if ip not in existing]
+                # Gỡ hết các rule trùng còn sót lại của IP (nếu có)
+                lines += [f"-D INPUT -s {ip} -j DROP"
+                          for ip in family_removes for _ in range(existing.get(ip, 0))]
+                if len(lines) > 1:
+                    lines.append('COMMIT')
+                    _restore([f'{tool}-restore', '--noflush'], '\n'.join(lines) + '\n')
+            except (OSError, subprocess.CalledProcessError) as e:
+                failed.update(family_adds + family_removes)
+                errors.append(f"{tool}: {(getattr(e, 'stderr', None) or str(e)).strip()}")
+        if failed:
+            raise BatchError('; '.join(errors), failed)
+
+    def list(self):
+        entries = {}
+        for cmd, any_addr in (('iptables', '0.0.0.0/0'), ('ip6tables', '::/0')):
+            try:
+                res = _run([cmd, '-L', 'INPUT', '-n'], check=False)
+            except OSError:
+                continue
+            for line in res.stdout.splitlines():
+                parts = line.split()
+                if not parts or parts[0] != 'DROP':
+                    continue
+                # Cột "opt" của ip6tables có thể để trống -> lấy địa chỉ đầu tiên (nguồn)
+                sep = ':' if _is_v6(any_addr) else '.'
+                src = next((p for p in parts[2:] if sep in p), None)
+                if src and src != any_addr:
+                    entries[src[:-4] if src.endswith('/128') else src] = None
+        return entries
+
+    def count(self):
+        return len(self.list())
+
+
+class RecordingBackend:
+    """Backend giả trong bộ nhớ (không đụng firewall) cho chế độ replay/thử nghiệm.
+    Ghi lại mọi thao tác vào `events` dạng (thời điểm, 'ban'|'unban', ip, timeout)."""
+    name = 'recording'
+    kernel_timeouts = False
+
+    def __init__(self, clock=None):
+        self.clock = clock
+        self.banned = {}
+        self.events = []
+
+    def _now(self):
+        return self.clock() if self.clock else 0.0
+
+    def ensure(self):
+        pass
+
+    def add(self, ip, timeout=0):
+        self.banned[ip] = timeout
+        self.events.append((self._now(), 'ban', ip, int(timeout)))
+
+    def remove(self, ip):
+        self.banned.pop(ip, None)
+        self.events.append((self._now(), 'unban', ip, 0))
+
+    def test(self, ip):
+        return ip in self.banned
+
+    def apply_batch(self, adds, removes, restore_timeouts=None):
+        for ip, timeout in adds:
+            self.add(ip, timeout)
+        for ip in removes:
+            self.remove(ip)
+
+    def list(self):
+        return {ip: None for ip in self.banned}
+
+    def count(self):
+        return len(self.banned)
+
+
+BACKENDS = {
+    'ipset': IpsetBackend,
+    'nft': NftSetBackend,
+    'iptables': IptablesBackend,
+}
+
+
+def get_backend(preferred='auto'):
+    """Chọn backend: 'auto' ưu tiên ipset, rồi nft, cuối cùng là iptables"""
+    if preferred in BACKENDS:
+        return BACKENDS[preferred]()
+    if shutil.which('ipset'):
+        return IpsetBackend()
+    if shutil.which('nft'):
+        return NftSetBackend()
+    return IptablesBackend()
+
+
+def load_configured_backend(config_file=CONFIG_FILE):
+    """Backend theo khóa 'ban_backend' trong file config, đã tạo sẵn set/rule"""
+    preferred = 'auto'
+    try:
+        if os.path.exists(config_file):
+            with open(config_file, 'r') as f:
+                preferred = json.load(f).get('ban_backend', 'auto')
+    except Exception:
+        pass
+    backend = get_backend(preferred)
+    try:
+        backend.ensure()
+    except Exception:
+        pass
+    return backend
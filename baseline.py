@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Baseline trượt O(1) cho Z-Score theo từng IP
+Thay cho deque + statistics.mean/stdev: giữ tổng và tổng bình phương của cửa sổ,
+mỗi lần thêm mẫu chỉ cộng mẫu mới / trừ mẫu cũ bị đẩy ra.
+Số đếm là số nguyên nên các tổng là chính xác, không bị sai số tích lũy.
+BaselineStore giới hạn số IP theo ngân sách bộ nhớ (LRU) và tự xóa IP lâu không xuất hiện (TTL).
+"""
+
+import math
+import sys
+from array import array
+from collections import OrderedDict
+
+HISTORY_LEN = 20
+MIN_SAMPLES = 5
+
+
+class RollingWindow:
+    """Cửa sổ HISTORY_LEN mẫu gần nhất, mean/variance cập nhật O(1)"""
+    __slots__ = ('values', 'size', 'pos', 'n', 'total', 'total_sq', 'last_seen')
+
+    def __init__(self, size=HISTORY_LEN):
+        self.values = array('q', bytes(8 * size))
+        self.size = size
+        self.pos = 0
+        self.n = 0
+        self.total = 0
+        self.total_sq = 0
+        self.last_seen = 0
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        # Thứ tự từ cũ đến mới (giống deque)
+        start = self.pos - self.n
+        for i in range(start, self.pos):
+            yield self.values[i % self.size]
+
+    def push(self, x):
+        x = int(x)
+        if self.n == self.size:
+            old = self.values[self.pos]
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.n += 1
+        self.values[self.pos] = x
+        self.pos = (self.pos + 1) % self.size
+        self.total += x
+        self.total_sq += x * x
+
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+    def variance(self):
+        """Phương sai mẫu (chia n-1) giống statistics.variance"""
+        n = self.n
+        if n < 2:
+            return 0.0
+        return (n * self.total_sq - self.total * self.total) / (n * (n - 1))
+
+    def z_score(self, current_val, min_samples=MIN_SAMPLES):
+        if self.n < min_samples:
+            return 0.0
+        var = self.variance()
+        if var <= 0:
+            return 0.0
+        return (current_val - self.total / self.n) / math.sqrt(var)
+
+
+def estimate_key_bytes(window_size=HISTORY_LEN):
+    """Ước lượng bộ nhớ cho 1 IP: cửa sổ + mảng + nút OrderedDict + chuỗi IP"""
+    w = RollingWindow(window_size)
+    return sys.getsizeof(w) + sys.getsizeof(w.values) + 100 + sys.getsizeof('255.255.255.255')
+
+
+class BaselineStore:
+    """ip -> RollingWindow, giới hạn bằng LRU + TTL tính theo chu kỳ kiểm tra
+
+    - max_keys: số IP tối đa (thường suy ra từ ngân sách bộ nhớ), vượt thì bỏ IP ít dùng nhất
+    - ttl_cycles: IP không xuất hiện quá số chu kỳ này thì bị xóa khi gọi tick()
+    """
+
+    def __init__(self, window_size=HISTORY_LEN, max_keys=0, ttl_cycles=0):
+        self.window_size = window_size
+        self.max_keys = max_keys          # 0 = không giới hạn
+        self.ttl_cycles = ttl_cycles      # 0 = không hết hạn
+        self.cycle = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+
+    def set_memory_budget(self, budget_bytes):
+        self.max_keys = max(1, int(budget_bytes // estimate_key_bytes(self.window_size))) if budget_bytes > 0 else 0
+        self._shrink()
+
+    def __getitem__(self, key):
+        """Lấy (hoặc tạo) cửa sổ của IP và đánh dấu vừa được dùng"""
+        data = self._data
+        window = data.get(key)
+        if window is None:
+            window = data[key] = RollingWindow(self.window_size)
+            self._shrink()
+        else:
+            data.move_to_end(key)
+        window.last_seen = self.cycle
+        return window
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def items(self):
+        return self._data.items()
+
+    def _shrink(self):
+        if self.max_keys:
+            data = self._data
+            while len(data) > self.max_keys:
+                data.popitem(last=False)
+                self.evictions += 1
+
+    def tick(self):
+        """Sang chu kỳ mới: xóa các IP đã quá ttl_cycles không xuất hiện.
+        Thứ tự LRU trùng thứ tự last_seen nên chỉ cần duyệt từ đầu danh sách."""
+        self.cycle += 1
+        if not self.ttl_cycles:
+            return 0
+        limit = self.cycle - self.ttl_cycles
+        data = self._data
+        removed = 0
+        while data:
+            key = next(iter(data))
+            if data[key].last_seen >= limit:
+                break
+            del data[key]
+            removed += 1
+        self.expirations += removed
+        return removed
+
+    def stats(self):
+        return {'live_keys': len(self._data), 'evictions': self.evictions, 'expirations': self.expirations}
+
+    def export(self):
+        """(ip, [mẫu cũ -> mới], số chu kỳ chưa xuất hiện) theo thứ tự LRU - dùng cho snapshot"""
+        cycle = self.cycle
+        return [(ip, list(w), cycle - w.last_seen) for ip, w in self._data.items()]
+
+    def load(self, entries):
+        """Nạp lại kết quả của export() (cũ -> mới), bỏ mẫu thừa nếu cửa sổ nhỏ hơn"""
+        data = self._data
+        for ip, values, age in entries:
+            w = RollingWindow(self.window_size)
+            for v in values[-self.window_size:]:
+                w.push(v)
+            w.last_seen = self.cycle - age
+            data[ip] = w
+            data.move_to_end(ip)
+        self._shrink()
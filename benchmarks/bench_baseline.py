@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+So sánh baseline Z-Score cũ (deque + statistics.mean/stdev) với RollingWindow O(1)
+Chạy: python3 benchmarks/bench_baseline.py [số_key] [số_chu_kỳ]
+"""
+
+import argparse
+import os
+import sys
+import time
+import random
+import statistics
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from baseline import BaselineStore, HISTORY_LEN, MIN_SAMPLES
+
+Z_THRESHOLD = 3.0
+
+
+def old_z_score(history, current_val):
+    """Bản sao cách tính cũ trong auto_block.calculate_z_score"""
+    if len(history) < MIN_SAMPLES:
+        return 0.0
+    try:
+        mean = statistics.mean(history)
+        stdev = statistics.stdev(history)
+        if stdev == 0: return 0.0
+        return (current_val - mean) / stdev
+    except:
+        return 0.0
+
+
+def gen_cycles(n_keys, n_cycles):
+    rnd = random.Random(1)
+    base = [rnd.randint(1, 60) for _ in range(n_keys)]
+    cycles = []
+    for c in range(n_cycles):
+        # Thỉnh thoảng có đột biến để Z-Score vượt ngưỡng
+        cycles.append([b + rnd.randint(0, 5) + (400 if rnd.random() < 0.001 else 0) for b in base])
+    return cycles
+
+
+def run_old(cycles):
+    store = defaultdict(lambda: deque(maxlen=HISTORY_LEN))
+    flagged = []
+    t0 = time.perf_counter()
+    for values in cycles:
+        for key, count in enumerate(values):
+            store[key].append(count)
+            if old_z_score(store[key], count) > Z_THRESHOLD:
+                flagged.append(key)
+    return time.perf_counter() - t0, flagged
+
+
+def run_new(cycles):
+    store = BaselineStore(HISTORY_LEN)
+    flagged = []
+    t0 = time.perf_counter()
+    for values in cycles:
+        for key, count in enumerate(values):
+            window = store[key]
+            window.push(count)
+            if window.z_score(count, MIN_SAMPLES) > Z_THRESHOLD:
+                flagged.append(key)
+    return time.perf_counter() - t0, flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh baseline Z-Score cũ với RollingWindow O(1)")
+    parser.add_argument('n_keys', nargs='?', type=int, default=100000, help="số key (IP nguồn)")
+    parser.add_argument('n_cycles', nargs='?', type=int, default=25, help="số chu kỳ")
+    args = parser.parse_args()
+    if args.n_keys < 1 or args.n_cycles < 1:
+        parser.error("số key và số chu kỳ phải >= 1")
+    n_keys, n_cycles = args.n_keys, args.n_cycles
+    cycles = gen_cycles(n_keys, n_cycles)
+    ops = n_keys * n_cycles
+
+    t_old, f_old = run_old(cycles)
+    t_new, f_new = run_new(cycles)
+    print(f"{n_keys} key x {n_cycles} chu kỳ = {ops} lần cập nhật")
+    print(f"deque + statistics : {t_old:8.2f} s  -> {ops / t_old:12,.0f} cập nhật/s")
+    print(f"RollingWindow O(1) : {t_new:8.2f} s  -> {ops / t_new:12,.0f} cập nhật/s  (x{t_old / t_new:.1f})")
+    print(f"Quyết định trùng khớp: {f_old == f_new} ({len(f_new)} lần vượt ngưỡng)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark tốc độ giải mã sock_diag (netlink) so với phân tích text của `ss`
+Chạy: python3 benchmarks/bench_netlink.py [số_socket]
+"""
+
+import argparse
+import os
+import sys
+import socket
+import struct
+import time
+import random
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import netlink_diag
+from netlink_diag import NLMSG_HDR, SOCK_DIAG_BY_FAMILY, NLMSG_DONE, TCP_SYN_RECV, TCP_ESTABLISHED
+
+CHUNK = 32 * 1024           # Kernel trả về từng datagram khoảng 32KB
+MSG_PAYLOAD = 72            # sizeof(struct inet_diag_msg)
+
+
+def make_msg(family, state, src, dst, sport, dport):
+    payload = bytearray(MSG_PAYLOAD)
+    payload[0] = family
+    payload[1] = state
+    struct.pack_into('!HH', payload, 4, sport, dport)
+    payload[8:8 + len(src)] = src
+    payload[24:24 + len(dst)] = dst
+    return NLMSG_HDR.pack(16 + MSG_PAYLOAD, SOCK_DIAG_BY_FAMILY, 2, 1, 0) + bytes(payload)
+
+
+def synth_dump(n_sockets, n_sources, v6_ratio=0.2):
+    """Sinh các datagram netlink giả lập (khoảng 1/2 SYN-RECV, 1/2 ESTABLISHED)"""
+    rnd = random.Random(42)
+    local4 = socket.inet_pton(socket.AF_INET, '10.0.0.1')
+    local6 = socket.inet_pton(socket.AF_INET6, '2001:db8::1')
+    sources = []
+    for i in range(n_sources):
+        if rnd.random() < v6_ratio:
+            sources.append((socket.AF_INET6, socket.inet_pton(socket.AF_INET6, f'2001:db8:1::{i:x}')))
+        else:
+            sources.append((socket.AF_INET, struct.pack('!I', 0x0B000000 + i)))
+    chunks, cur = [], []
+    cur_len = 0
+    for i in range(n_sockets):
+        family, src = sources[rnd.randrange(n_sources)]
+        local = local4 if family == socket.AF_INET else local6
+        state = TCP_SYN_RECV if i & 1 else TCP_ESTABLISHED
+        msg = make_msg(family, state, local, src, 80, 1024 + (i % 60000))
+        if cur_len + len(msg) > CHUNK:
+            chunks.append(b''.join(cur))
+            cur, cur_len = [], 0
+        cur.append(msg)
+        cur_len += len(msg)
+    cur.append(NLMSG_HDR.pack(20, NLMSG_DONE, 2, 1, 0) + b'\x00' * 4)
+    chunks.append(b''.join(cur))
+    return chunks
+
+
+def synth_ss_lines(n_sockets, n_sources):
+    rnd = random.Random(42)
+    lines = []
+    for i in range(n_sockets):
+        src = rnd.randrange(n_sources)
+        lines.append(f"0      0      10.0.0.1:80      11.{src >> 16 & 255}.{src >> 8 & 255}.{src & 255}:{1024 + i % 60000}")
+    return lines
+
+
+def bench_netlink(chunks, n_sockets):
+    syn, conn = defaultdict(int), defaultdict(int)
+    t0 = time.perf_counter()
+    for buf in chunks:
+        netlink_diag.parse_dump(buf, syn, conn)
+    syn_s = netlink_diag.SockDiagCollector._to_str_keys(syn, ())
+    conn_s = netlink_diag.SockDiagCollector._to_str_keys(conn, ())
+    elapsed = time.perf_counter() - t0
+    assert sum(syn_s.values()) + sum(conn_s.values()) == n_sockets
+    return elapsed
+
+
+def bench_ss(lines):
+    from auto_block import DosDetector
+    detector = DosDetector.__new__(DosDetector)
+    stats = defaultdict(int)
+    t0 = time.perf_counter()
+    for line in lines:
+        detector._parse_ss_line(line, stats, [])
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark giải mã sock_diag so với phân tích text của ss")
+    parser.add_argument('n_sockets', nargs='?', type=int, default=200000, help="số socket giả lập")
+    args = parser.parse_args()
+    if args.n_sockets < 1:
+        parser.error("số socket phải >= 1")
+    n_sockets = args.n_sockets
+    n_sources = max(1, n_sockets // 10)
+    chunks = synth_dump(n_sockets, n_sources)
+    lines = synth_ss_lines(n_sockets, n_sources)
+
+    t_nl = bench_netlink(chunks, n_sockets)
+    t_ss = bench_ss(lines)
+    print(f"Số socket: {n_sockets}, số IP nguồn: {n_sources}")
+    print(f"netlink parse : {t_nl * 1000:8.1f} ms  -> {n_sockets / t_nl:12,.0f} socket/s")
+    print(f"ss text parse : {t_ss * 1000:8.1f} ms  -> {n_sockets / t_ss:12,.0f} socket/s (chưa tính thời gian fork ss)")
+
+
+if __name__ == '__main__':
+    main()
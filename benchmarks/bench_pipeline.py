@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Benchmark các bước nóng của auto_block trên dữ liệu tổng hợp
+- parse_ss       : DosDetector._parse_ss_line trên output giả của `ss -nt state ...`
+- parse_conntrack: DosDetector.get_udp_stats đọc file giả dạng /proc/net/nf_conntrack
+- entropy        : calculate_entropy trên bảng đếm theo IP
+- z_score        : cập nhật cửa sổ + calculate_z_score cho mọi IP
+- analyze        : analyze_and_block 1 chu kỳ (đã có lịch sử), engine python và numpy
+Mỗi bước báo ops/s và bộ nhớ đỉnh (tracemalloc, đo ở lượt chạy riêng), ghi JSON để so sánh giữa các commit.
+
+Chạy:
+  python3 benchmarks/bench_pipeline.py --sizes 1000,100000,1000000 --dist uniform,zipf,attack -o new.json
+  python3 benchmarks/bench_pipeline.py -o new.json --compare old.json   # exit 1 nếu chậm hơn quá ngưỡng
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Không ghi log benchmark vào /var/log của detector
+logging.basicConfig(level=logging.ERROR, stream=sys.stderr)
+
+import auto_block
+import ban_backend
+import detector_config
+import numpy_engine
+from baseline import BaselineStore
+from conntrack_reader import ConntrackReader
+
+DISTRIBUTIONS = ('uniform', 'zipf', 'attack')
+MIN_SAMPLES = auto_block.MIN_SAMPLES
+
+
+def source_names(n_sources, seed):
+    rnd = random.Random(seed)
+    return [f"{rnd.randint(1, 223)}.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(n_sources)]
+
+
+def pick_sources(dist, rows, names, seed, zipf_s=1.1, attackers=10, attack_share=0.9):
+    """Danh sách IP nguồn cho `rows` dòng theo phân phối:
+    uniform = đều; zipf = lệch (vài IP chiếm phần lớn); attack = attack_share số dòng từ vài IP"""
+    rnd = random.Random(seed)
+    n = len(names)
+    if dist == 'uniform':
+        return [names[rnd.randrange(n)] for _ in range(rows)]
+    if dist == 'zipf':
+        cum = list(itertools.accumulate(1.0 / (r ** zipf_s) for r in range(1, n + 1)))
+        return rnd.choices(names, cum_weights=cum, k=rows)
+    if dist == 'attack':
+        hot = names[:attackers]
+        return [rnd.choice(hot) if rnd.random() < attack_share else names[rnd.randrange(n)]
+                for _ in range(rows)]
+    raise ValueError(f"phân phối không hỗ trợ: {dist}")
+
+
+def ss_lines(sources):
+    lines = ["Recv-Q Send-Q Local Address:Port Peer Address:Port Process"]
+    for i, ip in enumerate(sources):
+        lines.append(f"0      0      10.0.0.1:443  {ip}:{1024 + i % 60000}")
+    return lines
+
+
+def conntrack_file(sources, directory):
+    path = os.path.join(directory, 'nf_conntrack')
+    with open(path, 'w') as f:
+        for i, ip in enumerate(sources):
+            f.write(f"ipv4     2 udp      17 29 src={ip} dst=10.0.0.1 sport={1024 + i % 60000} dport=53 "
+                    f"[UNREPLIED] src=10.0.0.1 dst={ip} sport=53 dport={1024 + i % 60000} mark=0 zone=0 use=2\n")
+    return path
+
+
+def make_detector(engine, tmpdir):
+    settings = detector_config.DEFAULT_SETTINGS._replace(metrics_listen='', state_file='', ipc_socket='',
+                                                         stats_ring='', history_file='', analysis_engine=engine,
+                                                         whitelist=frozenset())
+    return auto_block.DosDetector(settings=settings, backend=ban_backend.RecordingBackend(),
+                                  alert_file=os.path.join(tmpdir, f'alerts_{engine}.jsonl'))
+
+
+def measure(func, with_memory, repeat=1):
+    """Thời gian tốt nhất của `repeat` lần chạy func(), thêm 1 lần dưới tracemalloc để lấy bộ nhớ đỉnh"""
+    with contextlib.redirect_stdout(io.StringIO()):     # Bỏ các dòng [DEBUG] của analyze
+        elapsed = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func()
+            elapsed = min(elapsed, time.perf_counter() - t0)
+        peak = None
+        if with_memory:
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return elapsed, peak
+
+
+def warm_store(detector, counts, cycles=MIN_SAMPLES):
+    """Lịch sử đã có đủ mẫu để Z-Score có nghĩa (không tính thời gian)"""
+    store_cls = numpy_engine.VectorEngine if detector.use_numpy else BaselineStore
+    store = store_cls(auto_block.HISTORY_LEN)
+    rnd = random.Random(3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(cycles):
+            noisy = {ip: max(0, c + rnd.randint(-2, 2)) for ip, c in counts.items()}
+            if detector.use_numpy:
+                store.evaluate(noisy, 10 ** 9, 3, 3.0, MIN_SAMPLES)
+            else:
+                for ip, c in noisy.items():
+                    store[ip].push(c)
+    return store
+
+
+def bench_case(rows, dist, n_sources, seed, detectors, engines, with_memory, repeat, tmpdir):
+    names = source_names(n_sources, seed)
+    sources = pick_sources(dist, rows, names, seed)
+    lines = ss_lines(sources)
+    py = detectors['python']
+    results = []
+
+    def record(stage, ops, elapsed, peak, engine=None):
+        results.append({
+            'stage': stage, 'rows': rows, 'dist': dist, 'engine': engine, 'ops': ops,
+            'seconds': round(elapsed, 6), 'ops_per_s': round(ops / elapsed, 1) if elapsed > 0 else None,
+            'peak_mb': round(peak / 1048576, 3) if peak is not None else None,
+        })
+
+    def parse_ss():
+        stats = defaultdict(int)
+        for line in lines[1:]:
+            py._parse_ss_line(line, stats, py.config.whitelist)
+        return stats
+    record('parse_ss', rows, *measure(parse_ss, with_memory, repeat))
+
+    py.conntrack = ConntrackReader(proc_path=conntrack_file(sources, tmpdir))
+    record('parse_conntrack', rows, *measure(py.get_udp_stats, with_memory, repeat))
+
+    counts = parse_ss()
+    n = len(counts)
+    record('entropy', n, *measure(lambda: py.calculate_entropy(counts), with_memory, repeat))
+
+    def z_scores():
+        store = BaselineStore(auto_block.HISTORY_LEN)
+        for ip, c in counts.items():
+            window = store[ip]
+            window.push(c)
+            py.calculate_z_score(window, c)
+    record('z_score', n, *measure(z_scores, with_memory, repeat))
+
+    threshold = detector_config.DEFAULT_SETTINGS.syn_threshold
+    for engine in engines:
+        det = detectors[engine]
+
+        def analyze(store):
+            t0 = time.perf_counter()
+            det.analyze_and_block(counts, store, threshold, "SYN Flood")
+            elapsed = time.perf_counter() - t0
+            det.banned_ips.clear()
+            det.pending.clear()
+            return elapsed
+        # Chỉ tính analyze_and_block, không tính bước làm nóng lịch sử
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = min(analyze(warm_store(det, counts)) for _ in range(repeat))
+            peak = None
+            if with_memory:
+                store = warm_store(det, counts)
+                tracemalloc.start()
+                analyze(store)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        record('analyze', n, elapsed, peak, engine)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """In tỉ lệ ops/s mới/cũ cho từng bước; trả về số bước chậm hơn quá `tolerance`"""
+    with open(baseline_path) as f:
+        old = json.load(f)
+    key = lambda r: (r['stage'], r['rows'], r['dist'], r.get('engine'))
+    old_map = {key(r): r for r in old['results']}
+    regressions = 0
+    print(f"\nSo với {baseline_path} (commit {old['meta'].get('commit')}):")
+    for r in results:
+        o = old_map.get(key(r))
+        if not o or not o.get('ops_per_s') or not r.get('ops_per_s'):
+            continue
+        ratio = r['ops_per_s'] / o['ops_per_s']
+        flag = ''
+        if ratio < 1 - tolerance:
+            flag = '  <-- CHẬM HƠN'
+            regressions += 1
+        print(f"  {r['stage']:<16}{r['rows']:>9} {r['dist']:<8}{(r.get('engine') or ''):<7} x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các bước parse/quyết định của auto_block")
+    parser.add_argument('--sizes', default='1000,100000,1000000', help="số dòng, phân cách bởi dấu phẩy")
+    parser.add_argument('--dist', default='uniform,zipf,attack', help=f"phân phối: {', '.join(DISTRIBUTIONS)}")
+    parser.add_argument('--source-ratio', type=float, default=0.1, help="số IP nguồn = số dòng x tỉ lệ này")
+    parser.add_argument('--engines', default='python,numpy', help="engine cho bước analyze")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help="lấy thời gian tốt nhất của N lần chạy")
+    parser.add_argument('--no-memory', action='store_true', help="bỏ lượt đo bộ nhớ (nhanh gấp đôi)")
+    parser.add_argument('-o', '--output', help="ghi kết quả JSON ra file")
+    parser.add_argument('--compare', help="file JSON cũ để so sánh")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="cho phép chậm hơn tối đa 20%%")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    dists = [d for d in args.dist.split(',') if d]
+    engines = [e for e in args.engines.split(',') if e]
+    if 'numpy' in engines and not numpy_engine.is_available():
+        print("Không có numpy -> bỏ engine numpy")
+        engines.remove('numpy')
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='fw_bench_') as tmpdir:
+        # Detector python luôn cần cho các bước parse, kể cả khi không đo analyze với nó
+        detectors = {e: make_detector(e, tmpdir) for e in {'python', *engines}}
+        print(f"{'bước':<16}{'dòng':>9} {'phân phối':<10}{'engine':<8}{'ops':>9}{'ops/s':>14}{'peak MB':>9}")
+        for rows in sizes:
+            for dist in dists:
+                n_sources = max(1, int(rows * args.source_ratio))
+                case = bench_case(rows, dist, n_sources, args.seed, detectors, engines,
+                                  not args.no_memory, max(1, args.repeat), tmpdir)
+                for r in case:
+                    peak = f"{r['peak_mb']:.1f}" if r['peak_mb'] is not None else '-'
+                    print(f"{r['stage']:<16}{r['rows']:>9} {r['dist']:<10}{(r['engine'] or ''):<8}"
+                          f"{r['ops']:>9}{r['ops_per_s']:>14,.0f}{peak:>9}")
+                results.extend(case)
+
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'numpy': numpy_engine.is_available(),
+            'machine': platform.machine(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'source_ratio': args.source_ratio,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"Đã ghi {args.output}")
+    if args.compare:
+        if compare(results, args.compare, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
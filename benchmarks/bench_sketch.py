@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+So sánh đếm chính xác (defaultdict) với sketch Space-Saving trên phân phối Zipf
+Đo thông lượng, bộ nhớ (tracemalloc) và độ chính xác: recall top-K, sai số trên các heavy hitter.
+Chạy: python3 benchmarks/bench_sketch.py [số_sự_kiện] [số_nguồn] [epsilon]
+"""
+
+import argparse
+import os
+import sys
+import time
+import random
+import itertools
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sketch import SpaceSaving, capacity_for
+
+TOP_K = 100
+
+
+def zipf_stream(n_events, n_sources, s, seed=7):
+    rnd = random.Random(seed)
+    weights = [1.0 / (rank ** s) for rank in range(1, n_sources + 1)]
+    cum = list(itertools.accumulate(weights))
+    # Xáo tên nguồn để thứ hạng không trùng thứ tự chèn
+    names = [f"{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}.{rnd.randrange(256)}" for i in range(n_sources)]
+    rnd.shuffle(names)
+    return [names[i] for i in rnd.choices(range(n_sources), cum_weights=cum, k=n_events)]
+
+
+def run(counter, stream):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for ip in stream:
+        counter[ip] += 1
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh đếm chính xác với sketch Space-Saving")
+    parser.add_argument('n_events', nargs='?', type=int, default=1000000, help="số sự kiện")
+    parser.add_argument('n_sources', nargs='?', type=int, default=1000000, help="số IP nguồn")
+    parser.add_argument('epsilon', nargs='?', type=float, default=0.0005, help="sai số tương đối của sketch")
+    args = parser.parse_args()
+    if args.n_events < 1 or args.n_sources < 1:
+        parser.error("số sự kiện và số nguồn phải >= 1")
+    if not 0 < args.epsilon <= 1:
+        parser.error("epsilon phải trong khoảng (0, 1]")
+    n_events, n_sources, epsilon = args.n_events, args.n_sources, args.epsilon
+    k = capacity_for(epsilon)
+    print(f"{n_events} sự kiện, {n_sources} nguồn, epsilon={epsilon} (k={k})")
+    print(f"{'zipf s':>7} {'kiểu':>8} {'sự kiện/s':>12} {'peak MB':>9} {'recall@100':>11} {'sai số max':>11} {'giới hạn':>9}")
+
+    for s in (0.8, 1.1, 1.5):
+        stream = zipf_stream(n_events, n_sources, s)
+        exact = defaultdict(int)
+        t_exact, m_exact = run(exact, stream)
+        ss = SpaceSaving(k)
+        t_ss, m_ss = run(ss, stream)
+
+        true_top = {ip for ip, _ in sorted(exact.items(), key=lambda kv: kv[1], reverse=True)[:TOP_K]}
+        est = dict(ss.items())
+        est_top = {ip for ip, _ in sorted(est.items(), key=lambda kv: kv[1], reverse=True)[:TOP_K]}
+        recall = len(true_top & est_top) / len(true_top)
+        max_err = max(abs(exact[ip] - est.get(ip, 0)) for ip in true_top)
+
+        print(f"{s:>7} {'exact':>8} {n_events / t_exact:>12,.0f} {m_exact / 1e6:>9.1f} {'1.00':>11} {0:>11} {'-':>9}")
+        print(f"{s:>7} {'sketch':>8} {n_events / t_ss:>12,.0f} {m_ss / 1e6:>9.1f} {recall:>11.2f} {max_err:>11} {int(epsilon * n_events):>9}")
+
+
+if __name__ == '__main__':
+    main()
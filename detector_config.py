@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Cấu hình của DosDetector: kiểm tra 1 lần thành đối tượng Settings bất biến (có kiểu),
+chỉ đọc lại file khi nó thực sự thay đổi (so sánh inode/mtime/kích thước bằng 1 lần stat).
+"""
+
+import json
+import logging
+import os
+from typing import NamedTuple, FrozenSet, Tuple
+
+from ip_whitelist import Whitelist, validate_entries
+
+CONFIG_FILE = '/etc/firewall_auto_block.json'
+
+DEFAULTS = {
+    'check_interval': 5,
+    'run_mode': 'sync',             # sync | async (thu thập song song, lịch cố định)
+    'adaptive_interval': False,     # Tự tăng/giảm chu kỳ kiểm tra theo mức nghi ngờ
+    'fast_interval': 0.25,          # Chu kỳ khi nghi ngờ tấn công (giây)
+    'idle_interval': 15,            # Chu kỳ khi yên tĩnh lâu (giây)
+    'fast_enter_ratio': 0.7,        # Số đếm >= 70% ngưỡng -> chế độ nhanh
+    'fast_exit_ratio': 0.4,         # Dưới 40% ngưỡng mới tính là yên tĩnh
+    'quiet_cycles': 5,              # Số chu kỳ yên tĩnh liên tiếp để rời chế độ nhanh
+    'idle_after_cycles': 60,        # Số chu kỳ yên tĩnh để giãn ra idle_interval
+    'syn_threshold': 50,
+    'conn_threshold': 100,
+    'udp_threshold': 100,
+    'ban_time': 300,
+    'ipv6_source_prefix': 64,       # Nguồn IPv6 được đếm/chặn theo dải /64 (128 = từng địa chỉ)
+    'subnet_aggregation': True,     # Gộp số đếm theo dải mạng, chặn cả dải khi dải là nguồn tấn công
+    'subnet_prefixes_v4': [24, 16],
+    'subnet_prefixes_v6': [48, 32],
+    'subnet_threshold_multiplier': 4,   # Ngưỡng dải = ngưỡng host x 4 (/24, /48), x 16 (/16, /32)
+    'subnet_min_sources': 4,        # Dải phải có ít nhất N IP nguồn mới bị chặn cả dải
+    'tcp_collector': 'netlink',
+    'ban_backend': 'auto',          # auto | ipset | nft | iptables
+    'udp_sample_max_flows': 0,      # 0 = đếm toàn bộ bảng conntrack
+    'history_memory_mb': 64,        # Ngân sách bộ nhớ cho lịch sử Z-Score (chia đều 3 bảng)
+    'history_ttl_cycles': 60,       # Xóa IP không xuất hiện sau N chu kỳ
+    'analysis_engine': 'auto',      # auto | numpy | python
+    'counting_mode': 'exact',       # exact | sketch (chỉ giữ top-K IP, bộ nhớ cố định)
+    'sketch_epsilon': 0.0005,       # Sai số tối đa = epsilon * tổng số kết nối
+    'sketch_max_kb': 4096,          # Trần bộ nhớ cho mỗi bộ đếm sketch
+    'metrics_listen': '127.0.0.1:9110',  # host:port | unix:/đường/dẫn.sock | '' = tắt
+    'state_file': '/var/lib/firewall_auto_block/state.bin',  # Snapshot trạng thái, '' = tắt
+    'state_save_interval': 60,      # Giây giữa 2 lần ghi snapshot
+    'ipc_socket': '/run/firewall_auto_block.sock',  # API cho GUI/web dashboard, '' = tắt
+    'stats_ring': '/dev/shm/firewall_auto_block.ring',  # Chuỗi thời gian chia sẻ với GUI, '' = tắt
+    'history_file': '/var/lib/firewall_auto_block/history.tsdb',  # Lịch sử dài hạn (raw/1m/1h/1d), '' = tắt
+    'whitelist': ['127.0.0.1', '::1'],     # IP hoặc dải CIDR (10.0.0.0/8, 2001:db8::/32)
+}
+
+CHOICES = {
+    'run_mode': ('sync', 'async'),
+    'tcp_collector': ('netlink', 'ss'),
+    'ban_backend': ('auto', 'ipset', 'nft', 'iptables'),
+    'analysis_engine': ('auto', 'numpy', 'python'),
+    'counting_mode': ('exact', 'sketch'),
+}
+
+
+PREFIX_LIMITS = {'subnet_prefixes_v4': 32, 'subnet_prefixes_v6': 128}
+
+
+def _prefix_list(name, raw):
+    """Danh sách độ dài tiền tố -> tuple từ hẹp tới rộng (24, 16)"""
+    if not isinstance(raw, (list, tuple)):
+        raise ValueError(f"{name} phải là danh sách")
+    try:
+        lengths = sorted({int(x) for x in raw}, reverse=True)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name}: giá trị không hợp lệ {raw!r}")
+    if any(not 0 < x < PREFIX_LIMITS[name] for x in lengths):
+        raise ValueError(f"{name}: độ dài tiền tố phải trong (0, {PREFIX_LIMITS[name]})")
+    return tuple(lengths)
+
+
+class Settings(NamedTuple):
+    check_interval: float
+    run_mode: str
+    adaptive_interval: bool
+    fast_interval: float
+    idle_interval: float
+    fast_enter_ratio: float
+    fast_exit_ratio: float
+    quiet_cycles: int
+    idle_after_cycles: int
+    syn_threshold: int
+    conn_threshold: int
+    udp_threshold: int
+    ban_time: int
+    ipv6_source_prefix: int
+    subnet_aggregation: bool
+    subnet_prefixes_v4: Tuple[int, ...]
+    subnet_prefixes_v6: Tuple[int, ...]
+    subnet_threshold_multiplier: float
+    subnet_min_sources: int
+    tcp_collector: str
+    ban_backend: str
+    udp_sample_max_flows: int
+    history_memory_mb: float
+    history_ttl_cycles: int
+    analysis_engine: str
+    counting_mode: str
+    sketch_epsilon: float
+    sketch_max_kb: int
+    metrics_listen: str
+    state_file: str
+    state_save_interval: float
+    ipc_socket: str
+    stats_ring: str
+    history_file: str
+    whitelist: FrozenSet[str]
+
+    @classmethod
+    def from_dict(cls, data):
+        """Ghép với giá trị mặc định, ép kiểu và kiểm tra. Ném ValueError nếu sai."""
+        merged = dict(DEFAULTS)
+        merged.update(data or {})
+        values = {}
+        for name, typ in cls.__annotations__.items():
+            raw = merged[name]
+            if name == 'whitelist':
+                if not isinstance(raw, (list, tuple)):
+                    raise ValueError("whitelist phải là danh sách")
+                try:
+                    values[name] = Whitelist(raw)
+                except ValueError as e:
+                    raise ValueError(f"whitelist: {e}")
+                continue
+            if name in PREFIX_LIMITS:
+                values[name] = _prefix_list(name, raw)
+                continue
+            if typ is bool and isinstance(raw, str):
+                raw = raw.strip().lower() in ('1', 'true', 'yes', 'on')
+            try:
+                values[name] = typ(raw)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name}: giá trị không hợp lệ {raw!r}")
+            if name in CHOICES and values[name] not in CHOICES[name]:
+                raise ValueError(f"{name}: phải là một trong {CHOICES[name]}")
+        if values['check_interval'] <= 0 or values['fast_interval'] <= 0:
+            raise ValueError("check_interval và fast_interval phải > 0")
+        if values['fast_exit_ratio'] > values['fast_enter_ratio']:
+            raise ValueError("fast_exit_ratio phải <= fast_enter_ratio")
+        for name in ('syn_threshold', 'conn_threshold', 'udp_threshold'):
+            if values[name] <= 0:
+                raise ValueError(f"{name} phải > 0")
+        if not 8 <= values['ipv6_source_prefix'] <= 128 or values['ipv6_source_prefix'] % 8:
+            raise ValueError("ipv6_source_prefix phải là bội số của 8 trong [8, 128]")
+        if values['subnet_threshold_multiplier'] < 1 or values['subnet_min_sources'] < 1:
+            raise ValueError("subnet_threshold_multiplier và subnet_min_sources phải >= 1")
+        if not 0 < values['sketch_epsilon'] < 1:
+            raise ValueError("sketch_epsilon phải nằm trong (0, 1)")
+        listen = values['metrics_listen'] = values['metrics_listen'].strip()
+        if listen and not listen.startswith('unix:') and not listen.rpartition(':')[2].isdigit():
+            raise ValueError("metrics_listen phải có dạng host:port hoặc unix:/đường/dẫn")
+        return cls(**values)
+
+
+DEFAULT_SETTINGS = Settings.from_dict({})
+
+
+def diff(old, new):
+    """Danh sách thay đổi dạng 'khóa: cũ -> mới' để ghi log"""
+    changes = []
+    for name in Settings._fields:
+        a, b = getattr(old, name), getattr(new, name)
+        if a != b:
+            if isinstance(a, frozenset):
+                added, removed = sorted(b - a), sorted(a - b)
+                changes.append(f"{name}: +{added} -{removed}")
+            else:
+                changes.append(f"{name}: {a} -> {b}")
+    return changes
+
+
+def load_settings(path=CONFIG_FILE):
+    """Đọc + kiểm tra file config. File không có -> mặc định."""
+    if not os.path.exists(path):
+        return DEFAULT_SETTINGS
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("file config phải là 1 object JSON")
+    return Settings.from_dict(data)
+
+
+def read_raw(path=CONFIG_FILE):
+    """Nội dung file config dạng dict (chưa ghép mặc định); file không có/hỏng -> {}"""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_updates(updates, path=CONFIG_FILE):
+    """Ghép `updates` vào file config hiện có (giữ nguyên các khóa khác), kiểm tra bằng
+    Settings.from_dict rồi ghi nguyên tử. Ném ValueError nếu giá trị sai, OSError nếu không ghi được."""
+    data = read_raw(path)
+    data.update(updates or {})
+    if 'whitelist' in data:
+        if not isinstance(data['whitelist'], (list, tuple)):
+            raise ValueError("whitelist phải là danh sách")
+        try:
+            data['whitelist'] = validate_entries(data['whitelist'])
+        except ValueError as e:
+            raise ValueError(f"whitelist: {e}")
+    Settings.from_dict(data)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp, path)
+    return data
+
+
+class ConfigWatcher:
+    """Chỉ đọc lại config khi (inode, mtime, size) của file thay đổi"""
+
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self._sig = None
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def load(self, current=DEFAULT_SETTINGS):
+        """Đọc lần đầu; config lỗi -> dùng `current` và ghi log"""
+        self._sig = self._signature()
+        try:
+            return load_settings(self.path)
+        except Exception as e:
+            logging.error(f"Lỗi đọc config: {e}")
+            return current
+
+    def poll(self):
+        """Trả về Settings mới nếu file đã đổi và hợp lệ, ngược lại None"""
+        sig = self._signature()
+        if sig == self._sig:
+            return None
+        self._sig = sig
+        try:
+            return load_settings(self.path)
+        except Exception as e:
+            logging.error(f"Config mới không hợp lệ, giữ cấu hình cũ: {e}")
+            return None
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+API cục bộ của DosDetector qua Unix domain socket (mỗi yêu cầu/trả lời là 1 dòng JSON)
+để GUI và web dashboard đọc trạng thái trực tiếp từ bộ nhớ của detector thay vì tự chạy
+iptables/ss/systemctl hay đọc lại file cảnh báo.
+
+Yêu cầu (client gửi 1 dòng):
+  {"cmd": "ping"}                      -> {"ok": true, "version": 1, "pid": ...}
+  {"cmd": "snapshot", "top": 20}       -> {"ok": true, "snapshot": {...}}  trạng thái chu kỳ gần nhất:
+                                          top nguồn mỗi bảng (số đếm + Z-Score), thời gian các bước,
+                                          chu kỳ, entropy, số IP đang chặn
+  {"cmd": "bans", "limit": 1000}       -> {"ok": true, "total": N, "bans": [{ip, banned_at, expires_at}]}
+  {"cmd": "sample", "top": 20}         -> {"ok": true, "sample": {...}}  mẫu mạng gần nhất (xem sample_bus):
+                                          tổng ESTABLISHED, tổng mỗi bảng, top nguồn mỗi bảng
+  {"cmd": "subscribe"}                 -> {"ok": true} rồi mỗi sự kiện chặn/gỡ chặn 1 dòng:
+                                          {"event": "ban"|"unban", "ip", "reason", "timestamp", ...}
+  {"cmd": "subscribe", "topics": ["samples"], "interval": 2, "top": 10}
+                                       -> mẫu mạng (event "sample"), tối đa 1 mẫu mỗi interval giây
+Client đọc chậm quá EVENT_QUEUE_MAX sự kiện thì bị ngắt kết nối (không làm chậm detector).
+"""
+
+import heapq
+import json
+import math
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from operator import itemgetter
+
+import detector_config
+
+SOCKET_PATH = '/run/firewall_auto_block.sock'
+PROTOCOL_VERSION = 1
+EVENT_QUEUE_MAX = 1024
+MAX_REQUEST = 4096
+TOP_DEFAULT = 20
+TOP_MAX = 1000
+FEED_TIMEOUT = 60.0     # LiveFeed: quá lâu không có mẫu -> coi như mất kết nối, kết nối lại
+FEED_RETRY = 5.0
+
+
+TOPICS = ('events', 'samples')
+
+
+def _top(req):
+    return min(max(int(req.get('top', TOP_DEFAULT)), 0), TOP_MAX)
+
+
+def _stream_options(req):
+    """(topics, interval, top) của lệnh subscribe; ném ValueError nếu tham số sai"""
+    topics = req.get('topics') or ['events']
+    if not isinstance(topics, list) or not all(t in TOPICS for t in topics):
+        raise ValueError(f"topics phải là danh sách con của {list(TOPICS)}")
+    try:
+        interval = float(req.get('interval', 0))
+        top = _top(req)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("interval và top phải là số") from None
+    if not math.isfinite(interval):
+        raise ValueError("interval phải là số hữu hạn")
+    return topics, max(interval, 0.0), top
+
+
+def sample_to_dict(sample, top=TOP_DEFAULT):
+    """sample_bus.Sample -> dict JSON (chỉ top nguồn mỗi bảng)"""
+    tables = {'syn': sample.syn, 'conn': sample.conn, 'udp': sample.udp}
+    return {
+        'event': 'sample',
+        'timestamp': sample.timestamp,
+        'established': sample.established,
+        'tcp_source': sample.tcp_source,
+        'totals': {name: sum(stats.values()) for name, stats in tables.items()},
+        'top': {name: heapq.nlargest(top, stats.items(), key=itemgetter(1)) for name, stats in tables.items()},
+    }
+
+
+class _Subscriber:
+    __slots__ = ('events', 'dropped', 'wants_events')
+
+    def __init__(self, wants_events=True):
+        self.events = queue.Queue(EVENT_QUEUE_MAX)
+        self.dropped = False
+        self.wants_events = wants_events
+
+    def push(self, item):
+        try:
+            self.events.put_nowait(item)
+        except queue.Full:
+            self.dropped = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        ipc = self.server.ipc
+        while True:
+            line = self.rfile.readline(MAX_REQUEST)
+            if not line:
+                return
+            try:
+                req = json.loads(line)
+                cmd = req.get('cmd')
+            except (ValueError, AttributeError):
+                self._send({'ok': False, 'error': 'yêu cầu phải là 1 object JSON trên 1 dòng'})
+                continue
+            if cmd == 'subscribe':
+                try:
+                    options = _stream_options(req)
+                except ValueError as e:
+                    self._send({'ok': False, 'error': str(e)})
+                    continue
+                self._stream(ipc, *options)
+                return
+            try:
+                self._send(ipc.answer(cmd, req))
+            except Exception as e:
+                self._send({'ok': False, 'error': str(e)})
+
+    def _send(self, obj):
+        self.wfile.write(json.dumps(obj, ensure_ascii=False).encode() + b'\n')
+        self.wfile.flush()
+
+    def _stream(self, ipc, topics, interval, top):
+        sub = ipc.add_subscriber('events' in topics)
+        sample_sub = None
+        if 'samples' in topics and ipc.bus is not None:
+            sample_sub = ipc.bus.subscribe(sub.push, interval)
+        try:
+            self._send({'ok': True})
+            while not sub.dropped:
+                try:
+                    event = sub.events.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                if event is None:
+                    return
+                # Mẫu được đổi sang JSON ở thread này, không phải thread của detector
+                self._send(sample_to_dict(event, top) if not isinstance(event, dict) else event)
+        except OSError:
+            pass        # Client đã đóng kết nối
+        finally:
+            if sample_sub is not None:
+                ipc.bus.unsubscribe(sample_sub)
+            ipc.remove_subscriber(sub)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0)
+
+
+class DetectorIPC:
+    """Phía detector: giữ snapshot mới nhất (bất biến, thay cả object mỗi chu kỳ)
+    và phát sự kiện cho các client đang subscribe. Chạy trong thread nền."""
+
+    def __init__(self, ban_table=None, bus=None):
+        # ban_table(): {ip: (banned_at, expires_at | None)} - gọi từ thread của server
+        self.ban_table = ban_table or (lambda: {})
+        self.bus = bus          # sample_bus.SampleBus của detector (cho lệnh sample/subscribe samples)
+        self.snapshot = None
+        self.server = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def serve(self, path=SOCKET_PATH):
+        if os.path.exists(path):
+            os.remove(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        server = _UnixServer(path, _Handler)
+        os.chmod(path, 0o660)
+        server.ipc = self
+        threading.Thread(target=server.serve_forever, name='ipc', daemon=True).start()
+        self.server = server
+        return server
+
+    def close(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.dropped = True
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            try:
+                os.remove(self.server.server_address)
+            except OSError:
+                pass
+            self.server = None
+
+    # --- Phía detector ---
+    def publish(self, snapshot):
+        """Thay snapshot (gán 1 tham chiếu -> thread server luôn thấy bản đầy đủ)"""
+        self.snapshot = snapshot
+
+    def emit(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if sub.wants_events:
+                sub.push(event)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def add_subscriber(self, wants_events=True):
+        sub = _Subscriber(wants_events)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def remove_subscriber(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    # --- Phía server ---
+    def answer(self, cmd, req):
+        if cmd == 'ping':
+            return {'ok': True, 'version': PROTOCOL_VERSION, 'pid': os.getpid()}
+        if cmd == 'snapshot':
+            snap = self.snapshot
+            if snap is None:
+                return {'ok': False, 'error': 'detector chưa chạy xong chu kỳ đầu tiên'}
+            top = _top(req)
+            sources = {name: rows[:top] for name, rows in snap['sources'].items()}
+            return {'ok': True, 'snapshot': dict(snap, sources=sources)}
+        if cmd == 'sample':
+            sample = self.bus.latest if self.bus is not None else None
+            if sample is None:
+                return {'ok': False, 'error': 'chưa có mẫu nào'}
+            return {'ok': True, 'sample': sample_to_dict(sample, _top(req))}
+        if cmd == 'bans':
+            table = self.ban_table()
+            limit = max(int(req.get('limit', TOP_MAX)), 0)
+            rows = sorted(table.items(), key=lambda kv: kv[1][0], reverse=True)[:limit]
+            return {'ok': True, 'total': len(table),
+                    'bans': [{'ip': ip, 'banned_at': b, 'expires_at': e} for ip, (b, e) in rows]}
+        return {'ok': False, 'error': f"lệnh không hỗ trợ: {cmd!r}"}
+
+
+# --- Phía client (GUI, web dashboard) ---
+def configured_path(config_file=None):
+    """Đường dẫn socket theo khóa 'ipc_socket' của file config ('' = detector tắt API)"""
+    try:
+        return detector_config.load_settings(config_file or detector_config.CONFIG_FILE).ipc_socket
+    except (OSError, ValueError):
+        return detector_config.DEFAULT_SETTINGS.ipc_socket
+
+
+def _connect(path, timeout):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def query(cmd, path=SOCKET_PATH, timeout=1.0, **params):
+    """Gửi 1 yêu cầu, trả về dict trả lời. Ném OSError nếu detector không chạy,
+    ValueError nếu detector trả lỗi."""
+    with _connect(path, timeout) as sock:
+        sock.sendall(json.dumps(dict(params, cmd=cmd)).encode() + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise OSError("detector đóng kết nối")
+    reply = json.loads(line)
+    if not reply.get('ok'):
+        raise ValueError(reply.get('error', 'lỗi không rõ'))
+    return reply
+
+
+def subscribe(path=SOCKET_PATH, timeout=None, topics=('events',), **params):
+    """Sinh từng sự kiện (dict) cho tới khi detector đóng kết nối.
+    topics: 'events' (chặn/gỡ chặn), 'samples' (mẫu mạng, kèm interval=giây, top=N)"""
+    with _connect(path, 5.0) as sock:
+        sock.sendall(json.dumps(dict(params, cmd='subscribe', topics=list(topics))).encode() + b'\n')
+        sock.settimeout(timeout)
+        with sock.makefile('rb') as f:
+            reply = json.loads(f.readline() or b'{}')
+            if not reply.get('ok'):
+                raise ValueError(reply.get('error', 'detector đóng kết nối'))
+            for line in f:
+                yield json.loads(line)
+
+
+class LiveFeed:
+    """Luồng mẫu (topic samples) dùng chung trong 1 tiến trình client: 1 thread nền giữ kết nối
+    subscribe ở tần suất riêng của client, mọi nơi cần số liệu sống đọc get() thay vì mỗi lần
+    hỏi detector. Detector không chạy thì thử kết nối lại sau FEED_RETRY giây."""
+
+    def __init__(self, path=SOCKET_PATH, interval=2.0, top=0):
+        self.path = path
+        self.interval = interval
+        self.top = top
+        self.latest = None          # dict của mẫu gần nhất (xem sample_to_dict), None = mất kết nối
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+                self._thread.start()
+        return self
+
+    def get(self):
+        return self.latest
+
+    def _run(self):
+        while True:
+            try:
+                for event in subscribe(self.path, FEED_TIMEOUT, ('samples',),
+                                       interval=self.interval, top=self.top):
+                    if event.get('event') == 'sample':
+                        self.latest = event
+            except (OSError, ValueError):
+                pass
+            self.latest = None
+            time.sleep(FEED_RETRY)
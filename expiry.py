@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Lịch hết hạn lệnh chặn dạng min-heap (thay cho việc quét toàn bộ banned_ips mỗi chu kỳ)
+- schedule/cancel O(log n), lấy các IP đã hết hạn O(k log n) với k = số IP hết hạn
+- Mỗi IP có thời hạn riêng; đặt lại lịch cho IP đã có thì mục cũ trong heap bị bỏ qua (xóa lười)
+"""
+
+import heapq
+
+
+class ExpiryScheduler:
+    def __init__(self):
+        self._heap = []         # (thời điểm hết hạn, ip) - có thể chứa mục cũ đã hủy
+        self._deadline = {}     # ip -> thời điểm hết hạn hiện hành
+
+    def __len__(self):
+        return len(self._deadline)
+
+    def __contains__(self, ip):
+        return ip in self._deadline
+
+    def deadline(self, ip):
+        return self._deadline.get(ip)
+
+    def schedule(self, ip, expires_at):
+        self._deadline[ip] = expires_at
+        heapq.heappush(self._heap, (expires_at, ip))
+        # Dọn mục cũ khi heap phình quá 2 lần số IP thật (IP bị đặt lịch lại nhiều lần)
+        if len(self._heap) > 2 * len(self._deadline) + 64:
+            self._heap = [(t, ip) for ip, t in self._deadline.items()]
+            heapq.heapify(self._heap)
+
+    def deadlines(self):
+        """Bản sao {ip: thời điểm hết hạn} (đọc được từ thread khác)"""
+        return self._deadline.copy()
+
+    def cancel(self, ip):
+        return self._deadline.pop(ip, None) is not None
+
+    def next_deadline(self):
+        """Thời điểm hết hạn sớm nhất (None nếu không còn IP nào)"""
+        heap = self._heap
+        while heap:
+            t, ip = heap[0]
+            if self._deadline.get(ip) == t:
+                return t
+            heapq.heappop(heap)
+        return None
+
+    def pop_due(self, now):
+        """Lấy ra các IP có thời điểm hết hạn <= now (theo thứ tự hết hạn)"""
+        heap = self._heap
+        deadline = self._deadline
+        due = []
+        while heap and heap[0][0] <= now:
+            t, ip = heapq.heappop(heap)
+            if deadline.get(ip) == t:
+                del deadline[ip]
+                due.append(ip)
+        return due
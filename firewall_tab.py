@@ -2,9 +2,12 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import subprocess
 
+import ban_backend
+
 class FirewallTab:
     def __init__(self, parent):
         self.parent = parent
+        self.backend = ban_backend.load_configured_backend()
         
         # Biến lưu trữ dữ liệu lần quét trước để so sánh
         self.last_output = "" 
@@ -20,6 +23,7 @@ class FirewallTab:
         ttk.Button(self.toolbar, text="Làm Mới Ngay", command=self.force_refresh).pack(side=tk.LEFT, padx=5)
         ttk.Button(self.toolbar, text="Thêm Rule Mới", command=self.open_add_rule_window).pack(side=tk.LEFT, padx=5)
         ttk.Button(self.toolbar, text="Xóa Rule Đã Chọn", command=self.delete_rule).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.toolbar, text="IP Bị Chặn", command=self.open_blocked_window).pack(side=tk.LEFT, padx=5)
         
         # Nút bật tắt tự động làm mới (Optional UI)
         self.auto_refresh_var = tk.BooleanVar(value=True)
@@ -205,3 +209,58 @@ class FirewallTab:
                 messagebox.showerror("Lỗi", f"Không thể thêm rule:\n{e}")
 
         ttk.Button(win, text="Lưu Quy Tắc", command=save_rule).grid(row=5, column=0, columnspan=2, pady=20)
+
+    def open_blocked_window(self):
+        """Danh sách IP trong set chặn (dùng chung backend với auto_block)"""
+        win = tk.Toplevel(self.parent)
+        win.title(f"IP Bị Chặn ({self.backend.name})")
+        win.geometry("420x400")
+
+        ctrl = ttk.Frame(win)
+        ctrl.pack(fill=tk.X, padx=10, pady=5)
+        ip_var = tk.StringVar()
+        ttk.Entry(ctrl, textvariable=ip_var, width=20).pack(side=tk.LEFT, padx=5)
+
+        tree = ttk.Treeview(win, columns=("ip", "remaining"), show='headings', height=15)
+        tree.heading("ip", text="IP / Dải mạng")
+        tree.heading("remaining", text="Còn lại (giây)")
+        tree.column("ip", width=200)
+        tree.column("remaining", width=120, anchor=tk.CENTER)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        def reload():
+            for item in tree.get_children():
+                tree.delete(item)
+            try:
+                for ip, remaining in sorted(self.backend.list().items()):
+                    tree.insert("", tk.END, values=(ip, remaining if remaining is not None else "Vĩnh viễn"))
+            except Exception as e:
+                messagebox.showerror("Lỗi", f"Không thể đọc danh sách chặn: {e}", parent=win)
+
+        def block():
+            ip = ip_var.get().strip()
+            if not ip: return
+            try:
+                self.backend.add(ip)
+                ip_var.set("")
+                reload()
+            except (subprocess.CalledProcessError, OSError) as e:
+                # OSError: chưa cài ipset/nft/iptables
+                messagebox.showerror("Lỗi", f"Không thể chặn {ip}:\n{e}", parent=win)
+
+        def unblock():
+            sel = tree.selection()
+            if not sel:
+                messagebox.showwarning("Cảnh báo", "Vui lòng chọn một IP để gỡ chặn!", parent=win)
+                return
+            ip = str(tree.item(sel)['values'][0])
+            try:
+                self.backend.remove(ip)
+                reload()
+            except (subprocess.CalledProcessError, OSError) as e:
+                messagebox.showerror("Lỗi", f"Không thể gỡ chặn {ip}:\n{e}", parent=win)
+
+        ttk.Button(ctrl, text="Chặn IP", command=block).pack(side=tk.LEFT, padx=5)
+        ttk.Button(ctrl, text="Gỡ Chặn", command=unblock).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(ctrl, text="Làm Mới", command=reload).pack(side=tk.RIGHT, padx=5)
+        reload()
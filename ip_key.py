@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Khóa IP nguồn dùng chung cho collector, detector, backend chặn và GUI (IPv4 + IPv6)
+- Chuẩn hóa: bỏ [..] và %zone, IPv4-mapped (::ffff:a.b.c.d) thành IPv4, IPv6 về dạng rút gọn
+  (/proc/net/nf_conntrack in đầy đủ 2001:0db8:0000:..., còn ss/netlink in dạng rút gọn)
+- IPv6 được gộp theo /64 ngay khi đếm: 1 máy thường giữ nguyên 1 /64 và tự đổi 64 bit thấp,
+  đếm theo /128 vừa làm bảng trạng thái phình to vừa để kẻ tấn công né ngưỡng
+- Khóa gọn khi đếm: địa chỉ dạng bytes, chỉ đổi sang chuỗi 1 lần cho mỗi nguồn ở cuối chu kỳ.
+  IPv4 = 4 byte; IPv6 = 17 byte (độ dài tiền tố + địa chỉ đã xóa phần sau tiền tố) nên khóa tự mô tả,
+  không bao giờ trùng khóa IPv4 dù tiền tố là bao nhiêu. Khóa chuỗi: '1.2.3.4', '2001:db8:1:2::/64'
+"""
+
+import socket
+
+V4_MAPPED_PREFIX = '::ffff:'
+V4_MAPPED_RAW = b'\x00' * 10 + b'\xff\xff'
+IPV6_SOURCE_PREFIX = 64
+PREFIX_FLAG = 0x80      # Bit cao của byte độ dài khi lưu: sau địa chỉ có 1 byte độ dài tiền tố
+V6_KEY_LEN = 17
+
+
+def split_host_port(addr):
+    """'1.2.3.4:80' | '[2001:db8::1]:443' | '[fe80::1%eth0]:22' | '::ffff:1.2.3.4:80' -> host"""
+    if addr.startswith('['):
+        return addr[1:addr.find(']')]
+    return addr.rpartition(':')[0] or addr
+
+
+def v6_key(raw, v6_prefix=IPV6_SOURCE_PREFIX):
+    """Khóa gọn IPv6 từ 16 byte địa chỉ: byte độ dài tiền tố + địa chỉ mạng (phần sau tiền tố = 0)"""
+    n = v6_prefix // 8
+    return bytes((v6_prefix,)) + raw[:n] + bytes(16 - n)
+
+
+def pack_source(ip, v6_prefix=IPV6_SOURCE_PREFIX):
+    """Khóa gọn (bytes) của 1 địa chỉ: IPv4 4 byte, IPv6 xem v6_key. None nếu không phải IP."""
+    ip = ip.partition('%')[0]
+    try:
+        return socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        pass
+    try:
+        raw = socket.inet_pton(socket.AF_INET6, ip)
+    except OSError:
+        return None
+    if raw[:12] == V4_MAPPED_RAW:
+        return raw[12:]
+    return v6_key(raw, v6_prefix)
+
+
+def key_to_str(raw):
+    """bytes từ pack_source/v6_key -> khóa chuỗi ('2001:db8:1:2::/64' nếu là tiền tố IPv6)"""
+    if len(raw) == 4:
+        return socket.inet_ntop(socket.AF_INET, raw)
+    if len(raw) != V6_KEY_LEN:
+        raise ValueError(f"khóa bytes không hợp lệ ({len(raw)} byte)")
+    plen = raw[0]
+    net = socket.inet_ntop(socket.AF_INET6, raw[1:])
+    return net if plen == 128 else f"{net}/{plen}"
+
+
+def source_key(ip, v6_prefix=IPV6_SOURCE_PREFIX):
+    """Khóa chuỗi chuẩn của IP nguồn (IPv6 gộp theo v6_prefix), None nếu không phải IP"""
+    raw = pack_source(ip, v6_prefix)
+    return key_to_str(raw) if raw is not None else None
+
+
+def is_valid(key):
+    """IP lẻ hoặc khóa dải 'địa chỉ/độ dài' hợp lệ (IPv4, IPv6, IPv4-mapped)"""
+    if not key:
+        return False
+    ip, _, plen = key.partition('/')
+    if ip.lower().startswith(V4_MAPPED_PREFIX) and '.' in ip:
+        ip = ip[len(V4_MAPPED_PREFIX):]
+    for family, bits in ((socket.AF_INET, 32), (socket.AF_INET6, 128)):
+        try:
+            socket.inet_pton(family, ip)
+        except OSError:
+            continue
+        return not plen or (plen.isdigit() and int(plen) <= bits)
+    return False
+
+
+def is_v6(key):
+    return ':' in key
+
+
+def conntrack_source_args(key):
+    """Tham số lọc nguồn cho `conntrack -D`: IP lẻ, hoặc địa chỉ mạng + --mask-src nếu là dải"""
+    ip, _, plen = key.partition('/')
+    args = ['-f', 'ipv6'] if is_v6(ip) else []
+    args += ['-s', ip]
+    if plen:
+        bits = 128 if is_v6(ip) else 32
+        mask = (((1 << int(plen)) - 1) << (bits - int(plen))).to_bytes(bits // 8, 'big')
+        args += ['--mask-src', socket.inet_ntop(socket.AF_INET6 if bits == 128 else socket.AF_INET, mask)]
+    return args
+
+
+def pack(key):
+    """Mã hóa khóa để lưu file: byte độ dài (| PREFIX_FLAG nếu là dải), địa chỉ, [độ dài tiền tố]"""
+    ip, _, plen = key.partition('/')
+    try:
+        raw = socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        raw = socket.inet_pton(socket.AF_INET6, ip)
+    if plen:
+        return bytes((len(raw) | PREFIX_FLAG,)) + raw + bytes((int(plen),))
+    return bytes((len(raw),)) + raw
+
+
+def read(buf, off):
+    """Ngược lại của pack: trả về (khóa, vị trí tiếp theo)"""
+    n = buf[off]
+    size = n & ~PREFIX_FLAG
+    raw = bytes(buf[off + 1:off + 1 + size])
+    key = socket.inet_ntop(socket.AF_INET if size == 4 else socket.AF_INET6, raw)
+    off += 1 + size
+    if n & PREFIX_FLAG:
+        key = f"{key}/{buf[off]}"
+        off += 1
+    return key, off
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Whitelist hỗ trợ CIDR (IPv4 + IPv6) tra cứu bằng cây tiền tố nhị phân (radix trie)
+- Mục có thể là IP lẻ (1.2.3.4, ::1) hoặc dải (10.0.0.0/8, 2001:db8::/32)
+- Tra cứu: đi theo từng bit của địa chỉ, tối đa bằng độ dài tiền tố dài nhất -> O(độ dài tiền tố)
+- Whitelist là 1 frozenset các mục đã chuẩn hóa nên vẫn so sánh/diff được như trước,
+  chỉ có `ip in whitelist` là tra cứu theo dải
+- Khóa dải (nguồn IPv6 /64, dải bị gộp để chặn) được coi là trong whitelist nếu giao với bất kỳ
+  mục nào: chặn cả dải đó sẽ chặn luôn IP tin cậy bên trong
+Dùng chung cho detector, AutoBlockTab và API config của web dashboard.
+"""
+
+import ipaddress
+import socket
+
+V4_MAPPED_PREFIX = '::ffff:'
+CACHE_MAX = 65536       # Số kết quả tra cứu được nhớ (mỗi IP nguồn thường xuất hiện nhiều dòng)
+
+
+def parse_entry(text):
+    """Chuẩn hóa 1 mục whitelist -> ip_network. Ném ValueError nếu sai định dạng.
+    IP lẻ thành /32 (/128); IPv4-mapped (::ffff:a.b.c.d) thành IPv4."""
+    text = str(text).strip()
+    if text.lower().startswith(V4_MAPPED_PREFIX) and '.' in text:
+        text = text[len(V4_MAPPED_PREFIX):]
+    try:
+        return ipaddress.ip_network(text, strict=False)
+    except ValueError:
+        raise ValueError(f"'{text}' không phải IP hoặc dải CIDR hợp lệ")
+
+
+def format_entry(net):
+    """IP lẻ hiển thị không kèm /32, /128 (giống cách người dùng nhập)"""
+    if net.prefixlen == net.max_prefixlen:
+        return str(net.network_address)
+    return str(net)
+
+
+def normalize(text):
+    return format_entry(parse_entry(text))
+
+
+def _addr_to_int(ip):
+    """(họ, số nguyên) của địa chỉ dạng chuỗi, None nếu không phải IP"""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        pass
+    if ip.lower().startswith(V4_MAPPED_PREFIX) and '.' in ip:
+        return _addr_to_int(ip[len(V4_MAPPED_PREFIX):])
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    except OSError:
+        return None
+
+
+class PrefixTrie:
+    """Cây nhị phân theo bit; mỗi nút là list [con_0, con_1, là_cuối_tiền_tố]"""
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.root = [None, None, False]
+        self.max_len = 0
+
+    def insert(self, value, prefixlen):
+        node = self.root
+        shift = self.bits - 1
+        for _ in range(prefixlen):
+            if node[2]:
+                return          # Đã có dải rộng hơn bao trùm
+            b = (value >> shift) & 1
+            if node[b] is None:
+                node[b] = [None, None, False]
+            node = node[b]
+            shift -= 1
+        node[2] = True
+        node[0] = node[1] = None    # Dải con bị dải này bao trùm
+        self.max_len = max(self.max_len, prefixlen)
+
+    def match(self, value):
+        node = self.root
+        shift = self.bits - 1
+        for _ in range(self.max_len):
+            if node[2]:
+                return True
+            node = node[(value >> shift) & 1]
+            if node is None:
+                return False
+            shift -= 1
+        return node[2]
+
+    def overlaps(self, value, prefixlen):
+        """Dải (value, prefixlen) giao với 1 mục nào đó: có mục bao trùm hoặc nằm bên trong"""
+        node = self.root
+        shift = self.bits - 1
+        for _ in range(prefixlen):
+            if node[2]:
+                return True
+            node = node[(value >> shift) & 1]
+            if node is None:
+                return False
+            shift -= 1
+        return True
+
+
+class Whitelist(frozenset):
+    """frozenset các mục đã chuẩn hóa + trie để `ip in whitelist` khớp cả dải CIDR"""
+
+    def __new__(cls, entries=()):
+        nets = [parse_entry(e) for e in entries if str(e).strip()]
+        self = super().__new__(cls, (format_entry(n) for n in nets))
+        self._tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        for n in nets:
+            self._tries[n.version].insert(int(n.network_address), n.prefixlen)
+        self._cache = {}
+        return self
+
+    def __init__(self, entries=()):
+        pass
+
+    def __contains__(self, ip):
+        cache = self._cache
+        hit = cache.get(ip)
+        if hit is not None:
+            return hit
+        if not isinstance(ip, str):
+            return False
+        addr, _, plen = ip.partition('/')
+        parsed = _addr_to_int(addr)
+        if parsed is None:
+            return frozenset.__contains__(self, ip)
+        trie = self._tries[parsed[0]]
+        if plen.isdigit():
+            result = trie.overlaps(parsed[1], int(plen))
+        else:
+            result = trie.match(parsed[1])
+        if len(cache) >= CACHE_MAX:
+            cache.clear()       # Bị giả mạo nhiều IP nguồn -> không để cache phình vô hạn
+        cache[ip] = result
+        return result
+
+    def __reduce__(self):
+        return (Whitelist, (list(self),))
+
+
+def validate_entries(entries):
+    """Danh sách mục đã chuẩn hóa, bỏ trùng, giữ thứ tự. Ném ValueError ở mục sai đầu tiên."""
+    result = []
+    for e in entries:
+        if not str(e).strip():
+            continue
+        n = normalize(e)
+        if n not in result:
+            result.append(n)
+    return result
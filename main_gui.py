@@ -4,8 +4,10 @@ from tkinter import ttk, messagebox
 import subprocess
 import os
 import sys
-import json
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta
+
+import alert_journal
 
 # Import các tab nếu có
 try:
@@ -18,7 +20,10 @@ except ImportError:
     AutoBlockTab = None
     StatisticsTab = None
 
-LOG_JSON = '/var/log/firewall_alerts.json'
+LOG_JSON = alert_journal.JOURNAL_FILE
+ALERT_HISTORY_LIMIT = 1000  # Số cảnh báo gần nhất đọc lúc mở Dashboard (sau đó chỉ đọc dòng mới)
+ALERT_DISPLAY_LIMIT = 50    # Số dòng giữ trong khung cảnh báo
+NO_ALERTS_TEXT = "Chưa có cảnh báo nào..."
 LOG_PLAIN = '/var/log/firewall_auto_block.log'
 
 
@@ -39,6 +44,10 @@ class FirewallGUI:
         self.today_alerts_var = tk.StringVar(value="0")
         self.auto_block_status_var = tk.StringVar(value="TẮT")
 
+        # Đọc tăng dần nhật ký cảnh báo + số liệu cộng dồn của Dashboard
+        self.alert_tail = alert_journal.AlertTail(LOG_JSON, backlog=ALERT_HISTORY_LIMIT)
+        self.reset_alert_stats()
+
         # Tạo giao diện
         self.setup_gui()
 
@@ -119,7 +128,7 @@ class FirewallGUI:
         self.alerts_text.config(yscrollcommand=scrollbar.set)
         self.alerts_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.alerts_text.insert(tk.END, "Chưa có cảnh báo nào...\n")
+        self.alerts_text.insert(tk.END, NO_ALERTS_TEXT + "\n")
         self.alerts_text.config(state=tk.DISABLED)
 
     def setup_firewall_tab(self):
@@ -165,9 +174,10 @@ class FirewallGUI:
         
         if confirm:
             try:
-                # 1. Reset file JSON về mảng rỗng []
-                if os.path.exists(LOG_JSON):
-                    with open(LOG_JSON, 'w') as f:
+                # 1. Xóa nhật ký cảnh báo JSONL (và file mảng JSON cũ nếu chưa chuyển đổi)
+                alert_journal.clear(LOG_JSON)
+                if os.path.exists(alert_journal.LEGACY_FILE):
+                    with open(alert_journal.LEGACY_FILE, 'w') as f:
                         f.write('[]') 
                 
                 # 2. Xóa trắng file log thường
@@ -184,87 +194,71 @@ class FirewallGUI:
             except Exception as e:
                 messagebox.showerror("Lỗi", f"Có lỗi xảy ra: {e}")
 
+    def reset_alert_stats(self):
+        self.blocked_ips = set()
+        self.today_count = 0
+        self.day_start, self.day_end = self.local_day_bounds(time.time())
+
+    @staticmethod
+    def local_day_bounds(ts):
+        """(0h hôm nay, 0h hôm sau) theo giờ địa phương, dạng timestamp"""
+        start = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+        return start.timestamp(), (start + timedelta(days=1)).timestamp()
+
     def load_alerts(self):
-        if not os.path.exists(LOG_JSON):
-            return []
+        """Chỉ các cảnh báo mới kể từ lần gọi trước: (danh sách, reset)"""
         try:
-            with open(LOG_JSON, 'r') as f:
-                data = f.read().strip()
-                if not data:
-                    return []
-                try:
-                    alerts = json.loads(data)
-                    if isinstance(alerts, dict):
-                        return [alerts]
-                    if isinstance(alerts, list):
-                        return alerts
-                    return []
-                except json.JSONDecodeError:
-                    alerts = []
-                    for line in data.splitlines():
-                        line = line.strip()
-                        if line:
-                            try:
-                                alerts.append(json.loads(line))
-                            except:
-                                continue
-                    return alerts
+            return self.alert_tail.poll()
         except Exception as e:
             print("Lỗi đọc log JSON:", e)
-            return []
+            return [], False
 
     def update_dashboard_from_logs(self):
-        alerts = self.load_alerts()
-        # Logic cập nhật Dashboard
-        if not alerts:
-            self.blocked_count_var.set("0")
-            self.today_alerts_var.set("0")
-            self.auto_block_status_var.set("TẮT")
-            self.alerts_text.config(state=tk.NORMAL)
-            self.alerts_text.delete(1.0, tk.END)
-            self.alerts_text.insert(tk.END, "Chưa có cảnh báo nào...\n")
-            self.alerts_text.config(state=tk.DISABLED)
-            return
-
-        blocked_ips = set()
-        today_count = 0
-        recent_lines = []
-
-        now = datetime.now(timezone.utc)
-        midnight = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
-
-        for entry in alerts:
+        alerts, reset = self.load_alerts()
+        now = time.time()
+        if now >= self.day_end:
+            # Qua nửa đêm: bắt đầu đếm lại cảnh báo trong ngày
+            self.today_count = 0
+            self.day_start, self.day_end = self.local_day_bounds(now)
+        if reset:
+            self.reset_alert_stats()
+
+        new_lines = []
+        first_shown = len(alerts) - ALERT_DISPLAY_LIMIT
+        for i, entry in enumerate(alerts):
             ts = entry.get('timestamp')
             ip = entry.get('ip') or entry.get('src_ip') or entry.get('source')
             action = entry.get('action', '').upper() if entry.get('action') else ''
-            reason = entry.get('reason', '')
 
             if action == 'BLOCKED' and ip:
-                blocked_ips.add(ip)
-
+                self.blocked_ips.add(ip)
             try:
-                entry_dt = datetime.fromtimestamp(float(ts), tz=timezone.utc)
-                if entry_dt >= midnight:
-                    today_count += 1
-            except Exception:
-                today_count += 1
-
-            try:
-                time_str = datetime.fromtimestamp(float(ts), tz=timezone.utc).astimezone().strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                time_str = str(ts)
-            recent_lines.append(f"{time_str} - {ip or 'unknown'} - {action} - {reason}")
-
-        recent_lines = list(reversed(recent_lines[-50:]))
-
-        self.blocked_count_var.set(str(len(blocked_ips)))
-        self.today_alerts_var.set(str(today_count))
-        self.auto_block_status_var.set("BẬT" if any((entry.get('action','').upper()=='BLOCKED') for entry in alerts) else "TẮT")
-
+                ts = float(ts)
+            except (TypeError, ValueError):
+                ts = None
+            if ts is None or ts >= self.day_start:
+                self.today_count += 1
+            if i < first_shown:
+                continue        # Không hiển thị -> khỏi định dạng thời gian
+            time_str = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S') if ts is not None \
+                else str(entry.get('timestamp'))
+            new_lines.append(f"{time_str} - {ip or 'unknown'} - {action} - {entry.get('reason', '')}")
+
+        self.blocked_count_var.set(str(len(self.blocked_ips)))
+        self.today_alerts_var.set(str(self.today_count))
+        self.auto_block_status_var.set("BẬT" if self.blocked_ips else "TẮT")
+
+        if not new_lines and not reset:
+            return
         self.alerts_text.config(state=tk.NORMAL)
-        self.alerts_text.delete(1.0, tk.END)
-        for line in recent_lines:
-            self.alerts_text.insert(tk.END, line + "\n")
+        if reset or self.alerts_text.get('1.0', '1.end') == NO_ALERTS_TEXT:
+            self.alerts_text.delete(1.0, tk.END)
+        if not new_lines:
+            self.alerts_text.insert(tk.END, NO_ALERTS_TEXT + "\n")
+        else:
+            # Mới nhất ở trên cùng: chèn các dòng mới vào đầu rồi cắt bớt phía dưới
+            self.alerts_text.insert('1.0', ''.join(line + "\n" for line in reversed(new_lines)))
+            self.alerts_text.delete(f'{ALERT_DISPLAY_LIMIT + 1}.0', tk.END)
         self.alerts_text.config(state=tk.DISABLED)
 
     def periodic_update(self):
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Kho chuỗi thời gian trên đĩa kiểu RRD cho các số liệu mỗi chu kỳ của detector (xem lại sau sự cố)
+- 1 file kích thước cố định: tầng raw (mỗi chu kỳ 1 dòng) + các tầng gộp 1 phút / 1 giờ / 1 ngày
+  (min/max/avg của mỗi số liệu). Mỗi tầng là 1 vòng tròn: đầy thì ghi đè dòng cũ nhất
+  -> dung lượng đĩa không đổi (~1.2 MB với cấu hình mặc định)
+- Ghi O(1): 1 dòng raw + cập nhật bucket đang gộp của mỗi tầng; bucket đang gộp cũng nằm trong file
+  nên detector khởi động lại không mất phần đã gộp
+- Bucket 1 giờ/1 ngày căn theo giờ địa phương (1 ngày = từ 0h tới 0h); độ lệch UTC lấy theo
+  từng mốc thời gian nên vẫn đúng sau khi đổi giờ mùa hè/mùa đông
+- Số liệu thiếu (vd. tổng ESTABLISHED khi collector TCP bị bỏ qua) ghi là NaN và không tính vào bucket
+
+Chỉ detector ghi. GUI/web dashboard đọc bằng query()/query_view() (mở, đọc, đóng mỗi lần).
+"""
+
+import math
+import mmap
+import os
+import struct
+import time
+from typing import NamedTuple
+
+HISTORY_FILE = '/var/lib/firewall_auto_block/history.tsdb'
+MAGIC = b'FWTSDB'
+VERSION = 1
+
+METRICS = ('established', 'syn_total', 'conn_total', 'udp_total', 'tracked', 'banned',
+           'udp_entropy', 'pressure', 'cycle_time')
+
+
+class Tier(NamedTuple):
+    step: int           # Giây mỗi bucket, 0 = raw (mỗi chu kỳ 1 dòng)
+    rows: int
+
+
+TIERS = (
+    Tier(0, 8640),          # ~12 giờ ở chu kỳ 5 giây
+    Tier(60, 2880),         # 48 giờ
+    Tier(3600, 2160),       # 90 ngày
+    Tier(86400, 1830),      # ~5 năm
+)
+TIER_NAMES = {0: 'raw', 60: '1m', 3600: '1h', 86400: '1d'}
+VIEWS = {'1h': 3600, '24h': 86400, '7d': 7 * 86400, '30d': 30 * 86400, '1y': 365 * 86400}
+
+HEADER = struct.Struct('<6sHHH')        # magic, version, số số liệu, số tầng
+HEADER_SIZE = 64
+TIER_HDR = struct.Struct('<IIQ')        # step, số dòng, số dòng đã ghi (tăng dần, không quay vòng)
+N = len(METRICS)
+RAW_ROW = struct.Struct(f'<d{N}f')                  # timestamp, giá trị
+AGG_ROW = struct.Struct(f'<d{3 * N}f')              # đầu bucket, (min, max, avg) mỗi số liệu
+PENDING = struct.Struct(f'<d{3 * N}d{N}I')          # đầu bucket, (min, max, tổng), số mẫu
+NAN = float('nan')
+
+
+def tier_name(step):
+    return TIER_NAMES.get(step, f'{step}s')
+
+
+def _layout(tiers):
+    """Offset của bảng tầng, bucket đang gộp và vùng dữ liệu của mỗi tầng; tổng kích thước file"""
+    off = HEADER_SIZE + len(tiers) * TIER_HDR.size
+    pending, rows = [], []
+    for tier in tiers:
+        pending.append(off if tier.step else None)
+        off += PENDING.size if tier.step else 0
+    for tier in tiers:
+        rows.append(off)
+        off += tier.rows * (AGG_ROW.size if tier.step else RAW_ROW.size)
+    return pending, rows, off
+
+
+class _Bucket:
+    """Bucket đang gộp của 1 tầng (bản sao trong RAM của vùng PENDING trong file)"""
+    __slots__ = ('start', 'mins', 'maxs', 'sums', 'counts')
+
+    def __init__(self, fields=None):
+        if fields is None:
+            fields = (0.0,) + (0.0,) * (3 * N) + (0,) * N
+        self.start = fields[0]
+        agg = fields[1:1 + 3 * N]
+        self.mins, self.maxs, self.sums = list(agg[0::3]), list(agg[1::3]), list(agg[2::3])
+        self.counts = list(fields[1 + 3 * N:])
+
+    def reset(self, start):
+        self.start = start
+        self.mins = [0.0] * N
+        self.maxs = [0.0] * N
+        self.sums = [0.0] * N
+        self.counts = [0] * N
+
+    def add(self, values):
+        for i, v in enumerate(values):
+            if v != v:
+                continue        # NaN: thiếu số liệu
+            if self.counts[i]:
+                if v < self.mins[i]:
+                    self.mins[i] = v
+                if v > self.maxs[i]:
+                    self.maxs[i] = v
+                self.sums[i] += v
+            else:
+                self.mins[i] = self.maxs[i] = self.sums[i] = v
+            self.counts[i] += 1
+
+    def row(self):
+        """(min, max, avg) xen kẽ theo thứ tự METRICS; NaN nếu bucket không có mẫu của số liệu đó"""
+        out = []
+        for i in range(N):
+            c = self.counts[i]
+            out += (self.mins[i], self.maxs[i], self.sums[i] / c) if c else (NAN, NAN, NAN)
+        return out
+
+    def fields(self):
+        out = [self.start]
+        for i in range(N):
+            out += (self.mins[i], self.maxs[i], self.sums[i])
+        return out + [min(c, 0xFFFFFFFF) for c in self.counts]
+
+    def __bool__(self):
+        return any(self.counts)
+
+
+class MetricStore:
+    """Phía detector. Mở lại file cũ cùng bố cục thì ghi tiếp; khác bố cục thì tạo file mới
+    (ghi ra file tạm rồi os.replace, người đọc đang mở file cũ không bị ảnh hưởng)."""
+
+    def __init__(self, path=HISTORY_FILE, tiers=TIERS):
+        self.path = path
+        self.tiers = tuple(Tier(*t) for t in tiers)
+        self.pending_off, self.rows_off, size = _layout(self.tiers)
+        header = HEADER.pack(MAGIC, VERSION, N, len(self.tiers))
+        fd = None
+        try:
+            fd = os.open(path, os.O_RDWR)
+            if os.fstat(fd).st_size != size:
+                os.close(fd)
+                fd = None
+        except FileNotFoundError:
+            pass
+        if fd is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = path + '.tmp'
+            fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.ftruncate(fd, size)
+            os.replace(tmp, path)
+        try:
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if self.mm[:HEADER.size] != header or any(
+                TIER_HDR.unpack_from(self.mm, HEADER_SIZE + i * TIER_HDR.size)[:2] != tier
+                for i, tier in enumerate(self.tiers)):
+            self.mm[:] = bytes(size)
+            self.mm[:HEADER.size] = header
+            for i, tier in enumerate(self.tiers):
+                TIER_HDR.pack_into(self.mm, HEADER_SIZE + i * TIER_HDR.size, tier.step, tier.rows, 0)
+        self.written = [TIER_HDR.unpack_from(self.mm, HEADER_SIZE + i * TIER_HDR.size)[2]
+                        for i in range(len(self.tiers))]
+        self.buckets = [_Bucket(PENDING.unpack_from(self.mm, off)) if off is not None else None
+                        for off in self.pending_off]
+
+    def _push(self, i, row_struct, *fields):
+        tier = self.tiers[i]
+        off = self.rows_off[i] + (self.written[i] % tier.rows) * row_struct.size
+        row_struct.pack_into(self.mm, off, *fields)
+        self.written[i] += 1
+        struct.pack_into('<Q', self.mm, HEADER_SIZE + i * TIER_HDR.size + 8, self.written[i])
+
+    def append(self, timestamp, values):
+        """values: dict {tên: giá trị} hoặc dãy theo thứ tự METRICS; None = thiếu"""
+        if isinstance(values, dict):
+            values = [values.get(name) for name in METRICS]
+        values = [NAN if v is None else float(v) for v in values]
+        utc_offset = time.localtime(timestamp).tm_gmtoff
+        for i, tier in enumerate(self.tiers):
+            if not tier.step:
+                self._push(i, RAW_ROW, timestamp, *values)
+                continue
+            bucket = self.buckets[i]
+            local = timestamp + utc_offset
+            local_start = local - local % tier.step
+            # Đầu bucket có thể nằm bên kia mốc đổi giờ: lấy độ lệch UTC tại chính đầu bucket
+            start = local_start - time.localtime(local_start - utc_offset).tm_gmtoff
+            if start > bucket.start:
+                # Sang bucket mới: chốt bucket cũ thành 1 dòng của tầng
+                if bucket:
+                    self._push(i, AGG_ROW, bucket.start, *bucket.row())
+                bucket.reset(start)
+            bucket.add(values)
+            PENDING.pack_into(self.mm, self.pending_off[i], *bucket.fields())
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+
+
+class Series(NamedTuple):
+    tier: str               # Tầng đã dùng: 'raw' | '1m' | '1h' | '1d'
+    step: int
+    points: list            # [(timestamp, min, max, avg)] cũ -> mới; NaN = thiếu số liệu
+
+
+def _read_tiers(mm):
+    magic, version, n_metrics, n_tiers = HEADER.unpack_from(mm)
+    if magic != MAGIC or version != VERSION or n_metrics != N:
+        raise ValueError("không phải file lịch sử của detector (hoặc khác phiên bản)")
+    tiers, written = [], []
+    for i in range(n_tiers):
+        step, rows, w = TIER_HDR.unpack_from(mm, HEADER_SIZE + i * TIER_HDR.size)
+        tiers.append(Tier(step, rows))
+        written.append(w)
+    pending_off, rows_off, size = _layout(tiers)
+    if len(mm) != size:
+        raise ValueError("file lịch sử sai kích thước")
+    return tiers, written, pending_off, rows_off
+
+
+def _tier_rows(mm, tier, written, rows_off, metric_idx):
+    """Các dòng còn trong vòng tròn của 1 tầng (cũ -> mới). Bỏ dòng cũ nhất: detector có thể
+    đang ghi đè nó."""
+    row_struct = AGG_ROW if tier.step else RAW_ROW
+    first = max(0, written - tier.rows + 1)
+    out = []
+    for n in range(first, written):
+        fields = row_struct.unpack_from(mm, rows_off + (n % tier.rows) * row_struct.size)
+        if tier.step:
+            lo, hi, avg = fields[1 + 3 * metric_idx:4 + 3 * metric_idx]
+        else:
+            lo = hi = avg = fields[1 + metric_idx]
+        out.append((fields[0], lo, hi, avg))
+    return out
+
+
+def downsample(points, max_points):
+    """Gộp các điểm liên tiếp cho còn tối đa max_points điểm (min của min, max của max, trung bình avg)"""
+    if not max_points or len(points) <= max_points:
+        return points
+    k = math.ceil(len(points) / max_points)
+    out = []
+    for i in range(0, len(points), k):
+        group = [p for p in points[i:i + k] if p[3] == p[3]]
+        if not group:
+            out.append((points[i][0], NAN, NAN, NAN))
+            continue
+        out.append((group[0][0], min(p[1] for p in group), max(p[2] for p in group),
+                    sum(p[3] for p in group) / len(group)))
+    return out
+
+
+def query(metric, start, end=None, path=HISTORY_FILE, tier=None, max_points=None):
+    """Chuỗi của 1 số liệu trong [start, end]. Mặc định chọn tầng mịn nhất còn giữ dữ liệu từ start
+    (hoặc chưa bị ghi đè dòng nào), không có thì tầng thô nhất. Bucket đang gộp được trả về như điểm cuối.
+    Ném OSError nếu chưa có file, ValueError nếu sai định dạng hoặc tên số liệu/tầng."""
+    if metric not in METRICS:
+        raise ValueError(f"số liệu không hỗ trợ: {metric!r}")
+    end = time.time() if end is None else end
+    idx = METRICS.index(metric)
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        tiers, written, pending_off, rows_off = _read_tiers(mm)
+        candidates = list(range(len(tiers)))
+        if tier is not None:
+            candidates = [i for i in candidates if tier_name(tiers[i].step) == tier]
+            if not candidates:
+                raise ValueError(f"không có tầng {tier!r}")
+        chosen, rows = None, []
+        for i in sorted(candidates, key=lambda i: tiers[i].step):
+            chosen = i
+            rows = _tier_rows(mm, tiers[i], written[i], rows_off[i], idx)
+            if pending_off[i] is not None:
+                bucket = _Bucket(PENDING.unpack_from(mm, pending_off[i]))
+                if bucket:
+                    lo, hi, avg = bucket.row()[3 * idx:3 * idx + 3]
+                    rows.append((bucket.start, lo, hi, avg))
+            # Tầng chưa quay vòng vẫn giữ mọi dữ liệu từ khi tạo file -> không tầng nào đầy đủ hơn
+            if written[i] < tiers[i].rows or (rows and rows[0][0] - tiers[i].step <= start):
+                break
+    finally:
+        mm.close()
+    step = tiers[chosen].step
+    points = [p for p in rows if start - step < p[0] <= end]
+    return Series(tier_name(step), step, downsample(points, max_points))
+
+
+def query_view(view, metric, path=HISTORY_FILE, now=None, max_points=500):
+    """Khung nhìn dựng sẵn: '1h' | '24h' | '7d' | '30d' | '1y'"""
+    if view not in VIEWS:
+        raise ValueError(f"khung nhìn không hỗ trợ: {view!r}")
+    now = time.time() if now is None else now
+    return query(metric, now - VIEWS[view], now, path, max_points=max_points)
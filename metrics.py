@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Metrics kiểu Prometheus cho detector (định dạng text exposition 0.0.4)
+Counter / Gauge / Histogram đơn giản, không cần thư viện ngoài.
+Phục vụ qua HTTP trên localhost (host:port) hoặc Unix socket (unix:/đường/dẫn).
+"""
+
+import bisect
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DETECT_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+def _fmt_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self._children[()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n=1):
+        self._default().inc(n)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_fmt_labels(self.labelnames, values)} {_fmt_value(child.value)}"]
+
+
+class _CounterChild(_Value):
+    __slots__ = ()
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, v):
+        self._default().set(v)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_fmt_labels(self.labelnames, values)} {_fmt_value(child.value)}"]
+
+
+class _GaugeChild(_Value):
+    __slots__ = ()
+
+    def set(self, v):
+        self.value = v
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, v):
+        self._default().observe(v)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+            cumulative += count
+            le = _fmt_labels(self.labelnames, values, ('le', _fmt_value(float(bound))))
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        base = _fmt_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{base} {_fmt_value(float(child.total))}")
+        lines.append(f"{self.name}_count{base} {child.count}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.total += v
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _make_handler(registry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass    # Không ghi log truy cập vào stdout của detector
+
+        def address_string(self):
+            return 'unix' if isinstance(self.client_address, (str, bytes)) else super().address_string()
+
+    return MetricsHandler
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0)
+
+
+def start_server(registry, listen):
+    """listen: 'host:port' (nên là 127.0.0.1) hoặc 'unix:/run/....sock'. Chạy trong thread nền."""
+    handler = _make_handler(registry)
+    if listen.startswith('unix:'):
+        path = listen[5:]
+        if os.path.exists(path):
+            os.remove(path)
+        server = _UnixHTTPServer(path, handler)
+        os.chmod(path, 0o660)
+    else:
+        host, _, port = listen.rpartition(':')
+        server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), handler)
+        server.daemon_threads = True
+    t = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    t.start()
+    return server
+
+
+class DetectorMetrics:
+    """Bộ metrics của DosDetector (tiền tố firewall_)"""
+
+    def __init__(self, registry=None):
+        r = self.registry = registry or Registry()
+        self.cycle = r.histogram('firewall_cycle_duration_seconds',
+                                 'Thời gian xử lý 1 chu kỳ phát hiện (thu thập + phân tích + chặn)')
+        self.collect = r.histogram('firewall_collect_duration_seconds',
+                                   'Thời gian thu thập theo nguồn', ('source',))
+        self.parse = r.histogram('firewall_parse_duration_seconds',
+                                 'Thời gian giải mã dữ liệu thu thập theo nguồn', ('source',))
+        self.decision = r.histogram('firewall_decision_duration_seconds',
+                                    'Thời gian tính Z-Score/ngưỡng và ra quyết định chặn')
+        self.commit = r.histogram('firewall_ban_commit_duration_seconds',
+                                  'Thời gian áp dụng lô chặn/gỡ chặn và fsync nhật ký')
+        self.time_to_detect = r.histogram('firewall_time_to_detect_seconds',
+                                          'Thời gian từ lúc nghi ngờ tấn công tới lệnh chặn đầu tiên',
+                                          buckets=DETECT_BUCKETS)
+        self.tracked = r.gauge('firewall_tracked_sources', 'Số IP nguồn đang có lịch sử Z-Score')
+        self.banned = r.gauge('firewall_banned_ips', 'Số IP đang bị chặn')
+        self.entropy = r.gauge('firewall_udp_entropy_bits', 'Entropy phân bố luồng UDP theo IP nguồn')
+        self.interval = r.gauge('firewall_check_interval_seconds', 'Chu kỳ kiểm tra hiện tại')
+        self.bans = r.counter('firewall_bans_total', 'Số lần chặn IP')
+        self.unbans = r.counter('firewall_unbans_total', 'Số lần gỡ chặn IP')
+        self.failures = r.counter('firewall_subprocess_failures_total',
+                                  'Số lần lệnh ngoài / bộ thu thập bị lỗi', ('op',))
+        self.deadline_misses = r.counter('firewall_cycle_deadline_misses_total',
+                                         'Số chu kỳ chạy lâu hơn chu kỳ kiểm tra')
+        self.shed = r.counter('firewall_collector_shed_total',
+                              'Số lần bỏ kết quả bộ thu thập vì trễ hạn', ('source',))
+
+    def observe_cycle(self, timings, sources, parse_times):
+        """timings: dict thời gian các bước của chu kỳ; sources: {'tcp': tên bộ thu thập, ...}"""
+        for key, source in sources.items():
+            if timings.get(key) is not None:
+                self.collect.labels(source).observe(timings[key])
+        for source, seconds in parse_times.items():
+            self.parse.labels(source).observe(seconds)
+        if 'analyze' in timings:
+            self.decision.observe(timings['analyze'])
+        if 'commit' in timings:
+            self.commit.observe(timings['commit'])
+        if 'total' in timings:
+            self.cycle.observe(timings['total'])
+
+    def serve(self, listen):
+        return start_server(self.registry, listen)
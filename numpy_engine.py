@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Bộ phân tích vector hóa bằng NumPy cho analyze_and_block (tùy chọn)
+Mỗi IP được gán 1 chỉ số hàng; lịch sử lưu trong ma trận vòng (số_hàng x HISTORY_LEN).
+Ngưỡng, hard limit và Z-Score của mọi IP trong 1 chu kỳ được tính trong 1 lượt vector,
+chỉ trả về các IP vi phạm. Máy không có NumPy thì detector dùng BaselineStore thuần Python.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from baseline import HISTORY_LEN, MIN_SAMPLES, estimate_key_bytes
+
+INITIAL_CAPACITY = 1024
+
+
+def is_available():
+    return np is not None
+
+
+class VectorEngine:
+    """Thay thế BaselineStore: cùng ngữ nghĩa cửa sổ trượt, LRU và TTL nhưng tính theo lô"""
+
+    def __init__(self, window_size=HISTORY_LEN, max_keys=0, ttl_cycles=0):
+        if np is None:
+            raise RuntimeError("Chưa cài numpy")
+        self.window_size = window_size
+        self.max_keys = max_keys
+        self.ttl_cycles = ttl_cycles
+        self.cycle = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self.index = {}         # ip -> hàng
+        self.keys = []          # hàng -> ip (None nếu trống)
+        self.free_rows = []
+        self._alloc(INITIAL_CAPACITY)
+
+    def _alloc(self, capacity):
+        old = getattr(self, 'hist', None)
+        hist = np.zeros((capacity, self.window_size), dtype=np.int64)
+        arrays = {name: np.zeros(capacity, dtype=np.int64)
+                  for name in ('pos', 'n', 'total', 'total_sq', 'last_seen')}
+        if old is not None:
+            used = old.shape[0]
+            hist[:used] = old
+            for name, arr in arrays.items():
+                arr[:used] = getattr(self, name)
+        self.hist = hist
+        for name, arr in arrays.items():
+            setattr(self, name, arr)
+        start = len(self.keys)
+        self.keys.extend([None] * (capacity - start))
+        # pop() lấy từ cuối -> đảo ngược để cấp phát hàng theo thứ tự tăng dần
+        self.free_rows.extend(range(capacity - 1, start - 1, -1))
+
+    def set_memory_budget(self, budget_bytes):
+        # Một hàng numpy nhỏ hơn RollingWindow nhưng giữ cùng ước lượng cho nhất quán
+        self.max_keys = max(1, int(budget_bytes // estimate_key_bytes(self.window_size))) if budget_bytes > 0 else 0
+        if self.max_keys and len(self.index) > self.max_keys:
+            self._evict(len(self.index) - self.max_keys)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def _release(self, rows):
+        for r in rows:
+            r = int(r)
+            del self.index[self.keys[r]]
+            self.keys[r] = None
+            self.free_rows.append(r)
+        self.hist[rows] = 0
+        for arr in (self.pos, self.n, self.total, self.total_sq):
+            arr[rows] = 0
+
+    def _evict(self, count):
+        """Bỏ `count` IP có last_seen nhỏ nhất (LRU)"""
+        used = np.fromiter(self.index.values(), dtype=np.int64, count=len(self.index))
+        if count >= len(used):
+            victims = used
+        else:
+            victims = used[np.argpartition(self.last_seen[used], count)[:count]]
+        self._release(victims)
+        self.evictions += len(victims)
+
+    def _rows_for(self, ips):
+        index = self.index
+        rows = np.empty(len(ips), dtype=np.int64)
+        new = 0
+        for i, ip in enumerate(ips):
+            r = index.get(ip)
+            if r is None:
+                new += 1
+                r = -1
+            rows[i] = r
+        if new:
+            if self.max_keys and len(index) + new > self.max_keys:
+                # Giữ lại các IP có mặt trong chu kỳ này, bỏ IP cũ nhất
+                self.last_seen[rows[rows >= 0]] = self.cycle
+                self._evict(min(len(index), len(index) + new - self.max_keys))
+                rows = np.array([index.get(ip, -1) for ip in ips], dtype=np.int64)
+            if len(self.free_rows) < new:
+                self._alloc(max(len(self.keys) * 2, len(self.keys) + new))
+            for i in np.flatnonzero(rows < 0):
+                r = self.free_rows.pop()
+                ip = ips[i]
+                index[ip] = r
+                self.keys[r] = ip
+                rows[i] = r
+            if self.max_keys and len(index) > self.max_keys:
+                # Một chu kỳ có nhiều IP hơn cả giới hạn -> bỏ phần vượt
+                overflow = rows[self.max_keys:]
+                self._release(overflow)
+                self.evictions += len(overflow)
+                keep = len(ips) - len(overflow)
+                return rows[:keep], keep
+        return rows, len(ips)
+
+    def evaluate(self, stats, threshold, hard_multiplier, z_threshold, min_samples=MIN_SAMPLES):
+        """Đẩy số đếm của chu kỳ vào lịch sử và trả về các IP đáng chú ý.
+
+        Trả về list (ip, count, z, should_block, is_hard) chỉ cho IP có count > threshold
+        (giống điều kiện in [DEBUG] của bản thuần Python)."""
+        if not stats:
+            return []
+        ips = list(stats.keys())
+        counts = np.fromiter(stats.values(), dtype=np.int64, count=len(ips))
+        rows, kept = self._rows_for(ips)
+        if kept < len(ips):
+            ips = ips[:kept]
+            counts = counts[:kept]
+
+        L = self.window_size
+        pos = self.pos[rows]
+        n = self.n[rows]
+        old = self.hist[rows, pos]
+        full = n == L
+        total = self.total[rows] - np.where(full, old, 0) + counts
+        total_sq = self.total_sq[rows] - np.where(full, old * old, 0) + counts * counts
+        n = np.where(full, n, n + 1)
+
+        self.hist[rows, pos] = counts
+        self.pos[rows] = (pos + 1) % L
+        self.n[rows] = n
+        self.total[rows] = total
+        self.total_sq[rows] = total_sq
+        self.last_seen[rows] = self.cycle
+
+        over = np.flatnonzero(counts > threshold)
+        if not len(over):
+            return []
+        # Chỉ tính Z-Score cho các IP vượt ngưỡng (các IP khác không thể bị chặn)
+        c = counts[over].astype(np.float64)
+        n_o = n[over].astype(np.float64)
+        t_o = total[over].astype(np.float64)
+        denom = n_o * (n_o - 1)
+        var = np.divide(n_o * total_sq[over] - t_o * t_o, denom, out=np.zeros_like(c), where=denom > 0)
+        ok = (n[over] >= min_samples) & (var > 0)
+        z = np.zeros_like(c)
+        np.divide(c - t_o / np.maximum(n_o, 1), np.sqrt(np.where(ok, var, 1.0)), out=z, where=ok)
+
+        hard = counts[over] > threshold * hard_multiplier
+        block = hard | (z > z_threshold)
+        return [(ips[i], int(counts[i]), float(zi), bool(b), bool(h))
+                for i, zi, b, h in zip(over.tolist(), z.tolist(), block.tolist(), hard.tolist())]
+
+    def tick(self):
+        self.cycle += 1
+        if not self.ttl_cycles or not self.index:
+            return 0
+        used = np.fromiter(self.index.values(), dtype=np.int64, count=len(self.index))
+        stale = used[self.last_seen[used] < self.cycle - self.ttl_cycles]
+        if len(stale):
+            self._release(stale)
+            self.expirations += len(stale)
+        return len(stale)
+
+    def window(self, ip):
+        """Các mẫu của IP theo thứ tự cũ -> mới"""
+        r = self.index.get(ip)
+        if r is None:
+            return []
+        n, pos = int(self.n[r]), int(self.pos[r])
+        return [int(self.hist[r, (pos - n + i) % self.window_size]) for i in range(n)]
+
+    def stats(self):
+        return {'live_keys': len(self.index), 'evictions': self.evictions, 'expirations': self.expirations}
+
+    def export(self):
+        """Giống BaselineStore.export(): theo thứ tự last_seen tăng dần"""
+        order = sorted(self.index.items(), key=lambda kv: int(self.last_seen[kv[1]]))
+        return [(ip, self.window(ip), self.cycle - int(self.last_seen[r])) for ip, r in order]
+
+    def load(self, entries):
+        """Nạp lại kết quả của export() theo lô"""
+        if not entries:
+            return
+        L = self.window_size
+        entries = [(ip, list(values)[-L:], age) for ip, values, age in entries]
+        rows, kept = self._rows_for([ip for ip, _, _ in entries])
+        entries = entries[:kept]
+        mat = np.zeros((kept, L), dtype=np.int64)
+        n = np.zeros(kept, dtype=np.int64)
+        age = np.zeros(kept, dtype=np.int64)
+        for i, (_, values, a) in enumerate(entries):
+            mat[i, :len(values)] = values
+            n[i] = len(values)
+            age[i] = a
+        self.hist[rows] = mat
+        self.n[rows] = n
+        self.pos[rows] = n % L
+        self.total[rows] = mat.sum(axis=1)
+        self.total_sq[rows] = (mat * mat).sum(axis=1)
+        self.last_seen[rows] = self.cycle - age
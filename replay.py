@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Chạy lại (replay) dữ liệu đã ghi qua toàn bộ pipeline phát hiện của DosDetector
+- Không cần root, không đụng firewall: dùng ban_backend.RecordingBackend
+- Đồng hồ của detector đi theo timestamp của bản ghi -> chạy nhanh hơn thời gian thực
+  mà thời hạn chặn/gỡ chặn vẫn đúng như lúc xảy ra
+
+Đầu vào:
+1. File capture nhị phân (ghi từ detector đang chạy: `auto_block.py --record FILE`)
+2. Thư mục hoặc file .tar/.tar.gz chứa snapshot dạng text, mỗi chu kỳ 1 nhóm file:
+     <timestamp>.syn  - output của `ss -nt state syn-recv`
+     <timestamp>.est  - output của `ss -nt state established`
+     <timestamp>.udp  - output của `conntrack -L [-f ipv6] -p udp` hoặc /proc/net/nf_conntrack
+   File nào thiếu được coi là rỗng.
+
+Ví dụ: python3 replay.py incident.fwcap --config my_thresholds.json --events bans.jsonl
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import shutil
+import struct
+import sys
+import tarfile
+import tempfile
+import time
+from collections import defaultdict
+
+from conntrack_reader import extract_src
+import ip_key
+
+MAGIC = b'FWCAP\x01\n'
+# Mỗi chu kỳ: timestamp, số IP của 3 bảng syn/conn/udp
+FRAME_HDR = struct.Struct('<dIII')
+# Mỗi IP: độ dài địa chỉ (4 | 16, | PREFIX_FLAG nếu là dải), số đếm, rồi địa chỉ dạng bytes
+# và 1 byte độ dài tiền tố nếu là dải (vd. nguồn IPv6 đã gộp /64)
+ENTRY_HDR = struct.Struct('<BI')
+
+SNAPSHOT_KINDS = ('syn', 'est', 'udp')
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class CaptureWriter:
+    """Ghi số đếm mỗi chu kỳ ra file capture nhị phân (đuôi .gz -> nén gzip)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = _open(path, 'wb')
+        self._f.write(MAGIC)
+
+    def write(self, ts, syn, conn, udp):
+        tables = []
+        for stats in (syn, conn, udp):
+            entries = []
+            for ip, count in stats.items():
+                try:
+                    packed = ip_key.pack(ip)
+                except (OSError, TypeError, ValueError):
+                    continue
+                entries.append(ENTRY_HDR.pack(packed[0], min(int(count), 0xFFFFFFFF)) + packed[1:])
+            tables.append(entries)
+        parts = [FRAME_HDR.pack(ts, *(len(t) for t in tables))]
+        for t in tables:
+            parts.extend(t)
+        self._f.write(b''.join(parts))
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def _read_frame(f):
+    """1 chu kỳ (timestamp, syn, conn, udp); None nếu hết file hoặc chu kỳ cuối ghi dở"""
+    hdr = f.read(FRAME_HDR.size)
+    if len(hdr) < FRAME_HDR.size:
+        return None
+    ts, *sizes = FRAME_HDR.unpack(hdr)
+    tables = []
+    for n in sizes:
+        stats = defaultdict(int)
+        for _ in range(n):
+            entry = f.read(ENTRY_HDR.size)
+            if len(entry) < ENTRY_HDR.size:
+                return None
+            addr_len, count = ENTRY_HDR.unpack(entry)
+            size = (addr_len & ~ip_key.PREFIX_FLAG) + (1 if addr_len & ip_key.PREFIX_FLAG else 0)
+            addr = f.read(size)
+            if len(addr) < size:
+                return None
+            key, _ = ip_key.read(bytes((addr_len,)) + addr, 0)
+            stats[key] = count
+        tables.append(stats)
+    return (ts, *tables)
+
+
+def read_capture(path):
+    """Sinh (timestamp, syn, conn, udp) từ file capture. File detector chưa kịp đóng
+    (chu kỳ cuối ghi dở, .gz thiếu phần kết thúc) được đọc tới chu kỳ đầy đủ cuối cùng."""
+    with _open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: không phải file capture")
+        while True:
+            try:
+                frame = _read_frame(f)
+            except EOFError:
+                return      # gzip bị cắt giữa chừng
+            if frame is None:
+                return
+            yield frame
+
+
+def _snapshot_name(name):
+    """'1700000000.5.syn' -> (1700000000.5, 'syn'); tên khác -> None"""
+    base, _, kind = os.path.basename(name).rpartition('.')
+    if kind not in SNAPSHOT_KINDS:
+        return None
+    try:
+        return float(base), kind
+    except ValueError:
+        return None
+
+
+def iter_snapshots(path):
+    """Sinh (timestamp, {kind: [dòng]}) theo thứ tự thời gian từ thư mục hoặc file tar"""
+    groups = defaultdict(dict)
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            parsed = _snapshot_name(name)
+            if parsed:
+                groups[parsed[0]][parsed[1]] = os.path.join(path, name)
+        for ts in sorted(groups):
+            files = {}
+            for kind, fname in groups[ts].items():
+                with open(fname, 'r', errors='replace') as f:
+                    files[kind] = f.read().splitlines()
+            yield ts, files
+        return
+    with tarfile.open(path, 'r:*') as tar:
+        for member in tar.getmembers():
+            parsed = _snapshot_name(member.name) if member.isfile() else None
+            if parsed:
+                groups[parsed[0]][parsed[1]] = member
+        for ts in sorted(groups):
+            files = {}
+            for kind, member in groups[ts].items():
+                data = tar.extractfile(member).read()
+                files[kind] = data.decode('utf-8', 'replace').splitlines()
+            yield ts, files
+
+
+def snapshot_counts(detector, files):
+    """Giải mã snapshot text bằng đúng các hàm parse của detector"""
+    whitelist = detector.config.whitelist
+    syn = detector.new_counter()
+    conn = detector.new_counter()
+    for line in files.get('syn', [])[1:]:
+        detector._parse_ss_line(line, syn, whitelist)
+    for line in files.get('est', [])[1:]:
+        detector._parse_ss_line(line, conn, whitelist)
+    udp = defaultdict(int)
+    v6_prefix = detector.config.ipv6_source_prefix
+    for line in files.get('udp', []):
+        if 'udp' not in line:
+            continue
+        ip = extract_src(line)
+        key = ip_key.source_key(ip, v6_prefix) if ip else None
+        if key and key not in whitelist:
+            udp[key] += 1
+    return syn, conn, udp
+
+
+def iter_frames(path, detector):
+    """Tự nhận dạng đầu vào: thư mục / tar snapshot hoặc file capture"""
+    if os.path.isdir(path) or tarfile.is_tarfile(path):
+        for ts, files in iter_snapshots(path):
+            yield (ts, *snapshot_counts(detector, files))
+    else:
+        yield from read_capture(path)
+
+
+class ReplayClock:
+    """Đồng hồ giả cho detector: trả về timestamp của chu kỳ đang replay"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def replay(detector, frames, clock, speed=0.0):
+    """Đưa từng chu kỳ qua detector.process_cycle. speed=0 -> nhanh nhất có thể,
+    speed=N -> nhanh gấp N lần thời gian thực. Trả về dict tổng kết."""
+    cycles = 0
+    first_ts = last_ts = None
+    wall_start = time.perf_counter()
+    for ts, syn, conn, udp in frames:
+        if speed > 0 and last_ts is not None and ts > last_ts:
+            time.sleep((ts - last_ts) / speed)
+        clock.now = ts
+        if first_ts is None:
+            first_ts = ts
+        last_ts = ts
+        timings = {}
+        detector.process_cycle(syn, conn, udp, timings)
+        timings['total'] = sum(timings.values())
+        timings['interval'] = detector.next_interval()
+        detector._record_timings(timings)
+        cycles += 1
+    wall = time.perf_counter() - wall_start
+    simulated = (last_ts - first_ts) if cycles else 0.0
+    events = getattr(detector.backend, 'events', [])
+    return {
+        'cycles': cycles,
+        'simulated_seconds': round(simulated, 3),
+        'wall_seconds': round(wall, 3),
+        'speedup': round(simulated / wall, 1) if wall > 0 else None,
+        'bans': sum(1 for e in events if e[1] == 'ban'),
+        'unbans': sum(1 for e in events if e[1] == 'unban'),
+        'still_banned': len(detector.banned_ips),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chạy lại snapshot/capture qua DosDetector (không cần root)")
+    parser.add_argument('input', help="file capture, thư mục snapshot hoặc file .tar/.tar.gz")
+    parser.add_argument('--config', help="file config JSON (mặc định: giá trị mặc định)")
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help="0 = nhanh nhất có thể, N = nhanh gấp N lần thời gian thực")
+    parser.add_argument('--alerts', help="ghi cảnh báo JSONL ra file này (mặc định: bỏ đi)")
+    parser.add_argument('--events', help="ghi danh sách chặn/gỡ chặn (JSONL) ra file này")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    # Cấu hình logging trước khi import auto_block (tránh ghi vào log của hệ thống)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(levelname)s - %(message)s', stream=sys.stderr)
+    import auto_block
+    import ban_backend
+    import detector_config
+
+    settings = detector_config.load_settings(args.config) if args.config else detector_config.DEFAULT_SETTINGS
+    settings = settings._replace(metrics_listen='', state_file='', ipc_socket='', stats_ring='',
+                                 history_file='')
+    clock = ReplayClock()
+    tmpdir = None
+    alert_file = args.alerts
+    if not alert_file:
+        tmpdir = tempfile.mkdtemp(prefix='fw_replay_')
+        alert_file = os.path.join(tmpdir, 'alerts.jsonl')
+    try:
+        detector = auto_block.DosDetector(settings=settings,
+                                          backend=ban_backend.RecordingBackend(clock),
+                                          alert_file=alert_file, clock=clock)
+        summary = replay(detector, iter_frames(args.input, detector), clock, args.speed)
+        detector.journal.close()
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if args.events:
+        with open(args.events, 'w') as f:
+            for ts, action, ip, timeout in detector.backend.events:
+                f.write(json.dumps({'timestamp': ts, 'action': action, 'ip': ip, 'timeout': timeout}) + '\n')
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Bus phát mẫu trong tiến trình: detector lấy mẫu mạng đúng 1 lần mỗi chu kỳ (netlink/ss + conntrack)
+rồi phát cho mọi nơi cần dùng thay vì mỗi nơi tự chạy ss/iptables: snapshot IPC, ring buffer
+của GUI (shm_ring), file lịch sử và luồng mẫu qua socket (web dashboard, xem detector_ipc.LiveFeed).
+- Mỗi subscriber có tần suất riêng (min_interval): nhận mẫu mới nhất khi đã đủ khoảng cách,
+  các mẫu ở giữa bị bỏ qua (không dồn hàng)
+- Callback chạy trong thread của detector nên phải nhẹ (vd. chỉ đưa vào hàng đợi)
+"""
+
+import logging
+import threading
+from typing import NamedTuple, Optional
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    syn: dict               # {ip: số kết nối SYN-RECV}
+    conn: dict              # {ip: số kết nối ESTABLISHED}
+    udp: dict               # {ip: số luồng UDP}
+    established: Optional[int]     # Tổng kết nối ESTABLISHED (kể cả IP trong whitelist), None = thiếu
+    tcp_source: str
+
+
+class _Subscription:
+    __slots__ = ('callback', 'min_interval', 'last')
+
+    def __init__(self, callback, min_interval):
+        self.callback = callback
+        self.min_interval = min_interval
+        self.last = None
+
+
+class SampleBus:
+    def __init__(self):
+        self.latest = None
+        self._subs = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, min_interval=0.0):
+        """Trả về đối tượng để hủy đăng ký bằng unsubscribe()"""
+        sub = _Subscription(callback, min_interval)
+        with self._lock:
+            self._subs = self._subs + [sub]     # Copy-on-write: publish không cần khóa
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs = [s for s in self._subs if s is not sub]
+
+    def __len__(self):
+        return len(self._subs)
+
+    def publish(self, sample):
+        self.latest = sample
+        for sub in self._subs:
+            if sub.last is not None and sample.timestamp - sub.last < sub.min_interval:
+                continue
+            sub.last = sample.timestamp
+            try:
+                sub.callback(sample)
+            except Exception as e:
+                logging.error(f"Lỗi subscriber của bus mẫu: {e}")
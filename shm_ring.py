@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Ring buffer chuỗi thời gian trong bộ nhớ chia sẻ (file mmap trên /dev/shm) giữa detector và GUI
+- Bố cục cố định: header 64 byte + `capacity` ô, mỗi ô = 1 chu kỳ của detector
+  (tổng kết nối, SYN-RECV, luồng UDP, entropy, số IP đang chặn, ... + top-K nguồn của mỗi bảng)
+- Mỗi ô có seqlock: người ghi tăng seq lên số lẻ, ghi dữ liệu, rồi tăng lên số chẵn;
+  người đọc chép ô ra và đọc lại seq, khác nhau hoặc lẻ thì đọc lại -> người đọc không bao giờ chặn người ghi
+- Chỉ 1 người ghi (detector). Ô còn mang số thứ tự bản ghi nên người đọc chậm biết được ô đã bị ghi đè.
+  (Dựa vào thứ tự ghi bộ nhớ của x86: CPython không có hàng rào bộ nhớ tường minh.)
+"""
+
+import mmap
+import os
+import struct
+from typing import NamedTuple, Optional
+
+import ip_key
+
+RING_FILE = '/dev/shm/firewall_auto_block.ring'
+RING_MODE = 0o600       # Số liệu theo IP nguồn: chỉ root (detector, GUI chạy sudo) được đọc
+MAGIC = b'FWRING'
+VERSION = 1
+CAPACITY = 2048         # ~2.8 giờ ở chu kỳ 5 giây
+TOP_K = 10
+TABLES = ('syn', 'conn', 'udp')
+
+HEADER = struct.Struct('<6sHIIH')       # magic, version, capacity, kích thước ô, top_k
+HEADER_SIZE = 64
+INDEX = struct.Struct('<Q')             # số bản ghi đã ghi (tăng dần, không quay vòng)
+INDEX_OFF = 32
+SEQ = struct.Struct('<Q')
+# index, timestamp, tổng ESTABLISHED (-1 = thiếu), tổng syn/conn/udp, số khóa đang theo dõi,
+# số IP đang chặn, tổng số lần chặn, entropy UDP, áp lực, chu kỳ, thời gian xử lý
+RECORD = struct.Struct('<QdqIIIIIIffff')
+# độ dài địa chỉ (| PREFIX_FLAG nếu là dải), độ dài tiền tố, số đếm, địa chỉ
+TOP = struct.Struct('<BBxxI16s')
+MAX_U32 = 0xFFFFFFFF
+READ_RETRIES = 16
+
+
+class CycleRecord(NamedTuple):
+    index: int
+    timestamp: float
+    established: Optional[int]
+    syn_total: int
+    conn_total: int
+    udp_total: int
+    tracked: int
+    banned: int
+    bans_total: int
+    udp_entropy: float
+    pressure: float
+    interval: float
+    cycle_time: float
+    top: dict           # 'syn'|'conn'|'udp' -> [(ip, số đếm)] giảm dần
+
+
+def slot_size(top_k):
+    return SEQ.size + RECORD.size + len(TABLES) * top_k * TOP.size
+
+
+def _u32(x):
+    return min(max(int(x), 0), MAX_U32)
+
+
+def _pack_top(key, count):
+    addr, _, plen = key.partition('/')
+    raw = ip_key.pack_source(addr, 128)
+    if raw is None:
+        return TOP.pack(0, 0, 0, b'')
+    raw = raw[-16:] if len(raw) == ip_key.V6_KEY_LEN else raw
+    flags = len(raw) | (ip_key.PREFIX_FLAG if plen else 0)
+    return TOP.pack(flags, int(plen) if plen else 0, _u32(count), raw)
+
+
+def _unpack_top(buf, off, k):
+    rows = []
+    for _ in range(k):
+        flags, plen, count, raw = TOP.unpack_from(buf, off)
+        off += TOP.size
+        size = flags & ~ip_key.PREFIX_FLAG
+        if not size:
+            break       # Hết danh sách (bảng có ít hơn K nguồn)
+        key = ip_key.key_to_str(raw[:4] if size == 4 else ip_key.v6_key(raw, 128))
+        if flags & ip_key.PREFIX_FLAG:
+            key = f"{key}/{plen}"
+        rows.append((key, count))
+    return rows
+
+
+class RingWriter:
+    """Phía detector. Mở lại file cũ cùng bố cục thì ghi tiếp (GUI không mất lịch sử khi detector restart)."""
+
+    def __init__(self, path=RING_FILE, capacity=CAPACITY, top_k=TOP_K):
+        self.path = path
+        self.capacity = capacity
+        self.top_k = top_k
+        self.slot_size = slot_size(top_k)
+        size = HEADER_SIZE + capacity * self.slot_size
+        try:
+            fd = os.open(path, os.O_RDWR)
+            if os.fstat(fd).st_size != size:
+                os.close(fd)
+                fd = None
+        except FileNotFoundError:
+            fd = None
+        if fd is None:
+            # Tạo file mới rồi đổi tên (không cắt file cũ: GUI đang mmap nó sẽ bị SIGBUS)
+            tmp = path + '.tmp'
+            fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, RING_MODE)
+            os.ftruncate(fd, size)
+            os.replace(tmp, path)
+        # File cũ (hoặc file tạm còn sót) có thể đã được tạo với quyền rộng hơn
+        os.fchmod(fd, RING_MODE)
+        try:
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        header = HEADER.pack(MAGIC, VERSION, capacity, self.slot_size, top_k)
+        if self.mm[:HEADER.size] != header:
+            self.mm[:] = bytes(size)
+            self.mm[:HEADER.size] = header
+        self.index = INDEX.unpack_from(self.mm, INDEX_OFF)[0]
+
+    def append(self, timestamp, established, totals, tracked, banned, bans_total,
+               udp_entropy, pressure, interval, cycle_time, tops):
+        """totals/tops: theo thứ tự TABLES; tops[i] = [(ip, số đếm)] (tối đa top_k)"""
+        mm = self.mm
+        off = HEADER_SIZE + (self.index % self.capacity) * self.slot_size
+        seq = SEQ.unpack_from(mm, off)[0]
+        SEQ.pack_into(mm, off, seq + 1)         # Lẻ: đang ghi
+        p = off + SEQ.size
+        RECORD.pack_into(mm, p, self.index, timestamp, -1 if established is None else established,
+                         *(_u32(t) for t in totals), _u32(tracked), _u32(banned), _u32(bans_total),
+                         udp_entropy, pressure, interval, cycle_time)
+        p += RECORD.size
+        for rows in tops:
+            entries = [_pack_top(ip, c) for ip, c in rows[:self.top_k]]
+            entries += [bytes(TOP.size)] * (self.top_k - len(entries))
+            mm[p:p + TOP.size * self.top_k] = b''.join(entries)
+            p += TOP.size * self.top_k
+        SEQ.pack_into(mm, off, seq + 2)         # Chẵn: xong
+        self.index += 1
+        INDEX.pack_into(mm, INDEX_OFF, self.index)
+
+    def close(self):
+        self.mm.close()
+
+
+class RingReader:
+    """Phía GUI: chỉ đọc, không khóa. Ném OSError nếu chưa có file, ValueError nếu sai định dạng."""
+
+    def __init__(self, path=RING_FILE):
+        self.path = path
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            st = os.fstat(fd)
+            if st.st_size < HEADER_SIZE:
+                raise ValueError(f"{path}: file ring quá nhỏ")
+            self.mm = mmap.mmap(fd, st.st_size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        self.inode = st.st_ino
+        magic, version, self.capacity, self.slot_size, self.top_k = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION or self.slot_size != slot_size(self.top_k) \
+                or st.st_size != HEADER_SIZE + self.capacity * self.slot_size:
+            self.mm.close()
+            raise ValueError(f"{path}: không phải ring buffer của detector (hoặc khác phiên bản)")
+
+    def is_stale(self):
+        """File đã bị tạo lại (detector đổi bố cục) -> cần mở lại"""
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except OSError:
+            return True
+
+    @property
+    def write_index(self):
+        return INDEX.unpack_from(self.mm, INDEX_OFF)[0]
+
+    def read(self, index):
+        """Bản ghi số index, None nếu đã bị ghi đè hoặc chưa có"""
+        off = HEADER_SIZE + (index % self.capacity) * self.slot_size
+        mm = self.mm
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(mm, off)[0]
+            if seq & 1:
+                continue            # Đang ghi dở
+            data = mm[off + SEQ.size:off + self.slot_size]
+            if SEQ.unpack_from(mm, off)[0] != seq:
+                continue            # Bị ghi đè trong lúc chép
+            fields = RECORD.unpack_from(data)
+            if fields[0] != index:
+                return None
+            top = {}
+            p = RECORD.size
+            for name in TABLES:
+                top[name] = _unpack_top(data, p, self.top_k)
+                p += TOP.size * self.top_k
+            established = fields[2] if fields[2] >= 0 else None
+            return CycleRecord(fields[0], fields[1], established, *fields[3:], top)
+        return None
+
+    def since(self, last_index=0, limit=None):
+        """Các bản ghi có index >= last_index còn trong ring (cũ -> mới)"""
+        end = self.write_index
+        start = max(last_index, end - self.capacity + 1, 0)
+        if limit is not None:
+            start = max(start, end - limit)
+        records = []
+        for i in range(start, end):
+            rec = self.read(i)
+            if rec is not None:
+                records.append(rec)
+        return records
+
+    def latest(self):
+        end = self.write_index
+        return self.read(end - 1) if end else None
+
+    def close(self):
+        self.mm.close()
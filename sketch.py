@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Đếm heavy-hitter với bộ nhớ cố định (thuật toán Space-Saving)
+Chỉ giữ tối đa k IP ứng viên; IP mới khi bảng đầy sẽ thay IP có số đếm nhỏ nhất
+và kế thừa số đếm đó làm sai số. Với k = ceil(1/epsilon), sai số mỗi IP <= epsilon * N.
+Dùng được như dict đếm: `counter[ip] += 1`, nên các bộ thu thập không cần sửa.
+"""
+
+import heapq
+import itertools
+import math
+import sys
+
+
+def capacity_for(epsilon, max_bytes=0):
+    """Số ứng viên k theo sai số epsilon, bị chặn bởi trần bộ nhớ (nếu có)"""
+    k = int(math.ceil(1.0 / epsilon))
+    if max_bytes > 0:
+        k = min(k, max(1, int(max_bytes // SpaceSaving.BYTES_PER_ENTRY)))
+    return k
+
+
+class SpaceSaving:
+    # dict count + dict error + 1 mục heap + chuỗi IP
+    BYTES_PER_ENTRY = 3 * 100 + sys.getsizeof('255.255.255.255')
+
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        # Mỗi key có đúng 1 mục (count, seq, key) trong heap; count trong heap có thể cũ (nhỏ hơn),
+        # chỉ được làm mới khi nó nổi lên đỉnh -> tăng đếm cho key đã có chỉ tốn 1 phép dict
+        self._heap = []
+        # seq phân định khi số đếm bằng nhau -> heap không bao giờ phải so sánh 2 key
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def __getitem__(self, key):
+        return self.counts.get(key, 0)
+
+    def __setitem__(self, key, value):
+        # Cho phép cú pháp counter[key] += n như dict/defaultdict
+        c = self.counts.get(key)
+        if c is not None:
+            self.counts[key] = value
+            self.total += value - c
+        else:
+            self.add(key, value)
+
+    def add(self, key, n=1):
+        counts = self.counts
+        self.total += n
+        c = counts.get(key)
+        if c is not None:
+            counts[key] = c + n
+            return
+        if len(counts) < self.capacity:
+            counts[key] = n
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (n, next(self._seq), key))
+            return
+        min_count = self._pop_min()
+        counts[key] = min_count + n
+        self.errors[key] = min_count
+        heapq.heappush(self._heap, (min_count + n, next(self._seq), key))
+
+    def _pop_min(self):
+        """Bỏ key có số đếm nhỏ nhất, trả về số đếm đó"""
+        heap = self._heap
+        counts = self.counts
+        while True:
+            c, seq, key = heap[0]
+            current = counts[key]
+            if current == c:
+                heapq.heappop(heap)
+                del counts[key]
+                del self.errors[key]
+                return c
+            heapq.heapreplace(heap, (current, seq, key))
+
+    def error(self, key):
+        return self.errors.get(key, 0)
+
+    def items(self):
+        """Số đếm đảm bảo (count - error): không bao giờ vượt số đếm thật,
+        tránh chặn nhầm IP chỉ vì kế thừa số đếm của IP bị thay thế."""
+        errors = self.errors
+        return [(k, c - errors[k]) for k, c in self.counts.items() if c > errors[k]]
+
+    def values(self):
+        return [c for _, c in self.items()]
+
+    def keys(self):
+        return [k for k, _ in self.items()]
+
+    def top(self, n):
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
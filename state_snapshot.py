@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Snapshot trạng thái của detector dạng nhị phân có phiên bản (khởi động lại không mất dữ liệu)
+- Lệnh chặn: thời điểm chặn + thời điểm hết hạn thật (không bị đặt lại về time.time())
+- Lịch sử vi phạm: số lần bị chặn + lần chặn gần nhất của mỗi IP
+- Baseline Z-Score của 3 bảng syn/conn/udp (để không "mù" MIN_SAMPLES chu kỳ sau restart)
+
+Định dạng: header | các section (tag 4 byte, độ dài u32, dữ liệu) | CRC32 của toàn bộ phía trước.
+Section lạ bị bỏ qua. Ghi ra file tạm rồi os.replace (nguyên tử).
+"""
+
+import os
+import struct
+import zlib
+from typing import NamedTuple
+
+from ip_key import pack as _pack_ip, read as _read_ip
+
+MAGIC = b'FWSNAP'
+VERSION = 2              # 2: khóa có thể là dải CIDR (lệnh chặn/baseline theo dải)
+HEADER = struct.Struct('<6sHdH')        # magic, version, thời điểm lưu, kích thước cửa sổ
+SECTION = struct.Struct('<4sI')
+COUNT = struct.Struct('<I')
+BAN = struct.Struct('<dd')              # banned_at, expires_at (0 = vĩnh viễn)
+OFFENDER = struct.Struct('<Id')         # số lần bị chặn, lần chặn gần nhất
+HISTORY = struct.Struct('<BI')          # số mẫu, số chu kỳ chưa xuất hiện
+CRC = struct.Struct('<I')
+
+HISTORY_TAGS = {'syn': b'HSYN', 'conn': b'HCON', 'udp': b'HUDP'}
+MAX_COUNT = 0xFFFFFFFF
+
+
+class Snapshot(NamedTuple):
+    saved_at: float
+    window_size: int
+    bans: dict          # ip -> (banned_at, expires_at | None)
+    offenders: dict     # ip -> (strikes, last_ban)
+    histories: dict     # 'syn'|'conn'|'udp' -> [(ip, [mẫu], age)]
+
+
+def _section(tag, count, body):
+    payload = COUNT.pack(count) + b''.join(body)
+    return SECTION.pack(tag, len(payload)) + payload
+
+
+def encode(saved_at, window_size, bans, offenders, histories):
+    parts = [HEADER.pack(MAGIC, VERSION, saved_at, window_size)]
+    body = [_pack_ip(ip) + BAN.pack(banned_at, expires_at or 0.0)
+            for ip, (banned_at, expires_at) in bans.items()]
+    parts.append(_section(b'BANS', len(body), body))
+    body = [_pack_ip(ip) + OFFENDER.pack(min(strikes, MAX_COUNT), last_ban)
+            for ip, (strikes, last_ban) in offenders.items()]
+    parts.append(_section(b'OFFN', len(body), body))
+    for name, tag in HISTORY_TAGS.items():
+        body = []
+        for ip, values, age in histories.get(name, ()):
+            values = [min(max(int(v), 0), MAX_COUNT) for v in values[-255:]]
+            body.append(_pack_ip(ip) + HISTORY.pack(len(values), min(max(age, 0), MAX_COUNT))
+                        + struct.pack(f'<{len(values)}I', *values))
+        parts.append(_section(tag, len(body), body))
+    data = b''.join(parts)
+    return data + CRC.pack(zlib.crc32(data))
+
+
+def decode(data):
+    """Ném ValueError nếu file hỏng, sai magic hoặc phiên bản mới hơn bản này hiểu được"""
+    if len(data) < HEADER.size + CRC.size:
+        raise ValueError("snapshot quá ngắn")
+    body, (crc,) = data[:-CRC.size], CRC.unpack(data[-CRC.size:])
+    if zlib.crc32(body) != crc:
+        raise ValueError("snapshot sai CRC (ghi dở hoặc hỏng)")
+    magic, version, saved_at, window_size = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise ValueError("không phải file snapshot")
+    if version > VERSION:
+        raise ValueError(f"snapshot phiên bản {version} mới hơn bản hỗ trợ ({VERSION})")
+    snap = Snapshot(saved_at, window_size, {}, {}, {name: [] for name in HISTORY_TAGS})
+    tag_names = {tag: name for name, tag in HISTORY_TAGS.items()}
+    buf = memoryview(body)
+    off = HEADER.size
+    while off < len(buf):
+        tag, length = SECTION.unpack_from(buf, off)
+        off += SECTION.size
+        end = off + length
+        if tag == b'BANS':
+            (count,), p = COUNT.unpack_from(buf, off), off + COUNT.size
+            for _ in range(count):
+                ip, p = _read_ip(buf, p)
+                banned_at, expires_at = BAN.unpack_from(buf, p)
+                p += BAN.size
+                snap.bans[ip] = (banned_at, expires_at or None)
+        elif tag == b'OFFN':
+            (count,), p = COUNT.unpack_from(buf, off), off + COUNT.size
+            for _ in range(count):
+                ip, p = _read_ip(buf, p)
+                snap.offenders[ip] = OFFENDER.unpack_from(buf, p)
+                p += OFFENDER.size
+        elif tag in tag_names:
+            entries = snap.histories[tag_names[tag]]
+            (count,), p = COUNT.unpack_from(buf, off), off + COUNT.size
+            for _ in range(count):
+                ip, p = _read_ip(buf, p)
+                n, age = HISTORY.unpack_from(buf, p)
+                p += HISTORY.size
+                entries.append((ip, list(struct.unpack_from(f'<{n}I', buf, p)), age))
+                p += 4 * n
+        off = end       # Section không biết -> bỏ qua
+    return snap
+
+
+def save(path, saved_at, window_size, bans, offenders, histories):
+    """Ghi nguyên tử; trả về số byte đã ghi"""
+    data = encode(saved_at, window_size, bans, offenders, histories)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(data)
+
+
+def load(path):
+    """Snapshot hoặc None nếu chưa có file"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    return decode(data)
@@ -6,12 +6,16 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.dates as mdates
 import matplotlib.ticker as ticker
 from datetime import datetime
-import json
 import subprocess
 from collections import defaultdict, deque
 import threading
 import time
-import os
+
+import alert_journal
+import ip_key
+import detector_config
+import shm_ring
+import metric_store
 
 # Thử import psutil để lấy thông số CPU/RAM
 try:
@@ -19,6 +23,11 @@ try:
 except ImportError:
     psutil = None
 
+RING_STALE_AFTER = 30   # Giây không có chu kỳ mới trong ring -> coi như detector đã dừng
+LIVE_VIEW = 'Truc tiep'
+HISTORY_VIEWS = ('1h', '24h', '30d')
+HISTORY_REFRESH = 30    # Giây giữa 2 lần đọc lại file lịch sử
+
 # --- BẢNG MÀU ---
 COLORS = {
     'red': '#e74c3c',      
@@ -43,6 +52,20 @@ class StatisticsTab:
         self.ip_connections = defaultdict(int)
         self.sys_data = deque(maxlen=60) 
         self.alert_data = deque(maxlen=50) 
+        # Ring buffer chia sẻ của detector: có thì vẽ trực tiếp, không cần chạy ss
+        self.state_counts = None
+        self.ring = None
+        self.ring_index = 0
+        try:
+            settings = detector_config.load_settings()
+        except (OSError, ValueError):
+            settings = detector_config.DEFAULT_SETTINGS
+        self.ring_path = settings.stats_ring
+        # Lịch sử dài hạn của detector (biểu đồ 1 khi chọn khung 1h/24h/30d)
+        self.history_path = settings.history_file
+        self.history_series = None
+        self.history_loaded = (None, 0.0)      # (khung nhìn, thời điểm đọc)
+        self.view = LIVE_VIEW
         
         try:
             plt.style.use('ggplot')
@@ -55,6 +78,16 @@ class StatisticsTab:
         main_frame = ttk.Frame(self.parent)
         main_frame.pack(fill=tk.BOTH, expand=True)
         
+        # Chọn khung thời gian cho biểu đồ lưu lượng
+        toolbar = ttk.Frame(main_frame)
+        toolbar.pack(fill=tk.X, padx=10, pady=(5, 0))
+        ttk.Label(toolbar, text="Khung thoi gian:").pack(side=tk.LEFT)
+        self.view_var = tk.StringVar(value=LIVE_VIEW)
+        view_box = ttk.Combobox(toolbar, textvariable=self.view_var, state='readonly', width=10,
+                                values=(LIVE_VIEW,) + HISTORY_VIEWS)
+        view_box.pack(side=tk.LEFT, padx=5)
+        view_box.bind('<<ComboboxSelected>>', self.on_view_changed)
+
         # Charts Frame
         canvas_frame = ttk.Frame(main_frame)
         canvas_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -97,6 +130,7 @@ class StatisticsTab:
             while True:
                 try:
                     self.collect_network_stats()
+                    self.collect_history()
                     self.collect_system_stats()
                     self.collect_alerts_log()
                     try: self.parent.after(0, self.update_displays)
@@ -107,8 +141,40 @@ class StatisticsTab:
                     time.sleep(30)
         t = threading.Thread(target=collect, daemon=True)
         t.start()
+
+    def read_ring(self):
+        """Lấy các chu kỳ mới từ ring buffer của detector (không fork, không parse).
+        False nếu không có ring hoặc detector đã ngừng ghi -> quay về dùng ss."""
+        if not self.ring_path:
+            return False
+        if self.ring is not None and self.ring.is_stale():
+            self.ring.close()
+            self.ring = None
+        if self.ring is None:
+            try:
+                self.ring = shm_ring.RingReader(self.ring_path)
+            except (OSError, ValueError):
+                return False
+            # Lần đầu: lấy lại đủ số điểm của biểu đồ
+            self.ring_index = max(0, self.ring.write_index - self.connection_data.maxlen)
+        records = self.ring.since(self.ring_index)
+        for rec in records:
+            if rec.established is not None:
+                self.connection_data.append((datetime.fromtimestamp(rec.timestamp), rec.established))
+        if records:
+            self.ring_index = records[-1].index + 1
+        latest = self.ring.latest()
+        if latest is None or time.time() - latest.timestamp > max(RING_STALE_AFTER, 3 * latest.interval):
+            self.state_counts = None
+            return False
+        self.ip_connections = defaultdict(int, latest.top['conn'])
+        self.state_counts = {'ESTABLISHED': latest.established or 0, 'SYN_RECV': latest.syn_total,
+                             'UDP': latest.udp_total}
+        return True
     
     def collect_network_stats(self):
+        if self.read_ring():
+            return      # Detector đang ghi ring buffer
         try:
             res = subprocess.run("ss -tn | grep -c ESTAB", shell=True, capture_output=True, text=True)
             count = int(res.stdout.strip()) if res.stdout.strip().isdigit() else 0
@@ -119,13 +185,30 @@ class StatisticsTab:
             for line in res_ip.stdout.splitlines()[1:]:
                 parts = line.split()
                 if len(parts) >= 1:
-                    addr = parts[-1]
-                    if ']' in addr: ip = addr.split(']')[0].replace('[','')
-                    else: ip = addr.split(':')[0]
-                    if self.is_valid_ip(ip): ips[ip] += 1
+                    # Gộp giống detector: IPv4-mapped -> IPv4, IPv6 theo /64
+                    host = ip_key.split_host_port(parts[-1])
+                    if self.is_valid_ip(host): ips[ip_key.source_key(host)] += 1
             self.ip_connections = ips
         except: pass
 
+    def on_view_changed(self, event=None):
+        self.view = self.view_var.get()
+        self.update_charts()
+
+    def collect_history(self):
+        """Đọc lại file lịch sử khi đổi khung nhìn hoặc sau HISTORY_REFRESH giây"""
+        view = self.view
+        if view == LIVE_VIEW or not self.history_path:
+            return
+        loaded_view, loaded_at = self.history_loaded
+        if view == loaded_view and time.time() - loaded_at < HISTORY_REFRESH:
+            return
+        try:
+            self.history_series = metric_store.query_view(view, 'established', self.history_path)
+        except (OSError, ValueError):
+            self.history_series = None
+        self.history_loaded = (view, time.time())
+
     def collect_system_stats(self):
         try:
             t = datetime.now()
@@ -140,18 +223,15 @@ class StatisticsTab:
 
     def collect_alerts_log(self):
         try:
-            fpath = '/var/log/firewall_alerts.json'
-            if os.path.exists(fpath):
-                with open(fpath, 'r') as f:
-                    try: alerts = json.load(f)
-                    except: alerts = []
-                for a in alerts[-10:]:
-                    ts = a.get('timestamp')
-                    ip = a.get('ip', 'N/A')
-                    reason = a.get('reason', '')
-                    t_str = datetime.fromtimestamp(float(ts)).strftime('%H:%M:%S') if ts else "N/A"
-                    line = f"[{t_str}] {ip} - {reason}\n"
-                    if line not in self.alert_data: self.alert_data.append(line)
+            # Chỉ đọc 10 dòng cuối của nhật ký JSONL
+            alerts = alert_journal.read_alerts(10)
+            for a in alerts:
+                ts = a.get('timestamp')
+                ip = a.get('ip', 'N/A')
+                reason = a.get('reason', '')
+                t_str = datetime.fromtimestamp(float(ts)).strftime('%H:%M:%S') if ts else "N/A"
+                line = f"[{t_str}] {ip} - {reason}\n"
+                if line not in self.alert_data: self.alert_data.append(line)
         except: pass
     
     def update_displays(self):
@@ -164,7 +244,10 @@ class StatisticsTab:
             ax.set_facecolor(COLORS['bg_chart'])
         
         # === CHART 1: LƯU LƯỢNG MẠNG ===
-        if self.connection_data:
+        view = self.view
+        if view != LIVE_VIEW:
+            self.draw_history(view)
+        elif self.connection_data:
             times, vals = zip(*self.connection_data)
             self.ax1.plot(times, vals, color=COLORS['blue'], linewidth=2)
             self.ax1.fill_between(times, vals, color=COLORS['blue'], alpha=0.2)
@@ -189,6 +272,13 @@ class StatisticsTab:
             sizes = [20, 60, 10, 10] 
             
         colors = [COLORS['green'], COLORS['red'], COLORS['gray'], COLORS['blue']]
+        # Có số liệu thật từ ring buffer của detector
+        state_counts = self.state_counts
+        if state_counts and any(state_counts.values()):
+            labels = [k for k, v in state_counts.items() if v]
+            sizes = [v for v in state_counts.values() if v]
+            colors = [{'ESTABLISHED': COLORS['green'], 'SYN_RECV': COLORS['red'],
+                       'UDP': COLORS['orange']}[k] for k in labels]
         
         wedges, texts, autotexts = self.ax2.pie(sizes, labels=labels, autopct='%1.1f%%', 
                                                 startangle=90, colors=colors, pctdistance=0.85,
@@ -245,6 +335,30 @@ class StatisticsTab:
         try: self.canvas.draw()
         except: pass
 
+    def draw_history(self, view):
+        """Biểu đồ 1 ở khung 1h/24h/30d: đường trung bình + dải min/max của mỗi bucket"""
+        series = self.history_series
+        loaded_view = self.history_loaded[0]
+        self.ax1.set_title(f'Luu Luong Mang ({view})', fontsize=10, fontweight='bold', color=COLORS['dark'])
+        points = [p for p in series.points if p[3] == p[3]] if series and loaded_view == view else []
+        if not points:
+            self.ax1.text(0.5, 0.5, "Chua co du lieu lich su", ha='center', color=COLORS['gray'],
+                          transform=self.ax1.transAxes)
+            return
+        times = [datetime.fromtimestamp(p[0]) for p in points]
+        lows, highs, avgs = [p[1] for p in points], [p[2] for p in points], [p[3] for p in points]
+        self.ax1.fill_between(times, lows, highs, color=COLORS['blue'], alpha=0.2, label='min-max')
+        self.ax1.plot(times, avgs, color=COLORS['blue'], linewidth=1.5, label='trung binh')
+        self.ax1.set_xlabel(f'Thoi gian (moi diem = {series.tier})', fontsize=8, color=COLORS['dark'])
+        self.ax1.set_ylabel('So luong ket noi', fontsize=8, color=COLORS['dark'])
+        self.ax1.legend(loc='upper left', fontsize=8, frameon=True)
+        self.ax1.tick_params(axis='x', rotation=0, labelsize=8)
+        self.ax1.grid(True, linestyle='--', alpha=0.5)
+        try:
+            self.ax1.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M' if view == '1h' else '%d/%m %Hh'))
+            self.ax1.xaxis.set_major_locator(ticker.MaxNLocator(nbins=4))
+        except: pass
+
     def update_text_widgets(self):
         try:
             self.alerts_text.delete(1.0, tk.END)
@@ -253,7 +367,7 @@ class StatisticsTab:
             self.top_ips_text.delete(1.0, tk.END)
             if self.ip_connections:
                 for ip, c in sorted(self.ip_connections.items(), key=lambda x: x[1], reverse=True)[:10]:
-                    self.top_ips_text.insert(tk.END, f"{ip:<15} : {c}\n")
+                    self.top_ips_text.insert(tk.END, f"{ip:<22} : {c}\n")
             else:
                 self.top_ips_text.insert(tk.END, "Khong co ket noi nao.\n")
         except: pass
@@ -261,4 +375,4 @@ class StatisticsTab:
     def is_valid_ip(self, ip):
         if not ip: return False
         if ip == '127.0.0.1' or ip == '::1': return False
-        return len(ip.split('.'))==4
+        return ip_key.is_valid(ip)
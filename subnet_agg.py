@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Gộp số đếm theo IP nguồn lên các dải mạng (/24, /16 cho IPv4; /48, /32 cho IPv6 - nguồn IPv6
+vốn đã được đếm theo /64) để phát hiện botnet rải đều trên vài subnet (mỗi host đều dưới ngưỡng) và chặn cả dải bằng 1 lệnh.
+Khóa của dải là chuỗi CIDR chuẩn ('203.0.113.0/24') nên dùng chung được bảng lịch sử Z-Score
+và backend chặn (ipset hash:net, nft set interval, iptables -s đều nhận CIDR).
+"""
+
+import ipaddress
+import socket
+from collections import defaultdict
+
+
+def _parse(key):
+    """(AF, số nguyên, số bit, độ dài tiền tố) của IP lẻ hoặc khóa dải, None nếu không hợp lệ"""
+    ip, _, plen = key.partition('/')
+    for family, bits in ((socket.AF_INET, 32), (socket.AF_INET6, 128)):
+        try:
+            value = int.from_bytes(socket.inet_pton(family, ip), 'big')
+        except OSError:
+            continue
+        return family, value, bits, int(plen) if plen.isdigit() else bits
+    return None
+
+
+def _key(family, value, bits, length):
+    net = value & (((1 << length) - 1) << (bits - length))
+    return f"{socket.inet_ntop(family, net.to_bytes(bits // 8, 'big'))}/{length}"
+
+
+def prefix_key(ip, length_v4, length_v6):
+    """Dải chứa ip theo độ dài tương ứng với họ địa chỉ, None nếu không áp dụng"""
+    parsed = _parse(ip)
+    if parsed is None:
+        return None
+    family, value, bits, plen = parsed
+    length = length_v4 if bits == 32 else length_v6
+    if not length or length >= plen:
+        return None
+    return _key(family, value, bits, length)
+
+
+def covering_prefixes(ip, lengths_v4, lengths_v6):
+    """Tất cả các dải (theo cấu hình) chứa ip (hoặc chứa trọn dải ip)"""
+    parsed = _parse(ip)
+    if parsed is None:
+        return []
+    family, value, bits, plen = parsed
+    lengths = lengths_v4 if bits == 32 else lengths_v6
+    return [_key(family, value, bits, length) for length in lengths if length < plen]
+
+
+def aggregate(stats, lengths_v4, lengths_v6):
+    """Gộp {ip: số đếm} theo từng mức dải.
+
+    Khóa đã là dải (nguồn IPv6 /64) chỉ được gộp lên các dải rộng hơn nó.
+    Trả về list theo mức (mức 0 = dải hẹp nhất: /24 và /48), mỗi mức là (counts, sources):
+    counts = {dải: tổng số đếm}, sources = {dải: số IP nguồn khác nhau}."""
+    levels = max(len(lengths_v4), len(lengths_v6))
+    result = [(defaultdict(int), defaultdict(int)) for _ in range(levels)]
+    v4 = sorted(lengths_v4, reverse=True)
+    v6 = sorted(lengths_v6, reverse=True)
+    for ip, count in stats.items():
+        parsed = _parse(ip)
+        if parsed is None:
+            continue
+        family, value, bits, plen = parsed
+        for level, length in enumerate(v4 if bits == 32 else v6):
+            if length >= plen:
+                continue
+            key = _key(family, value, bits, length)
+            counts, sources = result[level]
+            counts[key] += count
+            sources[key] += 1
+    return result
+
+
+def is_prefix(key):
+    return '/' in key
+
+
+def within(child, parent):
+    """child (IP hoặc CIDR) nằm trong dải parent?"""
+    try:
+        c = ipaddress.ip_network(child, strict=False)
+        p = ipaddress.ip_network(parent, strict=False)
+    except ValueError:
+        return False
+    return c.version == p.version and c != p and c.subnet_of(p)
@@ -0,0 +1,59 @@
+import json
+import time
+
+import alert_journal
+from alert_journal import AlertJournal, AlertTail
+
+
+NOW = time.time()
+
+
+def alert(i):
+    # Timestamp gần hiện tại: journal xoay vòng theo tuổi của dòng đầu tiên
+    return {'ip': f'10.0.0.{i}', 'timestamp': NOW + i}
+
+
+def test_tail_reads_only_new_lines(tmp_path):
+    path = str(tmp_path / 'alerts.jsonl')
+    journal = AlertJournal(path)
+    for i in range(3):
+        journal.append(alert(i))
+    tail = AlertTail(path, backlog=2, legacy=str(tmp_path / 'none.json'))
+    assert tail.poll() == ([alert(1), alert(2)], False)
+    journal.append(alert(3))
+    assert tail.poll() == ([alert(3)], False)
+    assert tail.poll() == ([], False)
+    journal.close()
+    tail.close()
+
+
+def test_legacy_fallback_then_migrated_journal(tmp_path):
+    path = str(tmp_path / 'alerts.jsonl')
+    legacy = tmp_path / 'alerts.json'
+    legacy.write_text(json.dumps([alert(i) for i in range(3)]))
+    tail = AlertTail(path, backlog=2, legacy=str(legacy))
+    assert tail.poll() == ([alert(1), alert(2)], False)
+    assert tail.poll() == ([], False)
+
+    # Detector khởi động: chuyển file cũ sang journal rồi ghi tiếp cảnh báo mới
+    assert alert_journal.migrate_legacy(str(legacy), path) == 3
+    journal = AlertJournal(path)
+    journal.append(alert(3))
+    journal.close()
+    # Cảnh báo cũ không bị trả về lần nữa
+    assert tail.poll() == ([alert(3)], False)
+    tail.close()
+
+
+def test_legacy_fallback_then_fresh_journal(tmp_path):
+    path = str(tmp_path / 'alerts.jsonl')
+    legacy = tmp_path / 'alerts.json'
+    legacy.write_text(json.dumps([alert(0)]))
+    tail = AlertTail(path, backlog=5, legacy=str(legacy))
+    assert tail.poll() == ([alert(0)], False)
+    # File cũ vẫn còn (chưa migrate): mọi dòng của journal đều là cảnh báo mới
+    journal = AlertJournal(path)
+    journal.append(alert(1))
+    journal.close()
+    assert tail.poll() == ([alert(1)], False)
+    tail.close()
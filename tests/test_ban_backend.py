@@ -0,0 +1,202 @@
+import ipaddress
+import subprocess
+
+import pytest
+
+import auto_block
+import ban_backend
+import detector_config
+
+
+class FakeNft:
+    """Giả lập `nft -f`: áp từng dòng theo thứ tự lên set có flags interval,
+    từ chối phần tử chồng lấn và hủy cả giao dịch nếu 1 dòng lỗi"""
+
+    def __init__(self):
+        self.elements = set()
+        self.scripts = []
+
+    def __call__(self, cmd, script):
+        self.scripts.append(script)
+        elements = set(self.elements)
+        for line in script.splitlines():
+            parts = line.split()
+            op, ip = parts[0], parts[6]
+            net = ipaddress.ip_network(ip, strict=False)
+            if op == 'add':
+                if any(net.overlaps(ipaddress.ip_network(e, strict=False)) for e in elements):
+                    raise subprocess.CalledProcessError(1, cmd, stderr='interval overlaps')
+                elements.add(ip)
+            elif ip in elements:
+                elements.remove(ip)
+            else:
+                raise subprocess.CalledProcessError(1, cmd, stderr='No such file or directory')
+        self.elements = elements
+
+
+@pytest.fixture
+def fake_nft(monkeypatch):
+    fake = FakeNft()
+    monkeypatch.setattr(ban_backend, '_restore', fake)
+    return fake
+
+
+@pytest.fixture
+def detector(tmp_path, fake_nft):
+    settings = detector_config.DEFAULT_SETTINGS._replace(
+        metrics_listen='', state_file='', ipc_socket='', stats_ring='', history_file='',
+        whitelist=frozenset())
+    return auto_block.DosDetector(settings=settings, backend=ban_backend.NftSetBackend(),
+                                  alert_file=str(tmp_path / 'alerts.jsonl'))
+
+
+def test_nft_batch_deletes_before_adds(monkeypatch):
+    script = []
+    monkeypatch.setattr(ban_backend, '_restore', lambda cmd, s: script.extend(s.splitlines()))
+    ban_backend.NftSetBackend().apply_batch([('10.0.0.0/24', 600)], ['10.0.0.1', '2001:db8::/64'])
+    assert [line.split()[0] for line in script] == ['delete', 'delete', 'add']
+    assert script[1].endswith('blacklist6 { 2001:db8::/64 }')
+    assert script[2].endswith('blacklist4 { 10.0.0.0/24 timeout 600s }')
+
+
+def test_collapse_children_into_prefix(detector, fake_nft):
+    for ip in ('10.0.0.1', '10.0.0.2', '10.0.1.1'):
+        detector.block_ip(ip, 'test')
+    detector.commit_bans()
+    assert fake_nft.elements == {'10.0.0.1', '10.0.0.2', '10.0.1.1'}
+
+    detector.block_ip('10.0.0.0/24', 'subnet')
+    detector.commit_bans()
+    # Các IP con trong dải được gỡ trong cùng giao dịch, IP ngoài dải giữ nguyên
+    assert fake_nft.elements == {'10.0.0.0/24', '10.0.1.1'}
+    assert set(detector.banned_ips) == {'10.0.0.0/24', '10.0.1.1'}
+    assert detector.banned_prefixes == {'10.0.0.0/24'}
+    assert not detector.pending
+
+
+def test_failed_batch_restores_collapsed_children(detector, fake_nft):
+    detector.block_ip('10.0.0.1', 'test')
+    detector.commit_bans()
+    fake_nft.elements.add('10.0.0.128/25')      # Phần tử lạ chồng lấn -> nft từ chối cả lô
+    detector.block_ip('10.0.0.0/24', 'subnet')
+    detector.commit_bans()
+    assert fake_nft.elements == {'10.0.0.1', '10.0.0.128/25'}
+    assert set(detector.banned_ips) == {'10.0.0.1'}
+    assert not detector.banned_prefixes
+
+
+class FakeIptables:
+    """Giả lập chain INPUT của iptables/ip6tables cho `-S INPUT` và `*-restore --noflush`"""
+
+    def __init__(self, rules=(), fail=()):
+        self.rules = {'iptables': [], 'ip6tables': []}
+        for tool, src in rules:
+            self.rules[tool].append(src)
+        self.fail = set(fail)       # Công cụ restore sẽ lỗi
+        self.scripts = {}
+
+    def run(self, cmd, check=True):
+        out = ''.join(f"-A INPUT -s {src} -j DROP\n" for src in self.rules[cmd[0]])
+        return subprocess.CompletedProcess(cmd, 0, stdout='-P INPUT ACCEPT\n' + out, stderr='')
+
+    def restore(self, cmd, script):
+        tool = cmd[0].replace('-restore', '')
+        self.scripts[tool] = script.splitlines()
+        if tool in self.fail:
+            raise subprocess.CalledProcessError(1, cmd, stderr=f'{tool}-restore: line 2 failed')
+        rules = list(self.rules[tool])
+        for line in script.splitlines()[1:-1]:
+            op, src = line.split()[0], line.split()[3]
+            full = src if '/' in src else src + ('/128' if ':' in src else '/32')
+            if op == '-I':
+                rules.insert(0, full)
+            else:
+                rules.remove(full)      # Rule không tồn tại -> lỗi như iptables thật
+        self.rules[tool] = rules
+
+
+@pytest.fixture
+def fake_iptables(monkeypatch):
+    fake = FakeIptables()
+    monkeypatch.setattr(ban_backend, '_run', fake.run)
+    monkeypatch.setattr(ban_backend, '_restore', fake.restore)
+    return fake
+
+
+def test_iptables_batch_skips_existing_and_missing_rules(fake_iptables):
+    fake_iptables.rules['iptables'] = ['1.1.1.1/32', '3.3.3.3/32', '3.3.3.3/32']
+    ban_backend.IptablesBackend().apply_batch([('1.1.1.1', 0), ('2.2.2.2', 0)], ['3.3.3.3', '4.4.4.4'])
+    # 1.1.1.1 đã có rule -> không thêm trùng; 4.4.4.4 đã bị gỡ tay -> không -D; rule trùng của 3.3.3.3 gỡ hết
+    assert fake_iptables.rules['iptables'] == ['2.2.2.2/32', '1.1.1.1/32']
+    assert 'ip6tables' not in fake_iptables.scripts
+
+
+def test_iptables_batch_reports_failed_family_only(fake_iptables, tmp_path):
+    fake_iptables.fail.add('ip6tables')
+    settings = detector_config.DEFAULT_SETTINGS._replace(
+        metrics_listen='', state_file='', ipc_socket='', stats_ring='', history_file='',
+        whitelist=frozenset())
+    det = auto_block.DosDetector(settings=settings, backend=ban_backend.IptablesBackend(),
+                                 alert_file=str(tmp_path / 'alerts.jsonl'))
+    with pytest.raises(ban_backend.BatchError) as err:
+        det.backend.apply_batch([('1.1.1.1', 0), ('2001:db8::/64', 0)], [])
+    assert err.value.failed == {'2001:db8::/64'}
+
+    det.block_ip('5.5.5.5', 'test')
+    det.block_ip('2001:db8:1::/64', 'test')
+    det.commit_bans()
+    # IPv4 đã có hiệu lực -> giữ sổ sách; chỉ IPv6 bị hoàn tác
+    assert set(det.banned_ips) == {'5.5.5.5'}
+    assert '5.5.5.5/32' in fake_iptables.rules['iptables']
+    assert det.bans_total == 1
+    assert not det.pending
+
+
+class FailingIpset:
+    """`ipset restore` của lô lỗi; ghi lại lô hoàn tác (có thể cho lỗi luôn)"""
+
+    def __init__(self, undo_rc=0):
+        self.undo_rc = undo_rc
+        self.undo = None
+
+    def restore(self, cmd, script):
+        raise subprocess.CalledProcessError(1, cmd, stderr='ipset v7: Element cannot be added')
+
+    def run(self, cmd, input=None, **kwargs):
+        self.undo = input.splitlines()
+        return subprocess.CompletedProcess(cmd, self.undo_rc, stdout='', stderr='undo failed')
+
+
+@pytest.fixture
+def failing_ipset(monkeypatch):
+    fake = FailingIpset()
+    monkeypatch.setattr(ban_backend, '_restore', fake.restore)
+    monkeypatch.setattr(ban_backend.subprocess, 'run', fake.run)
+    return fake
+
+
+def test_ipset_undo_keeps_remaining_timeout(failing_ipset, tmp_path):
+    clock = [1000.0]
+    settings = detector_config.DEFAULT_SETTINGS._replace(
+        metrics_listen='', state_file='', ipc_socket='', stats_ring='', history_file='',
+        whitelist=frozenset(), ban_time=600)
+    det = auto_block.DosDetector(settings=settings, backend=ban_backend.IpsetBackend(),
+                                 alert_file=str(tmp_path / 'alerts.jsonl'), clock=lambda: clock[0])
+    det.block_ip('10.0.0.1', 'test')
+    det.pending.clear()             # Coi như lô trước đã áp dụng thành công
+    clock[0] += 100
+    det.block_ip('10.0.0.0/24', 'subnet')
+    det.commit_bans()
+    assert 'add fw_blacklist 10.0.0.1 timeout 500' in failing_ipset.undo
+    assert 'del fw_blacklist 10.0.0.0/24' in failing_ipset.undo
+    # Sổ sách: IP con được khôi phục với đúng hạn cũ
+    assert set(det.banned_ips) == {'10.0.0.1'}
+    assert det.expiry.deadline('10.0.0.1') == 1600.0
+
+
+def test_ipset_failed_undo_raises(failing_ipset):
+    failing_ipset.undo_rc = 1
+    with pytest.raises(ban_backend.BatchError) as err:
+        ban_backend.IpsetBackend().apply_batch([('1.1.1.1', 60)], ['2.2.2.2'], {'2.2.2.2': 30})
+    assert err.value.failed == {'1.1.1.1', '2.2.2.2'}
+    assert 'add fw_blacklist 2.2.2.2 timeout 30' in failing_ipset.undo
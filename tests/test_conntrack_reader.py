@@ -0,0 +1,29 @@
+import conntrack_reader
+from conntrack_reader import ConntrackReader
+from sketch import SpaceSaving
+
+
+def flow(src):
+    family = 'ipv6 10' if ':' in src else 'ipv4 2'
+    return f"{family} udp 17 29 src={src} dst=10.0.0.1 sport=5000 dport=53 [UNREPLIED] mark=0\n"
+
+
+def test_mixed_families_with_tiny_sketch(tmp_path):
+    # Số đếm bằng nhau giữa khóa IPv4 và IPv6: heap của sketch không được so sánh 2 kiểu khóa
+    lines = [flow('203.0.113.1'), flow('2001:db8:1:2::1'), flow('198.51.100.1'),
+             flow('2001:db8:1:3::1'), flow('203.0.113.1'), flow('2001:db8:1:2::5')] * 3
+    path = tmp_path / 'nf_conntrack'
+    path.write_text(''.join(lines))
+    reader = ConntrackReader(str(path))
+    stats = reader.count_sources(new_counter=lambda: SpaceSaving(2), v6_prefix=64)
+    assert set(stats) <= {'203.0.113.1', '198.51.100.1', '2001:db8:1:2::/64', '2001:db8:1:3::/64'}
+    assert stats['203.0.113.1'] <= 6
+
+
+def test_exact_counts(tmp_path):
+    path = tmp_path / 'nf_conntrack'
+    path.write_text(flow('203.0.113.1') * 2 + flow('::ffff:203.0.113.1') + flow('2001:db8::1')
+                    + flow('2001:db8::2') + 'ipv4 2 tcp 6 src=1.1.1.1\n')
+    stats = ConntrackReader(str(path)).count_sources(whitelist={'2001:db8::2'}, v6_prefix=128)
+    assert dict(stats) == {'203.0.113.1': 3, '2001:db8::1': 1}
+    assert conntrack_reader.extract_src(flow('1.2.3.4')) == '1.2.3.4'
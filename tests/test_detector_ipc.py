@@ -0,0 +1,113 @@
+import json
+import socket
+import time
+
+import pytest
+
+import detector_ipc
+import sample_bus
+from sample_bus import Sample
+
+
+def make_sample(ts, established=7):
+    return Sample(ts, {'1.1.1.1': 3}, {'2.2.2.2': 5, '3.3.3.3': 1}, {}, established, 'netlink')
+
+
+@pytest.fixture
+def ipc(tmp_path):
+    ipc = detector_ipc.DetectorIPC(lambda: {'1.1.1.1': (100.0, None)}, sample_bus.SampleBus())
+    ipc.path = str(tmp_path / 'detector.sock')
+    ipc.serve(ipc.path)
+    yield ipc
+    ipc.close()
+
+
+def connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    sock.connect(path)
+    f = sock.makefile('rwb')
+
+    def ask(req):
+        f.write(json.dumps(req).encode() + b'\n')
+        f.flush()
+        return json.loads(f.readline())
+    ask.readline = lambda: json.loads(f.readline())
+    ask.close = lambda: (f.close(), sock.close())
+    return ask
+
+
+@pytest.fixture
+def conn(ipc):
+    ask = connect(ipc.path)
+    yield ask
+    ask.close()
+
+
+@pytest.mark.parametrize('req', [
+    {'cmd': 'bans', 'limit': 'x'},
+    {'cmd': 'snapshot', 'top': None},
+    {'cmd': 'unknown'},
+    {'cmd': 'subscribe', 'interval': 'x'},
+    {'cmd': 'subscribe', 'top': None},
+    {'cmd': 'subscribe', 'topics': 'events'},
+    {'cmd': 'subscribe', 'topics': ['bans']},
+    {'cmd': 'subscribe', 'interval': 1e400},
+])
+def test_bad_request_gets_error_reply(conn, req):
+    reply = conn(req)
+    assert reply['ok'] is False and reply['error']
+    # Kết nối vẫn dùng được sau yêu cầu lỗi
+    assert conn({'cmd': 'ping'})['ok'] is True
+
+
+def test_bans(conn):
+    reply = conn({'cmd': 'bans'})
+    assert reply['total'] == 1
+    assert reply['bans'] == [{'ip': '1.1.1.1', 'banned_at': 100.0, 'expires_at': None}]
+
+
+def test_sample(ipc, conn):
+    assert conn({'cmd': 'sample'})['ok'] is False
+    ipc.bus.publish(make_sample(10.0))
+    sample = conn({'cmd': 'sample', 'top': 1})['sample']
+    assert sample['established'] == 7
+    assert sample['totals'] == {'syn': 3, 'conn': 6, 'udp': 0}
+    assert sample['top']['conn'] == [['2.2.2.2', 5]]
+
+
+def test_samples_fan_out_at_each_subscriber_rate(ipc):
+    fast, slow = connect(ipc.path), connect(ipc.path)
+    try:
+        assert fast({'cmd': 'subscribe', 'topics': ['samples'], 'top': 0})['ok']
+        assert slow({'cmd': 'subscribe', 'topics': ['samples'], 'interval': 2})['ok']
+        assert len(ipc.bus) == 2
+        for ts in range(5):
+            ipc.bus.publish(make_sample(float(ts)))
+        assert [fast.readline()['timestamp'] for _ in range(5)] == [0, 1, 2, 3, 4]
+        # Mẫu ở giữa bị bỏ qua, không dồn hàng
+        assert [slow.readline()['timestamp'] for _ in range(3)] == [0, 2, 4]
+    finally:
+        fast.close()
+        slow.close()
+
+
+def test_bus_isolates_failing_subscriber():
+    bus = sample_bus.SampleBus()
+    got = []
+    bus.subscribe(lambda s: 1 / 0)
+    sub = bus.subscribe(got.append)
+    bus.publish(make_sample(1.0))
+    bus.unsubscribe(sub)
+    bus.publish(make_sample(2.0))
+    assert [s.timestamp for s in got] == [1.0]
+    assert bus.latest.timestamp == 2.0
+
+
+def test_live_feed(ipc):
+    feed = detector_ipc.LiveFeed(ipc.path, interval=0).start()
+    deadline = time.monotonic() + 5
+    while feed.get() is None and time.monotonic() < deadline:
+        ipc.bus.publish(make_sample(time.time()))
+        time.sleep(0.05)
+    assert feed.get()['established'] == 7
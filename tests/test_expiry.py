@@ -0,0 +1,34 @@
+from expiry import ExpiryScheduler
+
+
+def test_pop_due_in_deadline_order():
+    s = ExpiryScheduler()
+    s.schedule('3.3.3.3', 30.0)
+    s.schedule('1.1.1.1', 10.0)
+    s.schedule('2.2.2.2', 20.0)
+    assert s.next_deadline() == 10.0
+    assert s.pop_due(25.0) == ['1.1.1.1', '2.2.2.2']
+    assert len(s) == 1 and '3.3.3.3' in s
+    assert s.pop_due(25.0) == []
+
+
+def test_reschedule_and_cancel_skip_stale_entries():
+    s = ExpiryScheduler()
+    s.schedule('1.1.1.1', 10.0)
+    s.schedule('1.1.1.1', 50.0)         # Gia hạn: mục cũ (10) bị bỏ qua
+    s.schedule('2.2.2.2', 20.0)
+    assert s.cancel('2.2.2.2')
+    assert not s.cancel('2.2.2.2')
+    assert s.next_deadline() == 50.0
+    assert s.pop_due(40.0) == []
+    assert s.deadline('1.1.1.1') == 50.0
+    assert s.pop_due(50.0) == ['1.1.1.1']
+    assert s.next_deadline() is None
+
+
+def test_heap_compacts_after_many_reschedules():
+    s = ExpiryScheduler()
+    for i in range(1000):
+        s.schedule('1.1.1.1', float(i))
+    assert len(s._heap) <= 2 * len(s) + 64
+    assert s.deadlines() == {'1.1.1.1': 999.0}
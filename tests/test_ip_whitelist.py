@@ -0,0 +1,47 @@
+import pytest
+
+from ip_whitelist import Whitelist, validate_entries, normalize
+
+
+@pytest.fixture
+def whitelist():
+    return Whitelist(['10.0.0.0/8', '192.168.1.5', '2001:db8::/32', '::ffff:172.16.0.1'])
+
+
+@pytest.mark.parametrize('ip, expected', [
+    ('10.1.2.3', True),
+    ('11.0.0.1', False),
+    ('192.168.1.5', True),
+    ('192.168.1.6', False),
+    ('172.16.0.1', True),               # Mục IPv4-mapped được đổi về IPv4
+    ('::ffff:10.9.9.9', True),
+    ('2001:db8:1::1', True),
+    ('2001:db9::1', False),
+    ('not-an-ip', False),
+])
+def test_match(whitelist, ip, expected):
+    assert (ip in whitelist) is expected
+
+
+@pytest.mark.parametrize('prefix, expected', [
+    ('10.5.0.0/16', True),              # Nằm trong 1 mục
+    ('192.168.1.0/24', True),           # Chứa 1 IP tin cậy -> không được chặn cả dải
+    ('192.168.2.0/24', False),
+    ('2001:db8:abcd::/64', True),
+    ('2001:db9::/64', False),
+])
+def test_prefix_keys_overlap(whitelist, prefix, expected):
+    assert (prefix in whitelist) is expected
+
+
+def test_broader_entry_covers_narrower():
+    wl = Whitelist(['10.1.0.0/16', '10.0.0.0/8'])
+    assert '10.200.0.1' in wl
+    assert set(wl) == {'10.1.0.0/16', '10.0.0.0/8'}
+
+
+def test_validate_entries():
+    assert validate_entries(['1.2.3.4/32', ' ', '1.2.3.4', '10.0.0.1/8']) == ['1.2.3.4', '10.0.0.0/8']
+    assert normalize('2001:db8::1/128') == '2001:db8::1'
+    with pytest.raises(ValueError):
+        validate_entries(['1.2.3.4', '300.1.1.1'])
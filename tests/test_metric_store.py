@@ -0,0 +1,29 @@
+import time
+
+import pytest
+
+import metric_store
+from metric_store import MetricStore, Tier
+
+
+@pytest.fixture
+def berlin_tz(monkeypatch):
+    monkeypatch.setenv('TZ', 'Europe/Berlin')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_daily_buckets_follow_dst(tmp_path, berlin_tz):
+    # 31/03/2024 Berlin chuyển từ +01:00 sang +02:00; store được mở trước mốc đổi giờ
+    path = str(tmp_path / 'history.tsdb')
+    store = MetricStore(path, tiers=(Tier(0, 16), Tier(86400, 8)))
+    day = 86400
+    noon_30 = time.mktime((2024, 3, 30, 12, 0, 0, 0, 0, -1))
+    for ts in (noon_30, noon_30 + day - 3600, noon_30 + 2 * day - 3600, noon_30 + 3 * day - 3600):
+        store.append(ts, {'established': 1})
+    store.close()
+    series = metric_store.query('established', noon_30 - day, noon_30 + 4 * day, path=path, tier='1d')
+    starts = [time.localtime(p[0]) for p in series.points]
+    assert [(t.tm_mday, t.tm_hour, t.tm_min) for t in starts] == [(30, 0, 0), (31, 0, 0), (1, 0, 0), (2, 0, 0)]
@@ -0,0 +1,36 @@
+import auto_block
+import ban_backend
+import detector_config
+import metrics
+
+
+def test_render_formats():
+    m = metrics.DetectorMetrics()
+    m.bans.inc(2)
+    m.collect.labels('netlink').observe(0.02)
+    text = m.registry.render()
+    assert 'firewall_bans_total 2' in text
+    assert 'firewall_collect_duration_seconds_bucket{source="netlink",le="0.025"} 1' in text
+    assert 'firewall_collect_duration_seconds_count{source="netlink"} 1' in text
+
+
+def test_time_to_detect_observed_on_ban(tmp_path, monkeypatch):
+    monkeypatch.setattr(ban_backend, '_restore', lambda cmd, script: None)
+    now = [1000.0]
+    settings = detector_config.DEFAULT_SETTINGS._replace(
+        metrics_listen='', state_file='', ipc_socket='', stats_ring='', history_file='',
+        whitelist=frozenset())
+    det = auto_block.DosDetector(settings=settings, backend=ban_backend.NftSetBackend(),
+                                 alert_file=str(tmp_path / 'alerts.jsonl'), clock=lambda: now[0])
+    det.scheduler.update(settings, settings.fast_enter_ratio, False)     # Bắt đầu nghi ngờ
+    now[0] += 4.0
+    det.block_ip('203.0.113.7', 'test')
+    det.commit_bans()
+    text = det.metrics.registry.render()
+    assert 'firewall_time_to_detect_seconds_bucket{le="2.0"} 0' in text
+    assert 'firewall_time_to_detect_seconds_bucket{le="5.0"} 1' in text
+    assert 'firewall_time_to_detect_seconds_sum 4.0' in text
+    # Lệnh chặn tiếp theo không thuộc đợt nghi ngờ nào -> không quan sát thêm
+    det.block_ip('203.0.113.8', 'test')
+    det.commit_bans()
+    assert 'firewall_time_to_detect_seconds_count 1' in det.metrics.registry.render()
@@ -0,0 +1,37 @@
+import socket
+from collections import defaultdict
+
+import netlink_diag
+from netlink_diag import NLMSG_HDR, SOCK_DIAG_BY_FAMILY, NLMSG_DONE, TCP_SYN_RECV, TCP_ESTABLISHED
+from sketch import SpaceSaving
+
+
+def make_msg(state, peer):
+    payload = bytearray(72)
+    payload[0] = socket.AF_INET
+    payload[1] = state
+    payload[24:28] = socket.inet_aton(peer)
+    return NLMSG_HDR.pack(16 + len(payload), SOCK_DIAG_BY_FAMILY, 2, 1, 0) + bytes(payload)
+
+
+def make_dump(sockets):
+    done = NLMSG_HDR.pack(20, NLMSG_DONE, 2, 1, 0) + b'\x00' * 4
+    return b''.join(make_msg(state, peer) for state, peer in sockets) + done
+
+
+def test_parse_dump_counts_states():
+    buf = make_dump([(TCP_SYN_RECV, '1.1.1.1'), (TCP_ESTABLISHED, '1.1.1.1'),
+                     (TCP_ESTABLISHED, '2.2.2.2')])
+    syn, conn = defaultdict(int), defaultdict(int)
+    assert netlink_diag.parse_dump(buf, syn, conn) == (3, 2, True)
+    assert dict(syn) == {socket.inet_aton('1.1.1.1'): 1}
+    assert conn[socket.inet_aton('2.2.2.2')] == 1
+
+
+def test_established_exact_with_sketch():
+    # Sketch 2 ứng viên cho 10 IP: tổng số đếm đảm bảo nhỏ hơn thật, số ESTABLISHED thì không
+    buf = make_dump([(TCP_ESTABLISHED, f'10.0.0.{i}') for i in range(10)])
+    syn, conn = SpaceSaving(2), SpaceSaving(2)
+    parsed, established, done = netlink_diag.parse_dump(buf, syn, conn)
+    assert (parsed, established, done) == (10, 10, True)
+    assert sum(conn.values()) < established
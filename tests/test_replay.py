@@ -0,0 +1,50 @@
+import pytest
+
+import replay
+
+
+FRAMES = [
+    (100.0, {'203.0.113.7': 50}, {'2001:db8:1:2::/64': 3}, {}),
+    (105.0, {}, {'198.51.100.0/24': 9}, {'2001:db8::1': 4}),
+]
+
+
+def write_frames(path, close=True):
+    writer = replay.CaptureWriter(str(path))
+    for frame in FRAMES:
+        writer.write(*frame)
+    if close:
+        writer.close()
+    return writer
+
+
+@pytest.mark.parametrize('name', ['cap.fwcap', 'cap.fwcap.gz'])
+def test_round_trip(tmp_path, name):
+    write_frames(tmp_path / name)
+    assert list(replay.read_capture(str(tmp_path / name))) == FRAMES
+
+
+def test_reads_unclosed_gzip_capture(tmp_path):
+    # Detector bị dừng đột ngột: file .gz không có phần kết thúc gzip
+    path = tmp_path / 'cap.fwcap.gz'
+    writer = write_frames(path, close=False)
+    try:
+        assert list(replay.read_capture(str(path))) == FRAMES
+    finally:
+        writer.close()
+
+
+@pytest.mark.parametrize('cut', [1, 3, 10])
+def test_truncated_last_frame_is_dropped(tmp_path, cut):
+    path = tmp_path / 'cap.fwcap'
+    write_frames(path)
+    data = path.read_bytes()
+    path.write_bytes(data[:-cut])       # Cắt giữa địa chỉ / độ dài tiền tố của mục cuối
+    assert list(replay.read_capture(str(path))) == FRAMES[:1]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'cap.fwcap'
+    path.write_bytes(b'not a capture')
+    with pytest.raises(ValueError):
+        list(replay.read_capture(str(path)))
@@ -0,0 +1,22 @@
+import os
+import stat
+
+import shm_ring
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_ring_file_is_private(tmp_path):
+    path = str(tmp_path / 'detector.ring')
+    shm_ring.RingWriter(path, capacity=4).close()
+    assert mode(path) == 0o600
+
+
+def test_reopened_ring_loses_wider_mode(tmp_path):
+    path = str(tmp_path / 'detector.ring')
+    shm_ring.RingWriter(path, capacity=4).close()
+    os.chmod(path, 0o644)       # File do bản cũ tạo
+    shm_ring.RingWriter(path, capacity=4).close()
+    assert mode(path) == 0o600
@@ -0,0 +1,29 @@
+import random
+from collections import defaultdict
+
+from sketch import SpaceSaving, capacity_for
+
+
+def test_error_bound_and_no_overcount():
+    epsilon = 0.01
+    rnd = random.Random(1)
+    stream = [int(rnd.paretovariate(1.2)) for _ in range(20000)]
+    exact = defaultdict(int)
+    ss = SpaceSaving(capacity_for(epsilon))
+    for ip in stream:
+        exact[ip] += 1
+        ss[ip] += 1
+    assert len(ss) <= ss.capacity
+    assert ss.total == len(stream)
+    for ip, count in ss.items():
+        assert count <= exact[ip]       # Số đếm đảm bảo không vượt số thật
+    for ip, count in ss.counts.items():
+        assert count - exact[ip] <= epsilon * len(stream)
+    top = max(exact, key=exact.get)
+    assert top in ss
+
+
+def test_capacity_for_memory_cap():
+    assert capacity_for(0.001) == 1000
+    assert capacity_for(0.001, SpaceSaving.BYTES_PER_ENTRY * 10) == 10
+    assert capacity_for(0.001, 1) == 1
@@ -0,0 +1,75 @@
+import struct
+import zlib
+
+import pytest
+
+import state_snapshot
+from state_snapshot import HEADER, CRC
+
+
+BANS = {
+    '203.0.113.7': (1000.0, 4600.0),
+    '198.51.100.0/24': (1100.0, None),         # vĩnh viễn
+    '2001:db8::/64': (1200.0, 4800.0),
+    '2001:db8::1': (1300.0, 4900.0),
+}
+OFFENDERS = {'203.0.113.7': (3, 1000.0), '2001:db8::/64': (1, 1200.0)}
+HISTORIES = {
+    'syn': [('203.0.113.7', [1, 2, 3], 0)],
+    'conn': [('198.51.100.0/24', [10, 20], 2)],
+    'udp': [('2001:db8::/64', [], 5)],
+}
+
+
+def encode():
+    return state_snapshot.encode(5000.0, 30, BANS, OFFENDERS, HISTORIES)
+
+
+def with_version(data, version):
+    """Đổi trường phiên bản trong header và tính lại CRC"""
+    body = bytearray(data[:-CRC.size])
+    magic, _, saved_at, window_size = HEADER.unpack_from(body)
+    HEADER.pack_into(body, 0, magic, version, saved_at, window_size)
+    return bytes(body) + CRC.pack(zlib.crc32(body))
+
+
+def test_round_trip():
+    snap = state_snapshot.decode(encode())
+    assert (snap.saved_at, snap.window_size) == (5000.0, 30)
+    assert snap.bans == BANS
+    assert snap.offenders == OFFENDERS
+    assert snap.histories == HISTORIES
+
+
+def test_save_load(tmp_path):
+    path = str(tmp_path / 'state' / 'snapshot.bin')
+    assert state_snapshot.load(path) is None
+    size = state_snapshot.save(path, 5000.0, 30, BANS, OFFENDERS, HISTORIES)
+    assert size == len(encode())
+    assert state_snapshot.load(path).bans == BANS
+
+
+def test_reads_v1():
+    # v1 chỉ có IP đơn, bố cục còn lại giống v2
+    bans = {ip: v for ip, v in BANS.items() if '/' not in ip}
+    data = with_version(state_snapshot.encode(5000.0, 30, bans, {}, {}), 1)
+    snap = state_snapshot.decode(data)
+    assert snap.bans == bans
+    assert snap.histories == {'syn': [], 'conn': [], 'udp': []}
+
+
+def test_skips_unknown_section():
+    data = encode()
+    body = data[:-CRC.size] + struct.pack('<4sI', b'XTRA', 3) + b'abc'
+    snap = state_snapshot.decode(body + CRC.pack(zlib.crc32(body)))
+    assert snap.bans == BANS
+
+
+@pytest.mark.parametrize('data, message', [
+    (encode()[:-1] + bytes((encode()[-1] ^ 1,)), 'CRC'),
+    (b'\x00' * 8, 'ngắn'),
+    (with_version(encode(), state_snapshot.VERSION + 1), 'mới hơn'),
+])
+def test_rejects_bad_data(data, message):
+    with pytest.raises(ValueError, match=message):
+        state_snapshot.decode(data)
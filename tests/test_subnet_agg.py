@@ -0,0 +1,26 @@
+import subnet_agg
+
+
+def test_aggregate_levels():
+    stats = {'203.0.113.1': 5, '203.0.113.2': 7, '203.0.114.9': 1, '2001:db8:1:2::/64': 4}
+    (c24, s24), (c16, s16) = subnet_agg.aggregate(stats, (24, 16), (48, 32))
+    assert dict(c24) == {'203.0.113.0/24': 12, '203.0.114.0/24': 1, '2001:db8:1::/48': 4}
+    assert s24['203.0.113.0/24'] == 2
+    assert dict(c16) == {'203.0.0.0/16': 13, '2001:db8::/32': 4}
+    assert s16['203.0.0.0/16'] == 3
+
+
+def test_prefix_only_widens():
+    # Khóa đã là dải chỉ được gộp lên dải rộng hơn nó
+    assert subnet_agg.prefix_key('2001:db8::/64', 0, 96) is None
+    assert subnet_agg.prefix_key('2001:db8::/64', 0, 48) == '2001:db8::/48'
+    assert subnet_agg.prefix_key('10.1.2.3', 24, 48) == '10.1.2.0/24'
+    assert subnet_agg.prefix_key('10.1.2.3', 0, 48) is None
+    assert subnet_agg.covering_prefixes('10.1.2.0/24', (24, 16), ()) == ['10.1.0.0/16']
+
+
+def test_within():
+    assert subnet_agg.within('10.1.2.3', '10.1.0.0/16')
+    assert not subnet_agg.within('10.1.0.0/16', '10.1.0.0/16')
+    assert not subnet_agg.within('::ffff:10.1.2.3', '10.1.0.0/16')
+    assert not subnet_agg.within('bad', '10.1.0.0/16')
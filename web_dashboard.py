@@ -11,14 +11,44 @@ import json
 import os
 from datetime import datetime
 
+import ban_backend
+import alert_journal
+import detector_config
+import ip_key
+import detector_ipc
+import metric_store
+
 app = Flask(__name__)
 app.secret_key = 'PBL3_SUPER_SECRET_KEY' # Dùng để mã hóa session đăng nhập
 
 # --- CẤU HÌNH PATH (Phải khớp với hệ thống của bạn) ---
-ALERT_FILE = '/var/log/firewall_alerts.json'
+ALERT_FILE = alert_journal.JOURNAL_FILE
 CONFIG_FILE = '/etc/firewall_auto_block.json'
 ADMIN_PASSWORD = 'quangnam92'  # Mật khẩu đăng nhập web
 
+# Dùng cùng backend chặn với auto_block (khóa 'ban_backend' trong config).
+# Tạo ở lần dùng đầu tiên: import module (vd. từ test) không được tạo set/chain trên firewall
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = ban_backend.load_configured_backend(CONFIG_FILE)
+    return _backend
+
+
+# Socket API của detector (khóa 'ipc_socket'): đọc trạng thái trực tiếp, không fork lệnh
+IPC_SOCKET = detector_ipc.configured_path(CONFIG_FILE)
+# 1 luồng mẫu dùng chung cho mọi trình duyệt đang mở dashboard (mở ở lần gọi API đầu tiên)
+LIVE_FEED = detector_ipc.LiveFeed(IPC_SOCKET, interval=2.0)
+
+# File lịch sử dài hạn của detector (khóa 'history_file')
+try:
+    HISTORY_FILE = detector_config.load_settings(CONFIG_FILE).history_file
+except (OSError, ValueError):
+    HISTORY_FILE = detector_config.DEFAULT_SETTINGS.history_file
+
 # --- DECORATOR KIỂM TRA ĐĂNG NHẬP ---
 def login_required(f):
     @wraps(f)
@@ -31,25 +61,26 @@ def login_required(f):
 class FirewallManager:
     @staticmethod
     def is_valid_ip(ip):
-        if not ip: return False
-        parts = ip.split('.')
-        if len(parts) != 4: return False
-        try:
-            return all(0 <= int(part) <= 255 for part in parts)
-        except ValueError: return False
+        """IPv4, IPv6 hoặc dải CIDR (backend chặn nhận cả dải)"""
+        return ip_key.is_valid(ip)
 
     @staticmethod
     def get_iptables_rules():
         try:
             result = subprocess.run(['iptables', '-L', 'INPUT', '-n', '--line-numbers'], capture_output=True, text=True)
-            return result.stdout
+            output = result.stdout
+            try:
+                result6 = subprocess.run(['ip6tables', '-L', 'INPUT', '-n', '--line-numbers'], capture_output=True, text=True)
+                output += "\n# IPv6\n" + result6.stdout
+            except OSError: pass
+            return output
         except Exception as e:
             return f"Error: {e}"
 
     @staticmethod
     def block_ip(ip):
         try:
-            subprocess.run(['iptables', '-I', 'INPUT', '1', '-s', ip, '-j', 'DROP'], check=True)
+            get_backend().add(ip)  # Chặn thủ công: không tự hết hạn
             return True, f"Đã chặn IP {ip}"
         except Exception as e:
             return False, str(e)
@@ -57,7 +88,7 @@ class FirewallManager:
     @staticmethod
     def unblock_ip(ip):
         try:
-            subprocess.run(['iptables', '-D', 'INPUT', '-s', ip, '-j', 'DROP'], check=True)
+            get_backend().remove(ip)
             return True, f"Đã gỡ chặn IP {ip}"
         except Exception as e:
             return False, str(e)
@@ -67,17 +98,15 @@ class FirewallManager:
         alerts = []
         blocked_count = 0
         try:
-            # Đếm số dòng DROP trong iptables
-            res = subprocess.run("iptables -L INPUT -n | grep DROP | wc -l", shell=True, capture_output=True, text=True)
-            blocked_count = int(res.stdout.strip())
-
-            # Đọc alerts
-            if os.path.exists(ALERT_FILE):
-                with open(ALERT_FILE, 'r') as f:
-                    alerts = json.load(f)
-                    if isinstance(alerts, list):
-                        alerts.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
-                        alerts = alerts[:20] # Lấy 20 cái mới nhất
+            # Số IP đang chặn: lấy từ detector nếu đang chạy, không thì đếm trong set chặn
+            try:
+                blocked_count = detector_ipc.query('snapshot', IPC_SOCKET, top=0)['snapshot']['banned']
+            except (OSError, ValueError, KeyError):
+                blocked_count = get_backend().count()
+
+            # Đọc 20 alerts mới nhất từ cuối nhật ký JSONL
+            alerts = alert_journal.read_alerts(20, ALERT_FILE)
+            alerts.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
         except: pass
         return blocked_count, alerts
 
@@ -297,15 +326,28 @@ def api_status():
     
     # Đọc trạng thái service
     service_status = "STOPPED"
-    try:
-        res = subprocess.run(['systemctl', 'is-active', 'firewall-auto-block'], capture_output=True, text=True)
-        service_status = res.stdout.strip().upper()
-    except: pass
+    sample = LIVE_FEED.start().get()
+    if sample is not None:
+        # Luồng mẫu của detector đang chạy -> không cần hỏi lại mỗi lần trình duyệt gọi
+        service_status = "ACTIVE"
+    else:
+        try:
+            # Detector trả lời qua socket IPC -> đang chạy (kể cả khi không chạy bằng systemd)
+            detector_ipc.query('ping', IPC_SOCKET)
+            service_status = "ACTIVE"
+        except (OSError, ValueError):
+            try:
+                res = subprocess.run(['systemctl', 'is-active', 'firewall-auto-block'], capture_output=True, text=True)
+                service_status = res.stdout.strip().upper()
+            except: pass
 
     return jsonify({
         'blocked_count': blocked_count,
         'alerts': alerts,
         'service_status': service_status,
+        # Số liệu mạng của chu kỳ gần nhất (null khi detector không chạy)
+        'established': sample['established'] if sample else None,
+        'traffic': sample['totals'] if sample else None,
         'updated_at': datetime.now().strftime("%H:%M:%S")
     })
 
@@ -348,12 +390,50 @@ def api_config():
     if request.method == 'POST':
         try:
             new_config = request.json
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(new_config, f, indent=4)
+            if not isinstance(new_config, dict):
+                return jsonify({'success': False, 'message': 'Dữ liệu cấu hình phải là object JSON'})
+            # Chỉ ghi đè các khóa được gửi lên; whitelist (IP/CIDR) được kiểm tra và chuẩn hóa
+            detector_config.save_updates(new_config, CONFIG_FILE)
             return jsonify({'success': True, 'message': 'Đã lưu cấu hình!'})
+        except ValueError as e:
+            return jsonify({'success': False, 'message': f'Cấu hình không hợp lệ: {e}'})
         except Exception as e:
             return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/live')
+@login_required
+def api_live():
+    """Trạng thái chu kỳ gần nhất của detector: top nguồn (số đếm + Z-Score), thời gian các bước"""
+    try:
+        top = int(request.args.get('top', 20))
+    except ValueError:
+        return jsonify({'error': "Tham số top phải là số nguyên"}), 400
+    if not 0 <= top <= detector_ipc.TOP_MAX:
+        return jsonify({'error': f"Tham số top phải trong khoảng 0..{detector_ipc.TOP_MAX}"}), 400
+    try:
+        return jsonify(detector_ipc.query('snapshot', IPC_SOCKET, top=top)['snapshot'])
+    except (OSError, ValueError) as e:
+        return jsonify({'error': f"Không kết nối được detector: {e}"}), 503
+
+@app.route('/api/history')
+@login_required
+def api_history():
+    """Lịch sử dài hạn: ?view=1h|24h|7d|30d|1y&metric=established,syn_total&points=500
+    -> mỗi số liệu là danh sách [timestamp, min, max, avg] (null = thiếu số liệu)"""
+    view = request.args.get('view', '1h')
+    names = [m for m in request.args.get('metric', '').split(',') if m] or ['established']
+    try:
+        points = min(max(int(request.args.get('points', 500)), 10), 5000)
+        series = {}
+        for name in names:
+            result = metric_store.query_view(view, name, HISTORY_FILE, max_points=points)
+            series[name] = [[None if v != v else v for v in p] for p in result.points]
+        return jsonify({'view': view, 'tier': result.tier, 'step': result.step, 'series': series})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except OSError as e:
+        return jsonify({'error': f"Chưa có dữ liệu lịch sử: {e}"}), 503
+
 @app.route('/api/rules')
 @login_required
 def api_rules():